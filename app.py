@@ -1,284 +1,3510 @@
-import spotipy
-from spotipy.oauth2 import SpotifyOAuth
+import argparse
 import time
+import asyncio
+import csv
+import functools
+import gzip
+import heapq
+import io
 import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter, OrderedDict, deque
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+import tempfile
+import unicodedata
+import zipfile
 from datetime import datetime
 
+CACHE_SCHEMA_VERSION = 6
+
+# Normalized track key -> path of the API track field it is built from
+TRACK_FIELDS = {
+    'uri': 'uri',
+    'name': 'name',
+    'artists': 'artists.name',
+    'artist_uris': 'artists.uri',
+    'album': 'album.name',
+    'release_date': 'album.release_date',
+    'duration_ms': 'duration_ms',
+    'popularity': 'popularity',
+    'external_urls': 'external_urls',
+    'isrc': 'external_ids.isrc'
+}
+
+
+# Audio features kept per track by the enrichment stage; each can be filtered as '<feature>_range'
+AUDIO_FEATURES = ('tempo', 'energy', 'danceability', 'valence', 'acousticness', 'instrumentalness', 'loudness')
+
+# Enrichment kind -> (multi-ID endpoint, IDs per call, key of the list in its response)
+ENRICHMENT_ENDPOINTS = {
+    'audio_features': ('audio-features', 100, 'audio_features'),
+    'artist_genres': ('artists', 50, 'artists')
+}
+
+
+def spotify_id(uri):
+    return uri.rsplit(':', 1)[-1] if uri else None
+
+
+def enrichment_ids(tracks, kind):
+    # Distinct Spotify IDs one enrichment kind needs for a table, local files excluded
+    uris = tracks.uris if kind == 'audio_features' else tracks.artist_uri_values
+    prefix = 'spotify:track:' if kind == 'audio_features' else 'spotify:artist:'
+    return list(dict.fromkeys(spotify_id(uri) for uri in uris if uri and uri.startswith(prefix)))
+
+
+def enrichment_fields(kinds):
+    # Track fields a table must hold before it can be enriched with `kinds`
+    return {'uri', 'artist_uris'} if 'artist_genres' in kinds else {'uri'}
+
+
+def parse_enrichment(kind, ids, items):
+    # A multi-ID response's items (in request order, null for unknown IDs) -> {id: value}.
+    # Unknown IDs map to None so they are cached as missing instead of being asked again.
+    values = {}
+    for item_id, item in zip(ids, items):
+        if item is None:
+            values[item_id] = None
+        elif kind == 'audio_features':
+            values[item_id] = {feature: item.get(feature) for feature in AUDIO_FEATURES}
+        else:
+            values[item_id] = item.get('genres') or []
+    return values
+
+
+def build_fields_filter(paths):
+    # Turn dotted paths into Spotify's fields syntax, e.g. "items(track(album(name),uri)),total"
+    tree = {}
+    for path in paths:
+        node = tree
+        for part in path.split('.'):
+            node = node.setdefault(part, {})
+    
+    def render(node):
+        return ','.join(
+            name + (f"({render(child)})" if child else '')
+            for name, child in sorted(node.items())
+        )
+    
+    return render(tree)
+
+
+def parse_year(release_date):
+    try:
+        return int(release_date[:4])
+    except (TypeError, ValueError):
+        return -1
+
+
+class StringPool:
+    # Interns repeated strings (artists, albums, dates) so each distinct value is stored once
+    def __init__(self):
+        self.values = []
+        self.ids = {}
+    
+    def intern(self, value):
+        if value is None:
+            return -1
+        
+        string_id = self.ids.get(value)
+        if string_id is None:
+            string_id = self.ids[value] = len(self.values)
+            self.values.append(value)
+        return string_id
+    
+    def get(self, string_id):
+        return self.values[string_id] if string_id >= 0 else None
+
+
+class TrackRow(Mapping):
+    # Lazy dict view of one TrackTable row, for callers that still want track dicts
+    __slots__ = ('table', 'index')
+    
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+    
+    def __getitem__(self, key):
+        if key not in TRACK_FIELDS:
+            raise KeyError(key)
+        return getattr(self.table, key)(self.index)
+    
+    def __iter__(self):
+        return iter(TRACK_FIELDS)
+    
+    def __len__(self):
+        return len(TRACK_FIELDS)
+    
+    def __repr__(self):
+        return f"TrackRow({dict(self)!r})"
+
+
+class TrackTable:
+    # Column-oriented playlist tracks: interned strings and int arrays instead of one dict per track.
+    # Missing numbers are stored as -1 and read back as None. enrichment holds per-ID audio
+    # features and artist genres fetched for this table (see ENRICHMENT_ENDPOINTS); it is keyed
+    # by Spotify ID, so tables taken from this one share it. gaps lists the playlist positions
+    # of unavailable items, which have no row, for a table holding a whole playlist.
+    def __init__(self, pools=None, enrichment=None):
+        self.artist_pool, self.album_pool, self.date_pool = pools or (StringPool(), StringPool(), StringPool())
+        self.enrichment = enrichment if enrichment is not None else {kind: {} for kind in ENRICHMENT_ENDPOINTS}
+        self.gaps = []
+        self.uris = []
+        self.names = []
+        self.urls = []
+        self.isrcs = []
+        self.artist_offsets = array('i', [0])
+        self.artist_ids = array('i')
+        self.artist_uri_values = []
+        self.album_ids = array('i')
+        self.date_ids = array('i')
+        self.years = array('h')
+        self.durations = array('i')
+        self.popularities = array('h')
+        self._index = None
+    
+    @classmethod
+    def from_tracks(cls, tracks):
+        table = cls()
+        for track in tracks:
+            table.append(track)
+        return table
+    
+    def append(self, track):
+        self.uris.append(track['uri'])
+        self.names.append(track.get('name'))
+        self.urls.append((track.get('external_urls') or {}).get('spotify'))
+        self.isrcs.append(track.get('isrc'))
+        
+        artists = track.get('artists') or []
+        for artist in artists:
+            self.artist_ids.append(self.artist_pool.intern(artist))
+        self.artist_offsets.append(len(self.artist_ids))
+        # Aligned with artist_ids; None where the artist URIs weren't fetched
+        artist_uris = track.get('artist_uris') or ()
+        self.artist_uri_values.extend(artist_uris[i] if i < len(artist_uris) else None for i in range(len(artists)))
+        
+        release_date = track.get('release_date')
+        self.album_ids.append(self.album_pool.intern(track.get('album')))
+        self.date_ids.append(self.date_pool.intern(release_date))
+        self.years.append(parse_year(release_date))
+        
+        duration_ms = track.get('duration_ms')
+        popularity = track.get('popularity')
+        self.durations.append(-1 if duration_ms is None else duration_ms)
+        self.popularities.append(-1 if popularity is None else popularity)
+    
+    def pools(self):
+        return (self.artist_pool, self.album_pool, self.date_pool)
+    
+    def take(self, indices):
+        # New table over the given rows; the string pools are shared, not copied
+        table = TrackTable(self.pools(), self.enrichment)
+        table.extend_rows(self, indices)
+        return table
+    
+    def extend_rows(self, source, indices):
+        # source must share this table's string pools
+        for i in indices:
+            self.uris.append(source.uris[i])
+            self.names.append(source.names[i])
+            self.urls.append(source.urls[i])
+            self.isrcs.append(source.isrcs[i])
+            self.artist_ids.extend(source.artist_ids[source.artist_offsets[i]:source.artist_offsets[i + 1]])
+            self.artist_uri_values.extend(source.artist_uri_values[source.artist_offsets[i]:source.artist_offsets[i + 1]])
+            self.artist_offsets.append(len(self.artist_ids))
+            self.album_ids.append(source.album_ids[i])
+            self.date_ids.append(source.date_ids[i])
+            self.years.append(source.years[i])
+            self.durations.append(source.durations[i])
+            self.popularities.append(source.popularities[i])
+    
+    def extend(self, source):
+        # Whole-table append, column by column
+        base = len(self.artist_ids)
+        self.uris.extend(source.uris)
+        self.names.extend(source.names)
+        self.urls.extend(source.urls)
+        self.isrcs.extend(source.isrcs)
+        self.artist_ids.extend(source.artist_ids)
+        self.artist_uri_values.extend(source.artist_uri_values)
+        self.artist_offsets.extend(base + o for o in source.artist_offsets[1:])
+        self.album_ids.extend(source.album_ids)
+        self.date_ids.extend(source.date_ids)
+        self.years.extend(source.years)
+        self.durations.extend(source.durations)
+        self.popularities.extend(source.popularities)
+    
+    def get_index(self):
+        # Built on first use and kept with the table, so repeated queries skip the scan
+        if self._index is None:
+            self._index = TrackIndex(self)
+        return self._index
+    
+    def __len__(self):
+        return len(self.uris)
+    
+    def __iter__(self):
+        return (TrackRow(self, i) for i in range(len(self.uris)))
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.take(range(*index.indices(len(self.uris))))
+        if index < 0:
+            index += len(self.uris)
+        if not 0 <= index < len(self.uris):
+            raise IndexError(index)
+        return TrackRow(self, index)
+    
+    def row_positions(self):
+        # Playlist position of each row, counting the unavailable items in gaps
+        positions = []
+        gaps = iter(self.gaps)
+        gap = next(gaps, None)
+        position = 0
+        for _ in range(len(self.uris)):
+            while position == gap:
+                position += 1
+                gap = next(gaps, None)
+            positions.append(position)
+            position += 1
+        return positions
+    
+    def artist_id_range(self, i):
+        return self.artist_ids[self.artist_offsets[i]:self.artist_offsets[i + 1]]
+    
+    # Per-column accessors, named after the normalized track keys
+    def uri(self, i):
+        return self.uris[i]
+    
+    def name(self, i):
+        return self.names[i]
+    
+    def artists(self, i):
+        return [self.artist_pool.values[a] for a in self.artist_id_range(i)]
+    
+    def artist_uris(self, i):
+        return self.artist_uri_values[self.artist_offsets[i]:self.artist_offsets[i + 1]]
+    
+    def album(self, i):
+        return self.album_pool.get(self.album_ids[i])
+    
+    def release_date(self, i):
+        return self.date_pool.get(self.date_ids[i])
+    
+    def duration_ms(self, i):
+        return self.durations[i] if self.durations[i] >= 0 else None
+    
+    def popularity(self, i):
+        return self.popularities[i] if self.popularities[i] >= 0 else None
+    
+    def external_urls(self, i):
+        return {'spotify': self.urls[i]} if self.urls[i] else {}
+    
+    def isrc(self, i):
+        return self.isrcs[i]
+
+
+def tokenize(text):
+    return re.findall(r"\w+", text.lower())
+
+
+class TrackIndex:
+    # Reusable lookup structures over one TrackTable, built lazily per field
+    def __init__(self, table):
+        self.table = table
+        self.lock = threading.Lock()
+        self._postings = {}
+        self._tokens = {}
+        self._lowered = {}
+        self._sorted = {}
+    
+    def pool(self, field):
+        return self.table.artist_pool if field == 'artist' else self.table.album_pool
+    
+    def lowered(self, field):
+        with self.lock:
+            if field not in self._lowered:
+                self._lowered[field] = [value.lower() for value in self.pool(field).values]
+            return self._lowered[field]
+    
+    def postings(self, field):
+        # String id -> rows that reference it
+        with self.lock:
+            if field not in self._postings:
+                postings = {}
+                if field == 'artist':
+                    for i in range(len(self.table)):
+                        for artist_id in self.table.artist_id_range(i):
+                            postings.setdefault(artist_id, []).append(i)
+                else:
+                    for i, album_id in enumerate(self.table.album_ids):
+                        postings.setdefault(album_id, []).append(i)
+                self._postings[field] = postings
+            return self._postings[field]
+    
+    def tokens(self, field):
+        # Lowercased word -> string ids whose value contains it
+        with self.lock:
+            if field not in self._tokens:
+                tokens = {}
+                for string_id, value in enumerate(self.pool(field).values):
+                    for token in tokenize(value):
+                        tokens.setdefault(token, set()).add(string_id)
+                self._tokens[field] = tokens
+            return self._tokens[field]
+    
+    def sorted_column(self, field):
+        # (sorted values, row order) for bisecting numeric ranges
+        with self.lock:
+            if field not in self._sorted:
+                column = NUMERIC_COLUMNS[field](self.table)
+                order = sorted(range(len(column)), key=column.__getitem__)
+                self._sorted[field] = ([column[i] for i in order], order)
+            return self._sorted[field]
+
+
+# Numeric query fields -> (column getter, multiplier from query units to stored units)
+NUMERIC_COLUMNS = {
+    'year': lambda table: table.years,
+    'duration': lambda table: table.durations,
+    'popularity': lambda table: table.popularities
+}
+NUMERIC_SCALE = {'year': 1, 'duration': 1000, 'popularity': 1}
+
+
+class Query:
+    # Base of the criteria tree. predicate() compiles to a row test for one table,
+    # select() answers from a TrackIndex without scanning every row.
+    def __and__(self, other):
+        return AllOf(self, other)
+    
+    def __or__(self, other):
+        return AnyOf(self, other)
+    
+    def __invert__(self):
+        return Not(self)
+    
+    def enrichments(self):
+        # Enrichment kinds the table must be filled with before this query can run
+        return set()
+    
+    def predicate(self, table):
+        raise NotImplementedError
+    
+    def select(self, index):
+        matches = self.predicate(index.table)
+        return {i for i in range(len(index.table)) if matches(i)}
+
+
+class TextMatch(Query):
+    # field: 'artist', 'album' or 'name'
+    # mode: 'contains' (case-insensitive substring), 'exact' (case-insensitive equality),
+    #       'token' (whole word) or 'regex' (case-insensitive re.search)
+    def __init__(self, field, pattern, mode='contains'):
+        if field not in ('artist', 'album', 'name'):
+            raise ValueError(f"Unknown text field: {field}")
+        if mode not in ('contains', 'exact', 'token', 'regex'):
+            raise ValueError(f"Unknown match mode: {mode}")
+        
+        self.field = field
+        self.pattern = pattern
+        self.mode = mode
+        self.needle = pattern.lower()
+        self.regex = re.compile(pattern, re.IGNORECASE) if mode == 'regex' else None
+    
+    def test(self, value):
+        if value is None:
+            return False
+        if self.mode == 'contains':
+            return self.needle in value.lower()
+        if self.mode == 'exact':
+            return value.lower() == self.needle
+        if self.mode == 'token':
+            return self.needle in tokenize(value)
+        return self.regex.search(value) is not None
+    
+    def string_ids(self, pool):
+        return {i for i, value in enumerate(pool.values) if self.test(value)}
+    
+    def predicate(self, table):
+        if self.field == 'name':
+            return lambda i: self.test(table.names[i])
+        
+        if self.field == 'artist':
+            ids = self.string_ids(table.artist_pool)
+            return lambda i: any(a in ids for a in table.artist_id_range(i))
+        
+        ids = self.string_ids(table.album_pool)
+        return lambda i: table.album_ids[i] in ids
+    
+    def select(self, index):
+        if self.field == 'name':
+            return super().select(index)
+        
+        if self.mode == 'token':
+            ids = index.tokens(self.field).get(self.needle, set())
+        elif self.mode in ('contains', 'exact'):
+            lowered = index.lowered(self.field)
+            if self.mode == 'contains':
+                ids = [i for i, value in enumerate(lowered) if self.needle in value]
+            else:
+                ids = [i for i, value in enumerate(lowered) if value == self.needle]
+        else:
+            ids = self.string_ids(index.pool(self.field))
+        
+        postings = index.postings(self.field)
+        rows = set()
+        for string_id in ids:
+            rows.update(postings.get(string_id, ()))
+        return rows
+
+
+class RangeMatch(Query):
+    # Inclusive range over 'year', 'duration' (seconds) or 'popularity'.
+    # keep_missing lets rows without a value through, as year_range always has.
+    def __init__(self, field, low, high, keep_missing=False):
+        if field not in NUMERIC_COLUMNS:
+            raise ValueError(f"Unknown range field: {field}")
+        
+        self.field = field
+        self.low = low * NUMERIC_SCALE[field]
+        self.high = high * NUMERIC_SCALE[field]
+        self.keep_missing = keep_missing
+    
+    def predicate(self, table):
+        column = NUMERIC_COLUMNS[self.field](table)
+        return lambda i: (
+            self.low <= column[i] <= self.high or (self.keep_missing and column[i] < 0)
+        )
+    
+    def select(self, index):
+        values, order = index.sorted_column(self.field)
+        rows = set(order[bisect_left(values, self.low):bisect_right(values, self.high)])
+        if self.keep_missing:
+            rows.update(order[:bisect_left(values, 0)])
+        return rows
+
+
+class FeatureRange(Query):
+    # Inclusive range over an audio feature (see AUDIO_FEATURES) of an enriched table.
+    # Tracks Spotify has no features for never match.
+    enrichment = 'audio_features'
+    
+    def __init__(self, feature, low, high):
+        if feature not in AUDIO_FEATURES:
+            raise ValueError(f"Unknown audio feature: {feature}")
+        
+        self.feature = feature
+        self.low = low
+        self.high = high
+    
+    def enrichments(self):
+        return {self.enrichment}
+    
+    def predicate(self, table):
+        features = table.enrichment[self.enrichment]
+        
+        def matches(i):
+            value = (features.get(spotify_id(table.uris[i])) or {}).get(self.feature)
+            return value is not None and self.low <= value <= self.high
+        return matches
+
+
+class GenreMatch(Query):
+    # Matches tracks where any artist has a genre matching the pattern (same modes as
+    # TextMatch) in an enriched table that has artist URIs
+    enrichment = 'artist_genres'
+    
+    def __init__(self, pattern, mode='contains'):
+        self.text = TextMatch('artist', pattern, mode)
+    
+    def enrichments(self):
+        return {self.enrichment}
+    
+    def predicate(self, table):
+        genres = table.enrichment[self.enrichment]
+        matching = {}
+        
+        def matches(i):
+            for uri in table.artist_uris(i):
+                if uri not in matching:
+                    matching[uri] = any(self.text.test(genre) for genre in genres.get(spotify_id(uri)) or ())
+                if matching[uri]:
+                    return True
+            return False
+        return matches
+
+
+class AllOf(Query):
+    def __init__(self, *queries):
+        self.queries = queries
+    
+    def enrichments(self):
+        return set().union(*(query.enrichments() for query in self.queries))
+    
+    def predicate(self, table):
+        predicates = [query.predicate(table) for query in self.queries]
+        return lambda i: all(p(i) for p in predicates)
+    
+    def select(self, index):
+        if not self.queries:
+            return set(range(len(index.table)))
+        
+        rows = None
+        for query in self.queries:
+            selected = query.select(index)
+            rows = selected if rows is None else rows & selected
+            if not rows:
+                break
+        return rows
+
+
+class AnyOf(Query):
+    def __init__(self, *queries):
+        self.queries = queries
+    
+    def enrichments(self):
+        return set().union(*(query.enrichments() for query in self.queries))
+    
+    def predicate(self, table):
+        predicates = [query.predicate(table) for query in self.queries]
+        return lambda i: any(p(i) for p in predicates)
+    
+    def select(self, index):
+        rows = set()
+        for query in self.queries:
+            rows |= query.select(index)
+        return rows
+
+
+class Not(Query):
+    def __init__(self, query):
+        self.query = query
+    
+    def enrichments(self):
+        return self.query.enrichments()
+    
+    def predicate(self, table):
+        matches = self.query.predicate(table)
+        return lambda i: not matches(i)
+    
+    def select(self, index):
+        return set(range(len(index.table))) - self.query.select(index)
+
+
+def compile_criteria(query=None, **criteria):
+    # Map search_tracks_by_criteria keyword criteria onto a single AND query
+    queries = [query] if query is not None else []
+    
+    if 'artist_name' in criteria:
+        queries.append(TextMatch('artist', criteria['artist_name']))
+    if 'album_name' in criteria:
+        queries.append(TextMatch('album', criteria['album_name']))
+    if 'track_name' in criteria:
+        queries.append(TextMatch('name', criteria['track_name']))
+    if 'year_range' in criteria:
+        queries.append(RangeMatch('year', *criteria['year_range'], keep_missing=True))
+    if 'duration_range' in criteria:
+        queries.append(RangeMatch('duration', *criteria['duration_range']))
+    if 'popularity_range' in criteria:
+        queries.append(RangeMatch('popularity', *criteria['popularity_range']))
+    for feature in AUDIO_FEATURES:
+        if f"{feature}_range" in criteria:
+            queries.append(FeatureRange(feature, *criteria[f"{feature}_range"]))
+    if 'genre' in criteria:
+        queries.append(GenreMatch(criteria['genre']))
+    
+    return AllOf(*queries)
+
+
+class PlaylistConsumer:
+    # One stage of a fused pipeline: start() gets the playlist metadata, consume() sees
+    # each page of tracks once (offset is the playlist position of its first row),
+    # result() is collected after the last page.
+    name = None
+    fields = ()
+    
+    def start(self, playlist_info):
+        pass
+    
+    def consume(self, tracks, offset):
+        raise NotImplementedError
+    
+    def result(self):
+        raise NotImplementedError
+    
+    def abort(self):
+        # Called instead of result() when the scan fails part way through
+        pass
+
+
+class PlaylistStats:
+    # Running aggregates behind get_playlist_stats. They are keyed by the strings themselves
+    # rather than pool ids, so deltas from any table (or a reload from the cache) line up.
+    fields = ('artists', 'album', 'release_date', 'duration_ms')
+    
+    def __init__(self):
+        self.total_tracks = 0
+        self.total_duration = 0
+        self.artists = Counter()
+        self.albums = Counter()
+        self.years = Counter()
+    
+    def add(self, tracks, rows=None):
+        self._apply(tracks, rows, 1)
+    
+    def remove(self, tracks, rows=None):
+        self._apply(tracks, rows, -1)
+    
+    def _apply(self, tracks, rows, sign):
+        # rows=None takes the whole table column by column; otherwise only the given rows
+        if rows is None:
+            count = len(tracks)
+            artist_ids = tracks.artist_ids
+            album_ids = tracks.album_ids
+            years = tracks.years
+            durations = tracks.durations
+        else:
+            count = len(rows)
+            artist_ids = [a for i in rows for a in tracks.artist_id_range(i)]
+            album_ids = [tracks.album_ids[i] for i in rows]
+            years = [tracks.years[i] for i in rows]
+            durations = [tracks.durations[i] for i in rows]
+        
+        self.total_tracks += sign * count
+        self.total_duration += sign * sum(d for d in durations if d >= 0)
+        
+        # Count per interned id first, so each distinct string is looked up once
+        for counter, pool, ids in ((self.artists, tracks.artist_pool, artist_ids),
+                                   (self.albums, tracks.album_pool, album_ids)):
+            self._merge(counter, ((pool.values[i], n) for i, n in Counter(ids).items() if i >= 0), sign)
+        self._merge(self.years, ((y, n) for y, n in Counter(years).items() if y >= 0), sign)
+    
+    @staticmethod
+    def _merge(counter, counts, sign):
+        for key, n in counts:
+            total = counter[key] + sign * n
+            if total > 0:
+                counter[key] = total
+            else:
+                del counter[key]
+    
+    def top(self, counter, k=10):
+        # most_common(k) selects with a bounded heap rather than sorting every key
+        return counter.most_common(k)
+    
+    def result(self, k=10):
+        if not self.total_tracks:
+            return {}
+        
+        return {
+            'total_tracks': self.total_tracks,
+            'total_duration_hours': self.total_duration / (1000 * 60 * 60),
+            'top_artists': self.top(self.artists, k),
+            'top_albums': self.top(self.albums, k),
+            'year_distribution': [(f"{y:04d}", count) for y, count in heapq.nlargest(k, self.years.items())]
+        }
+    
+    def to_json(self):
+        return json.dumps({
+            'total_tracks': self.total_tracks,
+            'total_duration': self.total_duration,
+            'artists': self.artists,
+            'albums': self.albums,
+            'years': self.years
+        })
+    
+    @classmethod
+    def from_json(cls, text):
+        data = json.loads(text)
+        stats = cls()
+        stats.total_tracks = data['total_tracks']
+        stats.total_duration = data['total_duration']
+        stats.artists = Counter(data['artists'])
+        stats.albums = Counter(data['albums'])
+        stats.years = Counter({int(y): n for y, n in data['years'].items()})
+        return stats
+
+
+class StatsConsumer(PlaylistConsumer):
+    name = 'stats'
+    fields = PlaylistStats.fields
+    
+    def __init__(self):
+        self.snapshot_id = None
+        self.stats = PlaylistStats()
+    
+    def start(self, playlist_info):
+        self.snapshot_id = playlist_info['snapshot_id']
+    
+    def consume(self, tracks, offset):
+        self.stats.add(tracks)
+    
+    def result(self):
+        return self.stats.result()
+
+
+class DuplicateConsumer(PlaylistConsumer):
+    # Flags every repeat of a (track name, first artist) pair after its first occurrence
+    name = 'duplicates'
+    fields = ('uri', 'name', 'artists')
+    
+    def __init__(self):
+        self.seen = set()
+        self.duplicates = None
+        self.positions = []
+    
+    def consume(self, tracks, offset):
+        if self.duplicates is None:
+            self.duplicates = tracks.take([])
+        
+        rows = []
+        for i in range(len(tracks)):
+            first_artist = tracks.artist_id_range(i)[:1]
+            key = (tracks.names[i].lower(), tracks.artist_pool.values[first_artist[0]].lower() if first_artist else '')
+            if key in self.seen:
+                rows.append(i)
+                self.positions.append(offset + i)
+            else:
+                self.seen.add(key)
+        
+        self.duplicates.extend_rows(tracks, rows)
+    
+    def result(self):
+        return self.duplicates if self.duplicates is not None else TrackTable()
+
+
+class FilterConsumer(PlaylistConsumer):
+    # Streams a compiled query over each page; takes the same arguments as compile_criteria
+    name = 'matches'
+    fields = ('uri', 'name', 'artists', 'album', 'release_date', 'duration_ms', 'popularity')
+    
+    def __init__(self, query=None, name=None, **criteria):
+        self.query = compile_criteria(query, **criteria)
+        if self.query.enrichments():
+            raise ValueError("Audio feature and genre criteria need a whole enriched playlist; use search_tracks_by_criteria")
+        self.name = name or self.name
+        self.matches = None
+        self.positions = []
+    
+    def consume(self, tracks, offset):
+        if self.matches is None:
+            self.matches = tracks.take([])
+        
+        matches = self.query.predicate(tracks)
+        rows = [
+            i for i in range(len(tracks))
+            if tracks.artist_offsets[i + 1] > tracks.artist_offsets[i] and matches(i)
+        ]
+        self.positions.extend(offset + i for i in rows)
+        self.matches.extend_rows(tracks, rows)
+    
+    def result(self):
+        return self.matches if self.matches is not None else TrackTable()
+
+
+class ExportConsumer(PlaylistConsumer):
+    # Writes each page as it arrives. 'json' keeps the original export layout (streamed as a
+    # chunked array), 'jsonl' writes one track per line and 'csv' one row per track.
+    name = 'export'
+    fields = ('name', 'artists', 'album', 'release_date', 'duration_ms', 'uri', 'external_urls')
+    
+    def __init__(self, filename=None, format='json', compression=None):
+        if format not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format: {format}")
+        if compression not in EXPORT_COMPRESSIONS:
+            raise ValueError(f"Unknown compression: {compression}")
+        
+        self.filename = filename
+        self.format = format
+        self.compression = compression
+        self.file = None
+        self.writer = None
+        self.total_tracks = 0
+    
+    def start(self, playlist_info):
+        if not self.filename:
+            extension = EXPORT_FORMATS[self.format] + EXPORT_COMPRESSIONS[self.compression]
+            self.filename = f"{safe_filename(playlist_info['name'])}_export{extension}"
+        
+        self.file = open_export_file(self.filename, self.compression, newline='' if self.format == 'csv' else None)
+        
+        if self.format == 'json':
+            self.file.write('{\n')
+            for key, value in (
+                ('playlist_name', playlist_info['name']),
+                ('description', playlist_info['description']),
+                ('export_date', datetime.now().isoformat())
+            ):
+                self.file.write(f"  {json.dumps(key)}: {json.dumps(value, ensure_ascii=False)},\n")
+            self.file.write('  "tracks": [')
+        elif self.format == 'csv':
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(CSV_COLUMNS)
+    
+    def consume(self, tracks, offset):
+        for track in tracks:
+            record = {
+                'name': track['name'],
+                'artists': track['artists'],
+                'album': track['album'],
+                'release_date': track['release_date'],
+                'duration_ms': track['duration_ms'],
+                'uri': track['uri'],
+                'external_urls': track['external_urls']
+            }
+            
+            if self.format == 'json':
+                # Same layout json.dump(indent=2) gives an element nested two levels deep
+                body = json.dumps(record, indent=2, ensure_ascii=False).replace('\n', '\n    ')
+                self.file.write((',\n    ' if self.total_tracks else '\n    ') + body)
+            elif self.format == 'jsonl':
+                self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+            else:
+                self.writer.writerow([
+                    record['name'],
+                    '; '.join(record['artists']),
+                    record['album'],
+                    record['release_date'],
+                    record['duration_ms'],
+                    record['uri'],
+                    record['external_urls'].get('spotify', '')
+                ])
+            
+            self.total_tracks += 1
+    
+    def result(self):
+        if self.format == 'json':
+            self.file.write('\n  ],\n' if self.total_tracks else '],\n')
+            self.file.write(f'  "total_tracks": {self.total_tracks}\n}}')
+        
+        self.file.close()
+        return self.filename
+    
+    def abort(self):
+        if self.file:
+            self.file.close()
+
+
+EXPORT_FORMATS = {'json': '.json', 'jsonl': '.jsonl', 'csv': '.csv'}
+EXPORT_COMPRESSIONS = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+CSV_COLUMNS = ['name', 'artists', 'album', 'release_date', 'duration_ms', 'uri', 'spotify_url']
+
+
+def safe_filename(name):
+    return "".join(c for c in name if c.isalnum() or c in (' ', '-', '_')).rstrip()
+
+
+def open_export_file(filename, compression=None, newline=None, mode='w'):
+    # Text stream for writing (mode='w') or reading back (mode='r') an export
+    if compression not in EXPORT_COMPRESSIONS:
+        raise ValueError(f"Unknown compression: {compression}")
+    
+    if compression is None:
+        return open(filename, mode, encoding='utf-8', newline=newline)
+    if compression == 'gzip':
+        return gzip.open(filename, mode + 't', encoding='utf-8', newline=newline)
+    
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError("zstd compression needs the 'zstandard' package (pip install zstandard)")
+    
+    if mode == 'r':
+        stream = zstandard.ZstdDecompressor().stream_reader(open(filename, 'rb'))
+    else:
+        stream = zstandard.ZstdCompressor().stream_writer(open(filename, 'wb'))
+    return io.TextIOWrapper(stream, encoding='utf-8', newline=newline)
+
+
+def detect_export_format(filename):
+    # (format, compression) from an export's extensions, e.g. 'mix_export.jsonl.gz'
+    stem, extension = os.path.splitext(filename)
+    compression = next((c for c, ext in EXPORT_COMPRESSIONS.items() if c and ext == extension), None)
+    if compression:
+        stem, extension = os.path.splitext(stem)
+    
+    format = next((f for f, ext in EXPORT_FORMATS.items() if ext == extension), None)
+    if format is None:
+        raise ValueError(f"Not an export file: {filename}")
+    return format, compression
+
+
+def read_export_file(filename):
+    # (playlist_name, description, uris) for a file written by export_playlist. jsonl and csv
+    # exports are streamed line by line; a json export is parsed whole. Only json exports carry
+    # the playlist's name and description, so the others fall back to the file name.
+    format, compression = detect_export_format(filename)
+    name = os.path.basename(filename).split('.')[0]
+    if name.endswith('_export'):
+        name = name[:-len('_export')]
+    
+    if format == 'json':
+        with open_export_file(filename, compression, mode='r') as f:
+            data = json.load(f)
+        return data.get('playlist_name') or name, data.get('description'), (t['uri'] for t in data['tracks'])
+    
+    def iter_uris():
+        with open_export_file(filename, compression, newline='' if format == 'csv' else None, mode='r') as f:
+            if format == 'csv':
+                for row in csv.DictReader(f):
+                    yield row['uri']
+            else:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)['uri']
+    
+    return name, None, iter_uris()
+
+
+# Version tags that don't make a different song: "(Remastered 2011)", "- Live", "feat. X"
+TITLE_TAG_PATTERN = re.compile(
+    r"\s*[\(\[][^\)\]]*\b(?:remaster(?:ed)?|live|feat\.?|ft\.|featuring|with)\b[^\)\]]*[\)\]]",
+    re.IGNORECASE
+)
+TITLE_SUFFIX_PATTERN = re.compile(r"\s+-\s+[^-]*\b(?:remaster(?:ed)?|live)\b.*$", re.IGNORECASE)
+TITLE_FEAT_PATTERN = re.compile(r"\s+(?:feat\.?|ft\.|featuring)\s.*$", re.IGNORECASE)
+
+
+def fold_text(text):
+    # Casefold, drop accents and collapse punctuation/whitespace
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(re.findall(r"\w+", text.casefold()))
+
+
+def normalize_title(title):
+    stripped = TITLE_TAG_PATTERN.sub('', title)
+    stripped = TITLE_SUFFIX_PATTERN.sub('', stripped)
+    stripped = TITLE_FEAT_PATTERN.sub('', stripped)
+    return fold_text(stripped) or fold_text(title)
+
+
+def cluster_duplicates(tables):
+    # tables is a list of (playlist_id, TrackTable). Tracks are blocked by URI, ISRC and
+    # (normalized title, normalized artist) hashes; any shared block joins two tracks in a
+    # union-find, so the work is linear in tracks rather than pairwise.
+    entries = []
+    parent = []
+    titles = {}
+    folded = {}
+    
+    # One first-seen map per block kind: URI, ISRC, (title, artist)
+    by_uri = {}
+    by_isrc = {}
+    by_title = {}
+    
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+    
+    def join(entry, block, key):
+        other = block.setdefault(key, entry)
+        if other != entry:
+            root, other_root = find(entry), find(other)
+            if root != other_root:
+                parent[max(root, other_root)] = min(root, other_root)
+    
+    for table_index, (playlist_id, tracks) in enumerate(tables):
+        artists = {}
+        
+        for i in range(len(tracks)):
+            entry = len(entries)
+            entries.append((table_index, i))
+            parent.append(entry)
+            
+            join(entry, by_uri, tracks.uris[i])
+            if tracks.isrcs[i]:
+                join(entry, by_isrc, tracks.isrcs[i].upper())
+            
+            name = tracks.names[i]
+            if name:
+                title = titles.get(name)
+                if title is None:
+                    title = titles[name] = normalize_title(name)
+                
+                for artist_id in tracks.artist_id_range(i):
+                    artist = artists.get(artist_id)
+                    if artist is None:
+                        value = tracks.artist_pool.values[artist_id]
+                        artist = folded.get(value)
+                        if artist is None:
+                            artist = folded[value] = fold_text(value)
+                        artists[artist_id] = artist
+                    join(entry, by_title, (title, artist))
+    
+    groups = {}
+    for entry in range(len(entries)):
+        groups.setdefault(find(entry), []).append(entry)
+    
+    clusters = []
+    for members in groups.values():
+        if len(members) < 2:
+            continue
+        
+        cluster = []
+        for entry in members:
+            table_index, i = entries[entry]
+            playlist_id, tracks = tables[table_index]
+            cluster.append({
+                'playlist_id': playlist_id,
+                'position': i,
+                'uri': tracks.uris[i],
+                'name': tracks.names[i],
+                'artists': tracks.artists(i),
+                'isrc': tracks.isrcs[i]
+            })
+        clusters.append(cluster)
+    
+    clusters.sort(key=len, reverse=True)
+    return clusters
+
+
+# Spotify rejects positional edits made against a stale snapshot with one of these, or with a
+# 400 whose message names the snapshot or the tracks a positional remove no longer finds
+CONFLICT_STATUSES = (409, 412)
+CONFLICT_MESSAGES = ('snapshot', 'could not remove tracks')
+
+
+def is_edit_conflict(e):
+    if e.http_status in CONFLICT_STATUSES:
+        return True
+    message = str(e.msg).lower()
+    return e.http_status == 400 and any(text in message for text in CONFLICT_MESSAGES)
+
+
+def match_stable_pairs(current, desired):
+    # Longest common subsequence of two URI lists as {current position: desired index}, via
+    # Hunt-Szymanski: an increasing-subsequence search over the matching (position, index)
+    # pairs, so repeated URIs pick whichever occurrences keep the most items in place.
+    # A shared prefix and suffix are always part of one, so only the middle is searched.
+    limit = min(len(current), len(desired))
+    head = 0
+    while head < limit and current[head] == desired[head]:
+        head += 1
+    tail = 0
+    while tail < limit - head and current[-1 - tail] == desired[-1 - tail]:
+        tail += 1
+    
+    pairs = {i: i for i in range(head)}
+    offset = len(desired) - len(current)
+    pairs.update((i, i + offset) for i in range(len(current) - tail, len(current)))
+    
+    occurrences = {}
+    for target in range(head, len(desired) - tail):
+        occurrences.setdefault(desired[target], []).append(target)
+    
+    tails = []
+    tail_pairs = []
+    previous = {}
+    
+    for position in range(head, len(current) - tail):
+        # Descending targets, so one position can't extend its own run
+        for target in reversed(occurrences.get(current[position], ())):
+            k = bisect_left(tails, target)
+            if k == len(tails):
+                tails.append(target)
+                tail_pairs.append((position, target))
+            else:
+                tails[k] = target
+                tail_pairs[k] = (position, target)
+            previous[(position, target)] = tail_pairs[k - 1] if k else None
+    
+    pair = tail_pairs[-1] if tail_pairs else None
+    while pair is not None:
+        pairs[pair[0]] = pair[1]
+        pair = previous[pair]
+    return pairs
+
+
+def plan_playlist_changes(current, desired, batch_size=100):
+    # Smallest set of positional edits turning the `current` URI list into `desired`.
+    # Items on the longest common subsequence stay put. Ops run in order: removes (highest
+    # positions first, so earlier batches never shift later ones), then range reorders for
+    # items that must move, then adds of contiguous missing runs at their final positions.
+    # Heavy shuffles can take fewer calls as remove + re-add than as one reorder per item,
+    # so both are planned and the cheaper one wins (reorders on a tie, as they keep added_at).
+    stable_pairs = match_stable_pairs(current, desired)
+    moved = _plan_changes(current, desired, stable_pairs, batch_size, True)
+    readded = _plan_changes(current, desired, stable_pairs, batch_size, False)
+    return readded if len(readded) < len(moved) else moved
+
+
+def _plan_changes(current, desired, stable_pairs, batch_size, move):
+    stable = set(stable_pairs.values())
+    
+    # Off-sequence items whose URI is still wanted elsewhere can be moved rather than re-added
+    spare = {}
+    if move:
+        for target, uri in enumerate(desired):
+            if target not in stable:
+                spare.setdefault(uri, deque()).append(target)
+    
+    targets = []
+    for position, uri in enumerate(current):
+        if position in stable_pairs:
+            targets.append(stable_pairs[position])
+        else:
+            queue = spare.get(uri)
+            targets.append(queue.popleft() if queue else -1)
+    
+    ops = []
+    
+    batch = {}
+    for position in range(len(current) - 1, -1, -1):
+        if targets[position] >= 0:
+            continue
+        uri = current[position]
+        if uri not in batch and len(batch) == batch_size:
+            ops.append({'op': 'remove', 'items': [{'uri': u, 'positions': p} for u, p in batch.items()]})
+            batch = {}
+        batch.setdefault(uri, []).append(position)
+    if batch:
+        ops.append({'op': 'remove', 'items': [{'uri': u, 'positions': p} for u, p in batch.items()]})
+    
+    seq = [target for target in targets if target >= 0]
+    placed = sorted(stable)
+    movers = sorted(target for target in seq if target not in stable)
+    
+    # Place movers in target order right after their closest placed predecessor, moving
+    # runs that are already adjacent and consecutive in one call
+    i = 0
+    while i < len(movers):
+        start = seq.index(movers[i])
+        length = 1
+        while (i + length < len(movers) and start + length < len(seq)
+               and movers[i + length] == movers[i] + length and seq[start + length] == movers[i] + length):
+            length += 1
+        
+        k = bisect_left(placed, movers[i])
+        insert_before = seq.index(placed[k - 1]) + 1 if k else 0
+        
+        block = seq[start:start + length]
+        if insert_before not in (start, start + length):
+            ops.append({'op': 'reorder', 'range_start': start, 'insert_before': insert_before, 'range_length': length})
+            del seq[start:start + length]
+            position = insert_before - length if insert_before > start else insert_before
+            seq[position:position] = block
+        
+        for target in block:
+            insort(placed, target)
+        i += length
+    
+    present = set(seq)
+    missing = [target for target in range(len(desired)) if target not in present]
+    run = []
+    for target in missing:
+        if run and (target != run[-1] + 1 or len(run) == batch_size):
+            ops.append({'op': 'add', 'position': run[0], 'uris': [desired[t] for t in run]})
+            run = []
+        run.append(target)
+    if run:
+        ops.append({'op': 'add', 'position': run[0], 'uris': [desired[t] for t in run]})
+    
+    return ops
+
+
+def replay_plan(length, ops):
+    # Where each track ends up once `ops` are applied to a playlist of `length` items, with
+    # Spotify's semantics: entry i is the old position of the track now at i, or None where one
+    # was added
+    slots = list(range(length))
+    for op in ops:
+        if op['op'] == 'remove':
+            removed = {p for item in op['items'] for p in item['positions']}
+            slots = [slot for i, slot in enumerate(slots) if i not in removed]
+        elif op['op'] == 'reorder':
+            start, length, insert_before = op['range_start'], op['range_length'], op['insert_before']
+            block = slots[start:start + length]
+            del slots[start:start + length]
+            position = insert_before - length if insert_before > start else insert_before
+            slots[position:position] = block
+        else:
+            slots[op['position']:op['position']] = [None] * len(op['uris'])
+    return slots
+
+
+def spread_plan(ops, length, gaps):
+    # Translate a plan made over a playlist's `length` available tracks into positions of the
+    # whole playlist, whose unavailable items sit at `gaps` (see TrackTable.gaps). Those are
+    # never removed; they only shift with the edits around them, or travel inside a moved
+    # range. Returns (ops, the gaps afterwards).
+    if not gaps:
+        return ops, []
+    
+    items = [False] * (length + len(gaps))
+    for gap in gaps:
+        items[gap] = True
+    
+    spread = []
+    for op in ops:
+        rows = [i for i, gap in enumerate(items) if not gap]
+        if op['op'] == 'remove':
+            spread.append({'op': 'remove', 'items': [
+                {'uri': item['uri'], 'positions': [rows[p] for p in item['positions']]} for item in op['items']
+            ]})
+            removed = {rows[p] for item in op['items'] for p in item['positions']}
+            items = [gap for i, gap in enumerate(items) if i not in removed]
+        elif op['op'] == 'reorder':
+            start = rows[op['range_start']]
+            end = rows[op['range_start'] + op['range_length'] - 1] + 1
+            insert_before = rows[op['insert_before']] if op['insert_before'] < len(rows) else len(items)
+            spread.append({'op': 'reorder', 'range_start': start, 'insert_before': insert_before,
+                           'range_length': end - start})
+            block = items[start:end]
+            del items[start:end]
+            position = insert_before - len(block) if insert_before > start else insert_before
+            items[position:position] = block
+        else:
+            position = rows[op['position']] if op['position'] < len(rows) else len(items)
+            spread.append({'op': 'add', 'position': position, 'uris': op['uris']})
+            items[position:position] = [False] * len(op['uris'])
+    
+    return spread, [i for i, gap in enumerate(items) if gap]
+
+
+def summarize_plan(ops):
+    return {
+        'removed': sum(len(item['positions']) for op in ops if op['op'] == 'remove' for item in op['items']),
+        'moved': sum(op['range_length'] for op in ops if op['op'] == 'reorder'),
+        'added': sum(len(op['uris']) for op in ops if op['op'] == 'add'),
+        'calls': len(ops)
+    }
+
+
+def diff_uris(source, target):
+    # Multiset difference of two URI lists through hashed counts, so repeats are compared too.
+    # Each side's extra URIs are listed in the order they appear there.
+    source_counts = Counter(source)
+    target_counts = Counter(target)
+    
+    def extra(uris, counts):
+        remaining = dict(counts)
+        listed = []
+        for uri in uris:
+            if remaining.get(uri):
+                remaining[uri] -= 1
+                listed.append(uri)
+        return listed
+    
+    return {
+        'only_in_source': extra(source, source_counts - target_counts),
+        'only_in_target': extra(target, target_counts - source_counts),
+        'common': sum((source_counts & target_counts).values())
+    }
+
+
+def synced_uris(source):
+    # What a one-way sync leaves in the target: source's URIs minus local files, which the API can't add
+    return [uri for uri in source if not uri.startswith('spotify:local:')]
+
+
+def merged_uris(target, sources, dedupe=True):
+    # Union merge: target's URIs in order (only first occurrences with dedupe), then each
+    # source URI it doesn't hold yet, in source order. Local files can't be added and are skipped.
+    uris = list(dict.fromkeys(target)) if dedupe else list(target)
+    seen = set(uris)
+    for source in sources:
+        for uri in source:
+            if uri not in seen and not uri.startswith('spotify:local:'):
+                seen.add(uri)
+                uris.append(uri)
+    return uris
+
+
+def keep_first_occurrences(tracks):
+    duplicates = DuplicateConsumer()
+    duplicates.consume(tracks, 0)
+    positions = set(duplicates.positions)
+    return [uri for i, uri in enumerate(tracks.uris) if i not in positions]
+
+
+def apply_plan_to_stats(stats, tracks, ops, added_from=None):
+    # Carry running stats across an applied plan: removed positions are looked up in `tracks`
+    # (the contents the plan was made from) and added URIs in added_from (default `tracks`,
+    # e.g. the new contents), reorders change nothing. Returns False if an added URI has no
+    # row there to count.
+    removed = [p for op in ops if op['op'] == 'remove' for item in op['items'] for p in item['positions']]
+    added = [uri for op in ops if op['op'] == 'add' for uri in op['uris']]
+    added_from = tracks if added_from is None else added_from
+    
+    rows = {}
+    if added:
+        wanted = set(added)
+        for i, uri in enumerate(added_from.uris):
+            if uri in wanted:
+                rows.setdefault(uri, i)
+        if len(rows) < len(wanted):
+            return False
+    
+    stats.remove(tracks, removed)
+    stats.add(added_from, [rows[uri] for uri in added])
+    return True
+
+
+def rebuild_table(tracks, uris, donors=()):
+    # Table for the new contents from rows we already hold, or None if any URI is new to us.
+    # URIs that aren't in `tracks` are copied from the first donor table holding them (the
+    # donors must hold every field `tracks` does); their strings join tracks' pools.
+    rows = {}
+    for i, uri in enumerate(tracks.uris):
+        rows.setdefault(uri, deque()).append(i)
+    
+    borrowed = {}
+    for donor in donors:
+        for i, uri in enumerate(donor.uris):
+            if uri not in rows:
+                borrowed.setdefault(uri, (donor, i))
+    if any(uri not in rows and uri not in borrowed for uri in uris):
+        return None
+    
+    # Repeated URIs take their rows in order; the last row is reused if a URI gained copies
+    table = TrackTable(tracks.pools(), tracks.enrichment)
+    for uri in uris:
+        if uri in borrowed:
+            donor, i = borrowed[uri]
+            table.append(dict(TrackRow(donor, i)))
+        else:
+            queue = rows[uri]
+            table.extend_rows(tracks, [queue.popleft() if len(queue) > 1 else queue[0]])
+    return table
+
+
+class TrackCache:
+    # On-disk store of normalized playlist tracks, keyed by the playlist's snapshot_id, and of
+    # per-ID enrichment shared across playlists. Enrichment entries expire after
+    # enrichment_max_age seconds; past enrichment_max_entries the least recently used go.
+    def __init__(self, path=".playlist_cache.sqlite", enrichment_max_entries=500000,
+                 enrichment_max_age=30 * 24 * 60 * 60):
+        self.path = path
+        self.enrichment_max_entries = enrichment_max_entries
+        self.enrichment_max_age = enrichment_max_age
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != CACHE_SCHEMA_VERSION:
+            self.conn.executescript(
+                "DROP TABLE IF EXISTS tracks; DROP TABLE IF EXISTS playlists; DROP TABLE IF EXISTS playlist_stats;"
+            )
+            self.conn.execute(f"PRAGMA user_version = {CACHE_SCHEMA_VERSION}")
+        
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS playlists (
+                playlist_id TEXT PRIMARY KEY,
+                snapshot_id TEXT NOT NULL,
+                fields TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS tracks (
+                playlist_id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                uri TEXT,
+                name TEXT,
+                artists TEXT,
+                artist_uris TEXT,
+                album TEXT,
+                release_date TEXT,
+                duration_ms INTEGER,
+                popularity INTEGER,
+                external_urls TEXT,
+                isrc TEXT,
+                PRIMARY KEY (playlist_id, position)
+            );
+            CREATE TABLE IF NOT EXISTS playlist_stats (
+                playlist_id TEXT PRIMARY KEY,
+                snapshot_id TEXT NOT NULL,
+                stats TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS enrichment (
+                kind TEXT NOT NULL,
+                item_id TEXT NOT NULL,
+                value TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                used_at REAL NOT NULL,
+                PRIMARY KEY (kind, item_id)
+            );
+            CREATE INDEX IF NOT EXISTS enrichment_used_at ON enrichment (used_at);
+        """)
+        self.conn.commit()
+    
+    def get_snapshot(self, playlist_id):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT snapshot_id FROM playlists WHERE playlist_id = ?", (playlist_id,)
+            ).fetchone()
+        return row[0] if row else None
+    
+    def get_fields(self, playlist_id):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT fields FROM playlists WHERE playlist_id = ?", (playlist_id,)
+            ).fetchone()
+        return set(row[0].split(',')) if row else set()
+    
+    def load(self, playlist_id):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT uri, name, artists, artist_uris, album, release_date, duration_ms, popularity, "
+                "external_urls, isrc FROM tracks WHERE playlist_id = ? ORDER BY position",
+                (playlist_id,)
+            ).fetchall()
+        
+        # Unavailable items are kept as rows without a URI, so positions stay aligned
+        tracks = TrackTable()
+        for position, row in enumerate(rows):
+            if row[0] is None:
+                tracks.gaps.append(position)
+                continue
+            tracks.append({
+                'uri': row[0],
+                'name': row[1],
+                'artists': json.loads(row[2]),
+                'artist_uris': json.loads(row[3]),
+                'album': row[4],
+                'release_date': row[5],
+                'duration_ms': row[6],
+                'popularity': row[7],
+                'external_urls': json.loads(row[8]),
+                'isrc': row[9]
+            })
+        return tracks
+    
+    def store(self, playlist_id, snapshot_id, tracks, fields):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM tracks WHERE playlist_id = ?", (playlist_id,))
+            self._insert_table(playlist_id, tracks)
+            self.conn.execute(
+                "INSERT OR REPLACE INTO playlists VALUES (?, ?, ?, ?)",
+                (playlist_id, snapshot_id, ','.join(sorted(fields)), datetime.now().isoformat())
+            )
+    
+    def apply_edit(self, playlist_id, old_snapshot_id, snapshot_id, tracks, new_tracks, ops):
+        # Bring the rows cached for `tracks` (at old_snapshot_id) to `new_tracks` after `ops`
+        # (in whole-playlist positions, see spread_plan): removed rows are deleted, shifted
+        # ones renumbered and added ones inserted, and the rest are left alone. Rows cached for
+        # any other snapshot are replaced outright.
+        length = len(tracks) + len(tracks.gaps)
+        slots = replay_plan(length, ops)
+        kept = {slot for slot in slots if slot is not None}
+        new_rows = dict(zip(new_tracks.row_positions(), range(len(new_tracks))))
+        
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                "SELECT snapshot_id, fields FROM playlists WHERE playlist_id = ?", (playlist_id,)
+            ).fetchone()
+            if row is None or row[0] != old_snapshot_id:
+                self.conn.execute("DELETE FROM tracks WHERE playlist_id = ?", (playlist_id,))
+                self._insert_table(playlist_id, new_tracks)
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO playlists VALUES (?, ?, ?, ?)",
+                    (playlist_id, snapshot_id, row[1] if row else 'uri', datetime.now().isoformat())
+                )
+                return
+            
+            self.conn.executemany(
+                "DELETE FROM tracks WHERE playlist_id = ? AND position = ?",
+                [(playlist_id, p) for p in range(length) if p not in kept]
+            )
+            # Renumber through negative positions so no two rows ever share a key
+            moves = [(position, slot) for position, slot in enumerate(slots) if slot is not None and slot != position]
+            self.conn.executemany(
+                "UPDATE tracks SET position = ? WHERE playlist_id = ? AND position = ?",
+                [(-1 - position, playlist_id, slot) for position, slot in moves]
+            )
+            self.conn.execute(
+                "UPDATE tracks SET position = -1 - position WHERE playlist_id = ? AND position < 0", (playlist_id,)
+            )
+            self._insert(playlist_id, ((position, new_tracks[new_rows[position]])
+                                       for position, slot in enumerate(slots) if slot is None))
+            self.conn.execute(
+                "UPDATE playlists SET snapshot_id = ?, updated_at = ? WHERE playlist_id = ?",
+                (snapshot_id, datetime.now().isoformat(), playlist_id)
+            )
+    
+    def load_stats(self, playlist_id, snapshot_id):
+        # Running aggregates are only valid for the snapshot they were computed against
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT stats FROM playlist_stats WHERE playlist_id = ? AND snapshot_id = ?",
+                (playlist_id, snapshot_id)
+            ).fetchone()
+        return PlaylistStats.from_json(row[0]) if row else None
+    
+    def store_stats(self, playlist_id, snapshot_id, stats):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO playlist_stats VALUES (?, ?, ?)",
+                (playlist_id, snapshot_id, stats.to_json())
+            )
+    
+    def carry_stats(self, playlist_id, old_snapshot_id, snapshot_id, tracks, ops, new_tracks=None):
+        # Move stats held for the old snapshot across an applied plan, at the cost of the delta.
+        # Without them (or without the fields they need in `tracks`) they are left to be recomputed.
+        stats = self.load_stats(playlist_id, old_snapshot_id)
+        if stats is None or not set(PlaylistStats.fields) <= self.get_fields(playlist_id):
+            return
+        if apply_plan_to_stats(stats, tracks, ops, new_tracks):
+            self.store_stats(playlist_id, snapshot_id, stats)
+    
+    def load_enrichment(self, kind, ids):
+        # {id: value} for the IDs held and not expired (value None marks an ID Spotify doesn't know)
+        found = {}
+        now = time.time()
+        with self.lock, self.conn:
+            for batch in iter_batches(ids, 500):
+                rows = self.conn.execute(
+                    f"SELECT item_id, value FROM enrichment WHERE kind = ? AND fetched_at >= ? "
+                    f"AND item_id IN ({','.join('?' * len(batch))})",
+                    [kind, now - self.enrichment_max_age] + batch
+                ).fetchall()
+                self.conn.executemany(
+                    "UPDATE enrichment SET used_at = ? WHERE kind = ? AND item_id = ?",
+                    [(now, kind, row[0]) for row in rows]
+                )
+                found.update((row[0], json.loads(row[1])) for row in rows)
+        return found
+    
+    def store_enrichment(self, kind, values):
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO enrichment VALUES (?, ?, ?, ?, ?)",
+                [(kind, item_id, json.dumps(value), now, now) for item_id, value in values.items()]
+            )
+            excess = self.conn.execute("SELECT COUNT(*) FROM enrichment").fetchone()[0] - self.enrichment_max_entries
+            if excess > 0:
+                self.conn.execute(
+                    "DELETE FROM enrichment WHERE rowid IN (SELECT rowid FROM enrichment ORDER BY used_at LIMIT ?)",
+                    (excess,)
+                )
+    
+    def invalidate(self, playlist_id):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM tracks WHERE playlist_id = ?", (playlist_id,))
+            self.conn.execute("DELETE FROM playlists WHERE playlist_id = ?", (playlist_id,))
+            self.conn.execute("DELETE FROM playlist_stats WHERE playlist_id = ?", (playlist_id,))
+    
+    def _insert_table(self, playlist_id, tracks):
+        self._insert(playlist_id, zip(tracks.row_positions(), tracks))
+        self.conn.executemany(
+            "INSERT INTO tracks (playlist_id, position) VALUES (?, ?)", [(playlist_id, p) for p in tracks.gaps]
+        )
+    
+    def _insert(self, playlist_id, rows):
+        # rows are (position, track) pairs
+        self.conn.executemany(
+            "INSERT INTO tracks VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(
+                playlist_id,
+                position,
+                track['uri'],
+                track['name'],
+                json.dumps(track['artists']),
+                json.dumps(track['artist_uris']),
+                track['album'],
+                track['release_date'],
+                track['duration_ms'],
+                track['popularity'],
+                json.dumps(track['external_urls']),
+                track['isrc']
+            ) for position, track in rows]
+        )
+
+
+class BackupJournal:
+    # Local write-ahead log of playlist copies (backups and restores). Each job records its
+    # source, the source's snapshot, the target playlist and how many tracks are committed
+    # there. A batch is logged as pending before it is sent, so after a crash the target's
+    # length tells whether it landed and the copy resumes without adding anything twice.
+    def __init__(self, path=".playlist_backups.sqlite"):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                source TEXT NOT NULL,
+                source_snapshot TEXT NOT NULL,
+                target_id TEXT NOT NULL,
+                target_name TEXT NOT NULL,
+                committed INTEGER NOT NULL DEFAULT 0,
+                pending INTEGER NOT NULL DEFAULT 0,
+                status TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            );
+        """)
+        self.conn.commit()
+    
+    def find(self, source):
+        # The unfinished job for a source, if an earlier run was interrupted
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT * FROM jobs WHERE source = ? AND status = 'running' ORDER BY job_id DESC LIMIT 1", (source,)
+            ).fetchone()
+        return dict(row) if row else None
+    
+    def start(self, source, source_snapshot, target_id, target_name):
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO jobs (source, source_snapshot, target_id, target_name, status, updated_at) "
+                "VALUES (?, ?, ?, ?, 'running', ?)",
+                (source, source_snapshot, target_id, target_name, datetime.now().isoformat())
+            )
+        return {'job_id': cursor.lastrowid, 'source': source, 'source_snapshot': source_snapshot,
+                'target_id': target_id, 'target_name': target_name, 'committed': 0, 'pending': 0}
+    
+    def recover(self, job, target_total):
+        # Settle a pending batch against the target's real length. Returns the committed
+        # count, or None if the target no longer matches the log (it was edited meanwhile).
+        committed = job['committed']
+        if job['pending'] and target_total == committed + job['pending']:
+            committed = target_total
+        elif target_total != committed:
+            return None
+        
+        self._update(job['job_id'], committed=committed, pending=0)
+        return committed
+    
+    def begin_batch(self, job_id, count):
+        self._update(job_id, pending=count)
+    
+    def commit_batch(self, job_id, committed):
+        self._update(job_id, committed=committed, pending=0)
+    
+    def finish(self, job_id):
+        self._update(job_id, pending=0, status='done')
+    
+    def jobs(self, status=None):
+        with self.lock:
+            if status is None:
+                rows = self.conn.execute("SELECT * FROM jobs ORDER BY job_id").fetchall()
+            else:
+                rows = self.conn.execute("SELECT * FROM jobs WHERE status = ? ORDER BY job_id", (status,)).fetchall()
+        return [dict(row) for row in rows]
+    
+    def _update(self, job_id, **values):
+        values['updated_at'] = datetime.now().isoformat()
+        with self.lock, self.conn:
+            self.conn.execute(
+                f"UPDATE jobs SET {', '.join(f'{key} = ?' for key in values)} WHERE job_id = ?",
+                (*values.values(), job_id)
+            )
+
+
+def iter_batches(items, size):
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def export_file_source(filename):
+    # Journal key and version of an export file; a rewritten file counts as a new snapshot
+    path = os.path.abspath(filename)
+    stat = os.stat(path)
+    return f"file:{path}", f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+class TemplateExportConsumer(ExportConsumer):
+    # ExportConsumer whose filename is a template filled in with the playlist's name and id
+    def __init__(self, template, playlist_id, format='json', compression=None):
+        super().__init__(None, format, compression)
+        self.template = template
+        self.playlist_id = playlist_id
+    
+    def start(self, playlist_info):
+        self.filename = self.template.format(name=safe_filename(playlist_info['name']), id=self.playlist_id)
+        if os.path.dirname(self.filename):
+            os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+        super().start(playlist_info)
+
+
+# Job operations: 'read' ones share one pipeline pass, consecutive 'write' ones are merged
+# into one edit, and 'backup' copies the playlist as it stands at that point
+JOB_OPERATIONS = {
+    'stats': ('read', StatsConsumer.fields),
+    'export': ('read', ExportConsumer.fields),
+    'remove': ('write', FilterConsumer.fields),
+    'dedupe': ('write', DuplicateConsumer.fields),
+    'backup': ('backup', ('uri',))
+}
+JOB_CRITERIA = {'artist_name', 'album_name', 'track_name', 'year_range', 'duration_range', 'popularity_range',
+                'genre'} | {f"{feature}_range" for feature in AUDIO_FEATURES}
+
+
+def load_job_file(filename):
+    # Job files are JSON, or YAML (.yaml/.yml) when PyYAML is installed
+    with open(filename, encoding='utf-8') as f:
+        if filename.endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError as e:
+                raise ImportError("YAML job files need the 'PyYAML' package (pip install pyyaml)") from e
+            job = yaml.safe_load(f)
+        else:
+            job = json.load(f)
+    
+    validate_job(job)
+    return job
+
+
+def validate_job(job):
+    # Reject a malformed job before anything runs, so a typo can't stop it half way
+    if not isinstance(job, dict) or not isinstance(job.get('operations'), list) or not job['operations']:
+        raise ValueError("A job needs a non-empty 'operations' list")
+    
+    playlists = job.get('playlists', 'all')
+    if playlists != 'all' and not isinstance(playlists, list):
+        raise ValueError("'playlists' must be 'all' or a list of playlist ids or {'name': ...} entries")
+    
+    for operation in job['operations']:
+        if not isinstance(operation, dict):
+            raise ValueError(f"Job operations must be mappings with an 'op', not {operation!r}")
+        if operation.get('op') not in JOB_OPERATIONS:
+            raise ValueError(f"Unknown job operation: {operation.get('op')!r}")
+        if operation['op'] == 'remove':
+            criteria = operation.get('criteria') or {}
+            if not isinstance(criteria, dict) or not criteria or set(criteria) - JOB_CRITERIA:
+                raise ValueError(f"'remove' needs criteria from: {', '.join(sorted(JOB_CRITERIA))}")
+            for key, value in criteria.items():
+                if key.endswith('_range') and not (
+                    isinstance(value, (list, tuple)) and len(value) == 2
+                    and all(isinstance(bound, (int, float)) and not isinstance(bound, bool) for bound in value)
+                ):
+                    raise ValueError(f"'{key}' must be a [low, high] pair of numbers, not {value!r}")
+            try:
+                compile_criteria(**criteria)
+            except (TypeError, AttributeError, re.error) as e:
+                raise ValueError(f"Invalid 'remove' criteria {criteria!r}: {e}") from e
+        if operation['op'] == 'export':
+            ExportConsumer(None, operation.get('format', 'json'), operation.get('compression'))
+
+
+def job_removal_rows(operation, tracks):
+    # Rows of `tracks` a 'remove' or 'dedupe' operation takes out
+    if operation['op'] == 'dedupe':
+        duplicates = DuplicateConsumer()
+        duplicates.consume(tracks, 0)
+        return duplicates.positions
+    
+    rows = compile_criteria(**operation['criteria']).select(tracks.get_index())
+    return [i for i in sorted(rows) if tracks.artist_offsets[i + 1] > tracks.artist_offsets[i]]
+
+
+def group_job_operations(operations):
+    # [(kind, [operation, ...]), ...] with runs of the same kind together; backups stay single
+    groups = []
+    for operation in operations:
+        kind = JOB_OPERATIONS[operation['op']][0]
+        if groups and groups[-1][0] == kind and kind != 'backup':
+            groups[-1][1].append(operation)
+        else:
+            groups.append((kind, [operation]))
+    return groups
+
+
+SPOTIFY_SCOPE = "playlist-modify-public playlist-modify-private playlist-read-private playlist-read-collaborative"
+SPOTIFY_API_URL = "https://api.spotify.com/v1/"
+# Playlist metadata a scan starts from: the snapshot to check caches against, and what consumers' start() gets
+PLAYLIST_INFO_FIELDS = 'snapshot_id,name,description,tracks.total'
+# How long AsyncSpotifyPlaylistManager reuses a token whose expiry it can't read
+TOKEN_FALLBACK_TTL = 300
+
+
+# spotipy (and requests under it) takes a few hundred ms to import, so it is loaded the
+# first time a manager needs it; load_spotipy() rebinds SpotifyException for the except
+# clauses below. Until then they catch this placeholder, which nothing raises, so a failed
+# import surfaces as itself.
+class _UnloadedSpotifyException(Exception):
+    pass
+
+
+SpotifyException = _UnloadedSpotifyException
+
+
+def load_spotipy():
+    global SpotifyException
+    if SpotifyException is _UnloadedSpotifyException:
+        from spotipy.exceptions import SpotifyException
+
+
+def make_auth_manager(client_id, client_secret, redirect_uri):
+    # Both managers share this, and with it spotipy's on-disk token cache
+    from spotipy.oauth2 import SpotifyOAuth
+    
+    return SpotifyOAuth(
+        client_id=client_id,
+        client_secret=client_secret,
+        redirect_uri=redirect_uri,
+        scope=SPOTIFY_SCOPE
+    )
+
+
+def make_requests_session(pool_size):
+    # spotipy's default session lets urllib3 retry 429s and server errors itself, hiding them
+    # from the shared rate limiter (and reporting exhausted 5xx retries as a 429 without
+    # headers). This one only retries failed connections, leaving every status to _call, and
+    # is sized so parallel page fetches don't queue for a pooled connection.
+    import requests
+    from urllib3.util.retry import Retry
+    
+    retry = Retry(
+        total=3,
+        connect=None,
+        read=False,
+        status=0,
+        backoff_factor=0.3,
+        status_forcelist=(),
+        respect_retry_after_header=False
+    )
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def normalize_track(track):
+    album = track.get('album') or {}
+    return {
+        'uri': track['uri'],
+        'name': track.get('name'),
+        'artists': [a['name'] for a in track.get('artists') or []],
+        'artist_uris': [a.get('uri') for a in track.get('artists') or []],
+        'album': album.get('name'),
+        'release_date': album.get('release_date'),
+        'duration_ms': track.get('duration_ms'),
+        'popularity': track.get('popularity'),
+        'external_urls': track.get('external_urls') or {},
+        'isrc': (track.get('external_ids') or {}).get('isrc')
+    }
+
+
+def playlist_tracks_filter(fields):
+    return build_fields_filter(['total'] + [f"items.track.{TRACK_FIELDS[f]}" for f in fields])
+
+
+def summarize_playlist(playlist):
+    return {
+        'id': playlist['id'],
+        'name': playlist['name'],
+        'track_count': playlist['tracks']['total'],
+        'owner': playlist['owner']['display_name'] or playlist['owner']['id'],
+        'collaborative': playlist['collaborative'],
+        'public': playlist['public']
+    }
+
+
+class TableMemo:
+    # Small in-memory LRU of recently used playlist tables, keyed by snapshot_id, so the
+    # tables and any indexes built on them survive between calls
+    def __init__(self, size=8):
+        self.size = size
+        self.tables = OrderedDict()
+        self.lock = threading.Lock()
+    
+    def get(self, playlist_id, snapshot_id, fields):
+        with self.lock:
+            memo = self.tables.get(playlist_id)
+            if memo and memo[0] == snapshot_id and set(fields) <= memo[1]:
+                self.tables.move_to_end(playlist_id)
+                return memo[2]
+        return None
+    
+    def put(self, playlist_id, snapshot_id, fields, tracks):
+        with self.lock:
+            self.tables[playlist_id] = (snapshot_id, set(fields), tracks)
+            self.tables.move_to_end(playlist_id)
+            while len(self.tables) > self.size:
+                self.tables.popitem(last=False)
+    
+    def clear(self):
+        with self.lock:
+            self.tables.clear()
+
+
+class RateLimiter:
+    # Token bucket shared by reads and writes. Until the first 429 the refill rate grows
+    # multiplicatively with each success, so an unthrottled client soon runs at max_rate. After
+    # that it backs off on 429s and server errors (honouring Retry-After, or pausing
+    # exponentially longer on repeated errors) and creeps back up additively while calls succeed.
+    def __init__(self, rate=20.0, burst=None, min_rate=0.5, max_rate=None, increase=0.5, growth=1.05,
+                 error_backoff=0.3):
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(1, int(rate))
+        self.min_rate = min_rate
+        self.max_rate = max_rate if max_rate is not None else max(100.0, rate)
+        self.increase = increase
+        self.growth = growth
+        self.error_backoff = error_backoff
+        self.slow_start = True
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+    
+    def _reserve(self):
+        # Take a token if one is available; otherwise return how long to wait before retrying
+        with self.lock:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+    
+    def acquire(self):
+        waited = 0.0
+        while True:
+            wait = self._reserve()
+            if not wait:
+                return waited
+            time.sleep(wait)
+            waited += wait
+    
+    async def acquire_async(self):
+        waited = 0.0
+        while True:
+            wait = self._reserve()
+            if not wait:
+                return waited
+            await asyncio.sleep(wait)
+            waited += wait
+    
+    def on_success(self):
+        with self.lock:
+            if self.slow_start:
+                self.rate = min(self.max_rate, self.rate * self.growth)
+            else:
+                self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+    
+    def on_throttle(self, retry_after):
+        with self.lock:
+            self.slow_start = False
+            self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0
+    
+    def on_error(self, attempt=0):
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + self.error_backoff * 2 ** attempt)
+            self.rate = max(self.min_rate, self.rate * 0.75)
+
+
+# Upper bounds (seconds) of the request latency histogram; the last bucket is unbounded
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def instrumented(method):
+    # Times a manager method and splits it into time spent on the API (its own calls, rate
+    # limiter waits and waits on worker threads fetching for it) and local processing
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        api_before = self._api_seconds()
+        start = time.monotonic()
+        error = False
+        try:
+            return method(self, *args, **kwargs)
+        except Exception:
+            error = True
+            raise
+        finally:
+            self.instruments.record_method(
+                method.__name__, time.monotonic() - start, self._api_seconds() - api_before, error
+            )
+    return wrapper
+
+
+class Instrumentation:
+    # Per-endpoint request metrics, read/write throughput and per-method timings. Hooks are
+    # called with a dict for every request attempt ({'type': 'request', ...}) and every
+    # instrumented method call ({'type': 'method', ...}). Nested methods are timed inclusively.
+    # A request that never got a response (connection error, timeout) has status 0.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hooks = []
+        self.reset()
+    
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+    
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
+    
+    def record_request(self, endpoint, kind, status, seconds, wait_seconds, size, attempt, items=0):
+        # items is what a read got back or a write sent, for the per-kind throughput
+        error = not 0 < status < 400
+        with self.lock:
+            counter = self.endpoints.setdefault(endpoint, {
+                'calls': 0,
+                'errors': 0,
+                'retries': 0,
+                'throttled': 0,
+                'bytes_received': 0,
+                'seconds': 0.0,
+                'wait_seconds': 0.0,
+                'buckets': [0] * (len(LATENCY_BUCKETS) + 1)
+            })
+            counter['calls'] += 1
+            counter['errors'] += int(error)
+            counter['retries'] += int(attempt > 0)
+            counter['throttled'] += int(status == 429)
+            counter['bytes_received'] += size
+            counter['seconds'] += seconds
+            counter['wait_seconds'] += wait_seconds
+            counter['buckets'][bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            
+            counter = self.kinds.setdefault(kind, {
+                'requests': 0,
+                'items': 0,
+                'seconds': 0.0,
+                'wait_seconds': 0.0,
+                'throttled': 0,
+                'errors': 0
+            })
+            counter['requests'] += 1
+            counter['items'] += items
+            counter['seconds'] += seconds
+            counter['wait_seconds'] += wait_seconds
+            counter['throttled'] += int(status == 429)
+            counter['errors'] += int(error)
+        
+        self._emit({
+            'type': 'request',
+            'endpoint': endpoint,
+            'kind': kind,
+            'status': status,
+            'seconds': seconds,
+            'wait_seconds': wait_seconds,
+            'bytes_received': size,
+            'attempt': attempt,
+            'items': items
+        })
+    
+    def record_method(self, name, seconds, api_seconds, error=False):
+        local_seconds = max(seconds - api_seconds, 0.0)
+        with self.lock:
+            counter = self.methods.setdefault(name, {
+                'calls': 0,
+                'errors': 0,
+                'seconds': 0.0,
+                'api_seconds': 0.0,
+                'local_seconds': 0.0
+            })
+            counter['calls'] += 1
+            counter['errors'] += int(error)
+            counter['seconds'] += seconds
+            counter['api_seconds'] += api_seconds
+            counter['local_seconds'] += local_seconds
+        
+        self._emit({
+            'type': 'method',
+            'method': name,
+            'seconds': seconds,
+            'api_seconds': api_seconds,
+            'local_seconds': local_seconds,
+            'error': error
+        })
+    
+    def _emit(self, event):
+        for hook in list(self.hooks):
+            hook(event)
+    
+    def snapshot(self):
+        with self.lock:
+            endpoints = {}
+            for endpoint, counter in self.endpoints.items():
+                endpoints[endpoint] = {key: value for key, value in counter.items() if key != 'buckets'}
+                bounds = [str(bound) for bound in LATENCY_BUCKETS] + ['+Inf']
+                endpoints[endpoint]['latency_histogram'] = dict(zip(bounds, counter['buckets']))
+            return {'endpoints': endpoints, 'methods': {name: dict(counter) for name, counter in self.methods.items()}}
+    
+    def throughput(self):
+        # Request totals per kind ('read' or 'write') with the item rate over time spent on them
+        with self.lock:
+            result = {}
+            for kind, counter in self.kinds.items():
+                result[kind] = dict(counter)
+                result[kind]['items_per_second'] = counter['items'] / counter['seconds'] if counter['seconds'] else 0.0
+            return result
+    
+    def reset(self):
+        with self.lock:
+            self.endpoints = {}
+            self.kinds = {}
+            self.methods = {}
+    
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+    
+    def to_prometheus(self, prefix='spotify_playlist_manager'):
+        # Prometheus text exposition format (counters and a cumulative latency histogram)
+        snapshot = self.snapshot()
+        lines = []
+        
+        def metric(name, kind, samples):
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for labels, value in samples:
+                label_text = ','.join(f'{key}="{value}"' for key, value in labels.items())
+                lines.append(f"{prefix}_{name}{{{label_text}}} {value}")
+        
+        endpoints = snapshot['endpoints']
+        for name, key in (('requests_total', 'calls'), ('request_errors_total', 'errors'),
+                          ('request_retries_total', 'retries'), ('requests_throttled_total', 'throttled'),
+                          ('response_bytes_total', 'bytes_received'),
+                          ('rate_limit_wait_seconds_total', 'wait_seconds')):
+            metric(name, 'counter', [({'endpoint': e}, counter[key]) for e, counter in endpoints.items()])
+        
+        lines.append(f"# TYPE {prefix}_request_duration_seconds histogram")
+        for endpoint, counter in endpoints.items():
+            total = 0
+            for bound, count in counter['latency_histogram'].items():
+                total += count
+                lines.append(f'{prefix}_request_duration_seconds_bucket{{endpoint="{endpoint}",le="{bound}"}} {total}')
+        lines += [f'{prefix}_request_duration_seconds_sum{{endpoint="{e}"}} {counter["seconds"]}'
+                  for e, counter in endpoints.items()]
+        lines += [f'{prefix}_request_duration_seconds_count{{endpoint="{e}"}} {counter["calls"]}'
+                  for e, counter in endpoints.items()]
+        
+        methods = snapshot['methods']
+        for name, key in (('method_calls_total', 'calls'), ('method_errors_total', 'errors'),
+                          ('method_seconds_total', 'seconds'), ('method_api_seconds_total', 'api_seconds'),
+                          ('method_local_seconds_total', 'local_seconds')):
+            metric(name, 'counter', [({'method': m}, counter[key]) for m, counter in methods.items()])
+        
+        return '\n'.join(lines) + '\n'
+    
+    def format_report(self):
+        # Plain-text breakdown for the CLI's --profile flag
+        snapshot = self.snapshot()
+        lines = [f"{'method':<30}{'calls':>7}{'total s':>10}{'api s':>10}{'local s':>10}"]
+        for name, counter in sorted(snapshot['methods'].items(), key=lambda item: -item[1]['seconds']):
+            lines.append(f"{name:<30}{counter['calls']:>7}{counter['seconds']:>10.3f}"
+                         f"{counter['api_seconds']:>10.3f}{counter['local_seconds']:>10.3f}")
+        
+        lines.append(f"\n{'endpoint':<30}{'calls':>7}{'retries':>9}{'429s':>6}{'KiB':>10}{'avg ms':>9}{'wait s':>9}")
+        for endpoint, counter in sorted(snapshot['endpoints'].items(), key=lambda item: -item[1]['seconds']):
+            average = counter['seconds'] / counter['calls'] * 1000 if counter['calls'] else 0.0
+            lines.append(f"{endpoint:<30}{counter['calls']:>7}{counter['retries']:>9}{counter['throttled']:>6}"
+                         f"{counter['bytes_received'] / 1024:>10.1f}{average:>9.1f}{counter['wait_seconds']:>9.3f}")
+        return '\n'.join(lines)
+
+
 class SpotifyPlaylistManager:
-    def __init__(self, client_id, client_secret, redirect_uri):
+    def __init__(self, client_id, client_secret, redirect_uri, cache_path=".playlist_cache.sqlite", max_workers=8,
+                 max_retries=5, journal_path=".playlist_backups.sqlite", api_url=SPOTIFY_API_URL, auth_manager=None,
+                 listing_ttl=300, rate_limit=20.0):
+        # api_url and auth_manager let the manager run against another server (e.g. benchmark.py's
+        # stand-in API) with any object that has get_access_token(as_dict=False). Nothing is
+        # imported from spotipy or sent to the API until the first call needs it. rate_limit is
+        # the starting request rate per second (see RateLimiter).
+        self.credentials = (client_id, client_secret, redirect_uri)
+        self.api_url = api_url
+        self.auth_manager = auth_manager
+        self.rate_limiter = RateLimiter(rate_limit)
+        self.instruments = Instrumentation()
+        self._local = threading.local()
+        self.max_retries = max_retries
+        self.cache = TrackCache(cache_path)
+        self.journal = BackupJournal(journal_path)
+        self.max_workers = max_workers
+        self.tables = TableMemo()
+        self.listing_ttl = listing_ttl
+        self.session = None
+        self._client = None
+        self._user_id = None
+        self._listing = {}
+        self._listing_time = None
+        self._listing_refresh = None
+        self._init_lock = threading.Lock()
+        self._listing_lock = threading.Lock()
+    
+    @property
+    def sp(self):
+        if self._client is None:
+            with self._init_lock:
+                if self._client is None:
+                    import spotipy
+                    load_spotipy()
+                    
+                    # 429s are left to the shared rate limiter so Retry-After can pace every thread
+                    self.session = make_requests_session(self.max_workers + 2)
+                    self.session.hooks['response'].append(self._on_response)
+                    client = spotipy.Spotify(
+                        auth_manager=self.auth_manager or make_auth_manager(*self.credentials),
+                        requests_session=self.session
+                    )
+                    client.prefix = self.api_url
+                    self._client = client
+        return self._client
+    
+    @property
+    def user_id(self):
+        # Resolved on first use rather than in the constructor
+        if self._user_id is None:
+            self._user_id = self._call('read', None, self.sp.current_user)['id']
+        return self._user_id
+    
+    def _on_response(self, response, *args, **kwargs):
+        # requests hook; the body is read here once and reused when spotipy parses it
+        self._local.response_bytes = getattr(self._local, 'response_bytes', 0) + len(response.content)
+    
+    def _api_seconds(self):
+        # Running total of time this thread has spent on API calls or waiting for them
+        return getattr(self._local, 'api_seconds', 0.0)
+    
+    def _add_api_seconds(self, seconds):
+        self._local.api_seconds = self._api_seconds() + seconds
+    
+    def _wait_for(self, results):
+        # Iterate worker results, counting time blocked on them as this thread's API time
+        results = iter(results)
+        while True:
+            start = time.monotonic()
+            try:
+                result = next(results)
+            except StopIteration:
+                return
+            finally:
+                self._add_api_seconds(time.monotonic() - start)
+            yield result
+    
+    def _call(self, kind, count, fn, *args, **kwargs):
+        # count is the number of items a write sends; reads count the items they get back
+        endpoint = getattr(fn, '__name__', repr(fn))
+        for attempt in range(self.max_retries + 1):
+            waited = self.rate_limiter.acquire()
+            self._local.response_bytes = 0
+            start = time.monotonic()
+            
+            try:
+                result = fn(*args, **kwargs)
+            except SpotifyException as e:
+                elapsed = time.monotonic() - start
+                retryable = e.http_status == 429 or e.http_status >= 500
+                self.instruments.record_request(
+                    endpoint, kind, e.http_status, elapsed, waited, self._local.response_bytes, attempt
+                )
+                self._add_api_seconds(waited + elapsed)
+                
+                if not retryable or attempt == self.max_retries:
+                    raise
+                
+                if e.http_status == 429:
+                    headers = e.headers or {}
+                    self.rate_limiter.on_throttle(float(headers.get('Retry-After', 1)))
+                else:
+                    self.rate_limiter.on_error(attempt)
+                continue
+            
+            if count is None:
+                count = len(result.get('items') or []) if isinstance(result, dict) else 0
+            
+            elapsed = time.monotonic() - start
+            self.rate_limiter.on_success()
+            self.instruments.record_request(
+                endpoint, kind, 200, elapsed, waited, self._local.response_bytes, attempt, count
+            )
+            self._add_api_seconds(waited + elapsed)
+            return result
+    
+    def get_throughput(self):
+        return self.instruments.throughput()
+    
+    def get_instrumentation(self):
+        return self.instruments.snapshot()
+    
+    def _iter_pages(self, fetch_page, limit):
+        # The first page reports the total, so every remaining offset is known up front
+        first = fetch_page(limit, 0)
+        yield first
+        
+        offsets = iter(range(limit, first['total'], limit))
+        window = 2 * self.max_workers
         
-        scope = "playlist-modify-public playlist-modify-private playlist-read-private playlist-read-collaborative"
+        def in_order(executor):
+            # Pages come back in offset order, however they complete. Only a window of them is
+            # in flight, topped up as each is handed on, so a streaming consumer never has more
+            # than that many pages in memory.
+            pending = deque(executor.submit(fetch_page, limit, offset) for offset in islice(offsets, window))
+            try:
+                while pending:
+                    page = pending.popleft().result()
+                    for offset in islice(offsets, 1):
+                        pending.append(executor.submit(fetch_page, limit, offset))
+                    yield page
+            finally:
+                for future in pending:
+                    future.cancel()
         
-        self.sp = spotipy.Spotify(auth_manager=SpotifyOAuth(
-            client_id=id,
-            client_secret=client_secret,
-            redirect_uri=redirect_uri,
-            scope=scope
-        ))
-        self.user_id = self.sp.current_user()['id']
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            yield from self._wait_for(in_order(executor))
     
-    def get_user_playlists(self, include_collaborative=False):
-        playlists = []
-        results = self.sp.current_user_playlists(limit=50)
+    def _get_playlist_tracks(self, playlist_id, fields, consumers=(), keep=True):
+        return self._scan_playlist(playlist_id, fields, consumers, keep)[1]
+    
+    def _scan_playlist(self, playlist_id, fields, consumers=(), keep=True, playlist_info=None):
+        # Returns (playlist_info, tracks). Serve from the local cache while the playlist's
+        # snapshot is unchanged and it already holds every field the caller needs. Each
+        # consumer sees every page once. With keep=False a fresh fetch streams pages to the
+        # consumers without holding (or caching) the whole playlist, and tracks is None.
+        # playlist_info (PLAYLIST_INFO_FIELDS) saves fetching it again if the caller has it.
+        if playlist_info is None:
+            playlist_info = self._call('read', None, self.sp.playlist, playlist_id, fields=PLAYLIST_INFO_FIELDS)
+        snapshot_id = playlist_info['snapshot_id']
+        for consumer in consumers:
+            consumer.start(playlist_info)
         
-        while results:
-            for playlist in results['items']:
+        tracks = self.tables.get(playlist_id, snapshot_id, fields)
+        if tracks is None:
+            cached_fields = self.cache.get_fields(playlist_id)
+            if self.cache.get_snapshot(playlist_id) == snapshot_id and set(fields) <= cached_fields:
+                tracks = self.cache.load(playlist_id)
+                self.tables.put(playlist_id, snapshot_id, cached_fields, tracks)
+        
+        if tracks is not None:
+            for consumer in consumers:
+                consumer.consume(tracks, 0)
+            return playlist_info, tracks
+        
+        # Ask for the union with what was cached before so earlier callers stay served
+        fields = set(fields) | cached_fields | {'uri'}
+        fields_filter = playlist_tracks_filter(fields)
+        
+        tracks = TrackTable()
+        pages = self._iter_pages(
+            lambda limit, offset: self._call(
+                'read', None, self.sp.playlist_items, playlist_id,
+                fields=fields_filter, limit=limit, offset=offset
+            ),
+            100
+        )
+        
+        # Pages share the table's string pools so consumers can count interned ids across them
+        offset = position = 0
+        for results in pages:
+            page = TrackTable(tracks.pools())
+            for item in results['items']:
+                if item['track']:
+                    page.append(normalize_track(item['track']))
+                else:
+                    tracks.gaps.append(position)
+                position += 1
+            
+            for consumer in consumers:
+                consumer.consume(page, offset)
+            offset += len(page)
+            if keep:
+                tracks.extend(page)
+        
+        if not keep:
+            return playlist_info, None
+        
+        self.cache.store(playlist_id, snapshot_id, tracks, fields)
+        self.tables.put(playlist_id, snapshot_id, fields, tracks)
+        return playlist_info, tracks
+    
+    def _get_if_changed(self, path, params, cached):
+        # GET revalidating an earlier {'etag', 'body'} response with If-None-Match; a 304
+        # hands the cached one back unchanged
+        headers = {'Authorization': f"Bearer {self.sp.auth_manager.get_access_token(as_dict=False)}"}
+        if cached and cached['etag']:
+            headers['If-None-Match'] = cached['etag']
+        
+        response = self.session.get(self.api_url + path, params=params, headers=headers,
+                                    timeout=self.sp.requests_timeout)
+        if response.status_code == 304:
+            return cached
+        if response.status_code >= 400:
+            try:
+                message = response.json().get('error', {}).get('message')
+            except ValueError:
+                message = response.text or None
+            raise SpotifyException(response.status_code, -1, f"{response.url}:\n {message}", headers=response.headers)
+        return {'etag': response.headers.get('ETag'), 'body': response.json()}
+    
+    def _refresh_listing(self, max_age):
+        # The user's playlists are kept for listing_ttl seconds (or max_age, if given); after
+        # that every page is revalidated against its ETag, so an unchanged library costs only
+        # empty 304s. Edits made through this manager mark the listing stale.
+        with self._listing_lock:
+            if self._listing_time is not None and time.monotonic() - self._listing_time <= max_age:
+                return self._listing
+            
+            previous = self._listing
+            listing = {}
+            
+            def fetch_page(limit, offset):
+                listing[offset] = self._call(
+                    'read', None, self._get_if_changed, 'me/playlists', {'limit': limit, 'offset': offset},
+                    previous.get(offset)
+                )
+                return listing[offset]['body']
+            
+            start = time.monotonic()
+            for _ in self._iter_pages(fetch_page, 50):
+                pass
+            self._listing = listing
+            self._listing_time = start
+            return listing
+    
+    def _invalidate_listing(self):
+        self._listing_time = None
+    
+    def refresh_user_playlists_in_background(self, max_age=None):
+        # Revalidate the playlist listing (and resolve the user) on a daemon thread, e.g. while
+        # the CLI waits for input; a later get_user_playlists() waits for it instead of refetching.
+        # Like get_user_playlists, a listing younger than listing_ttl (or max_age) is left alone.
+        if max_age is None:
+            max_age = self.listing_ttl
+        if self._listing_refresh is not None and self._listing_refresh.is_alive():
+            return
+        
+        def refresh():
+            try:
+                # A first login prompts on stdin, which has to happen in the foreground
+                cache_handler = getattr(self.sp.auth_manager, 'cache_handler', None)
+                if cache_handler is not None and cache_handler.get_cached_token() is None:
+                    return
+                self.user_id
+                self._refresh_listing(max_age)
+            except Exception:
+                # The next foreground call retries and reports the error
+                pass
+        
+        self._listing_refresh = threading.Thread(target=refresh, daemon=True)
+        self._listing_refresh.start()
+    
+    @instrumented
+    def get_user_playlists(self, include_collaborative=False, max_age=None):
+        listing = self._refresh_listing(self.listing_ttl if max_age is None else max_age)
+        
+        playlists = []
+        for offset in sorted(listing):
+            for playlist in listing[offset]['body']['items']:
                 if playlist['owner']['id'] == self.user_id or include_collaborative:
-                    playlists.append({
-                        'id': playlist['id'],
-                        'name': playlist['name'],
-                        'track_count': playlist['tracks']['total'],
-                        'owner': playlist['owner']['display_name'] or playlist['owner']['id'],
-                        'collaborative': playlist['collaborative'],
-                        'public': playlist['public']
-                    })
-            
-            if results['next']:
-                results = self.sp.next(results)
-            else:
-                break
+                    playlists.append(summarize_playlist(playlist))
         
         return playlists
     
-    def search_tracks_by_criteria(self, playlist_id, **criteria):
+    def _enrich(self, tracks, kinds):
+        # Fill tracks.enrichment for each kind: from the per-ID cache first, then the rest
+        # through the multi-ID endpoint in concurrent batches
+        for kind in kinds:
+            known = tracks.enrichment[kind]
+            ids = [item_id for item_id in enrichment_ids(tracks, kind) if item_id not in known]
+            found = self.cache.load_enrichment(kind, ids)
+            missing = [item_id for item_id in ids if item_id not in found]
+            if missing:
+                fetch = self.sp.audio_features if kind == 'audio_features' else self.sp.artists
+                key = ENRICHMENT_ENDPOINTS[kind][2]
+                
+                def fetch_batch(batch):
+                    result = self._call('read', len(batch), fetch, batch)
+                    # spotipy unwraps the audio features list but not the artists one
+                    return parse_enrichment(kind, batch, result[key] if isinstance(result, dict) else result)
+                
+                batches = list(iter_batches(missing, ENRICHMENT_ENDPOINTS[kind][1]))
+                with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                    for values in self._wait_for(executor.map(fetch_batch, batches)):
+                        self.cache.store_enrichment(kind, values)
+                        found.update(values)
+            known.update(found)
+    
+    @instrumented
+    def search_tracks_by_criteria(self, playlist_id, query=None, **criteria):
+        # query may be any TextMatch/RangeMatch/FeatureRange/GenreMatch combination built
+        # with &, | and ~; keyword criteria are ANDed onto it. Audio feature and genre
+        # criteria enrich the playlist first.
+        query = compile_criteria(query, **criteria)
+        kinds = query.enrichments()
+        fields = {'uri', 'name', 'artists', 'album', 'release_date', 'duration_ms', 'popularity'}
+        tracks = self._get_playlist_tracks(playlist_id, fields | enrichment_fields(kinds))
+        self._enrich(tracks, kinds)
         
-        tracks_found = []
-        results = self.sp.playlist_tracks(playlist_id, limit=100)
+        rows = query.select(tracks.get_index())
+        matches = [i for i in sorted(rows) if tracks.artist_offsets[i + 1] > tracks.artist_offsets[i]]
         
-        while results:
-            for item in results['items']:
-                if item['track'] and item['track']['artists']:
-                    track = item['track']
-                    match = True
-                    
-                    # Check artist name
-                    if 'artist_name' in criteria:
-                        artist_match = any(
-                            criteria['artist_name'].lower() in artist['name'].lower()
-                            for artist in track['artists']
-                        )
-                        if not artist_match:
-                            match = False
-                    
-                    # Check album name
-                    if 'album_name' in criteria and match:
-                        if criteria['album_name'].lower() not in track['album']['name'].lower():
-                            match = False
-                    
-                    # Check release year
-                    if 'year_range' in criteria and match:
-                        try:
-                            release_year = int(track['album']['release_date'][:4])
-                            year_min, year_max = criteria['year_range']
-                            if not (year_min <= release_year <= year_max):
-                                match = False
-                        except:
-                            pass
-                    
-                    # Check duration (in seconds)
-                    if 'duration_range' in criteria and match:
-                        duration_sec = track['duration_ms'] / 1000
-                        dur_min, dur_max = criteria['duration_range']
-                        if not (dur_min <= duration_sec <= dur_max):
-                            match = False
-                    
-                    # Check popularity
-                    if 'popularity_range' in criteria and match:
-                        pop_min, pop_max = criteria['popularity_range']
-                        if not (pop_min <= track['popularity'] <= pop_max):
-                            match = False
-                    
-                    if match:
-                        tracks_found.append({
-                            'uri': track['uri'],
-                            'name': track['name'],
-                            'artists': [a['name'] for a in track['artists']],
-                            'album': track['album']['name'],
-                            'release_date': track['album']['release_date'],
-                            'duration_ms': track['duration_ms'],
-                            'popularity': track['popularity']
-                        })
-            
-            if results['next']:
-                results = self.sp.next(results)
+        return tracks.take(matches)
+    
+    def _apply_plan(self, playlist_id, snapshot_id, ops):
+        # Each op is sent against the snapshot the previous one produced
+        for op in ops:
+            if op['op'] == 'remove':
+                result = self._call(
+                    'write', sum(len(item['positions']) for item in op['items']),
+                    self.sp.playlist_remove_specific_occurrences_of_items,
+                    playlist_id, op['items'], snapshot_id=snapshot_id
+                )
+            elif op['op'] == 'reorder':
+                result = self._call(
+                    'write', op['range_length'], self.sp.playlist_reorder_items,
+                    playlist_id, op['range_start'], op['insert_before'],
+                    range_length=op['range_length'], snapshot_id=snapshot_id
+                )
             else:
-                break
+                result = self._call(
+                    'write', len(op['uris']), self.sp.playlist_add_items,
+                    playlist_id, op['uris'], position=op['position']
+                )
+            snapshot_id = result['snapshot_id']
         
-        return tracks_found
+        self._invalidate_listing()
+        return snapshot_id
+    
+    @instrumented
+    def update_playlist_contents(self, playlist_id, desired, fields=('uri',), max_conflicts=3, donors=()):
+        # Make the playlist hold exactly `desired` (a URI list, or a function from the current
+        # TrackTable to one) using the fewest positional edits. If the playlist changes under
+        # us the plan is rebuilt from a fresh snapshot and retried. donors are tables holding
+        # `fields` for URIs the playlist gains, so its cached copy can be kept (see rebuild_table).
+        for attempt in range(max_conflicts + 1):
+            playlist_info, tracks = self._scan_playlist(playlist_id, fields)
+            uris = desired(tracks) if callable(desired) else list(desired)
+            ops = plan_playlist_changes(tracks.uris, uris)
+            if not ops:
+                return summarize_plan(ops)
+            # Planned over the available tracks; unavailable items stay where they are
+            sent, gaps = spread_plan(ops, len(tracks), tracks.gaps)
+            
+            try:
+                snapshot_id = self._apply_plan(playlist_id, playlist_info['snapshot_id'], sent)
+            except SpotifyException as e:
+                if not is_edit_conflict(e) or attempt == max_conflicts:
+                    raise
+                continue
+            
+            # Keep the cached copy (and its stats) in step with our own edit instead of refetching it later
+            new_tracks = rebuild_table(tracks, uris, donors)
+            if new_tracks is None:
+                self.cache.invalidate(playlist_id)
+            else:
+                new_tracks.gaps = gaps
+                cached_fields = self.cache.get_fields(playlist_id)
+                self.cache.apply_edit(playlist_id, playlist_info['snapshot_id'], snapshot_id, tracks, new_tracks, sent)
+                self.tables.put(playlist_id, snapshot_id, cached_fields, new_tracks)
+                self.cache.carry_stats(playlist_id, playlist_info['snapshot_id'], snapshot_id, tracks, ops, new_tracks)
+            
+            return summarize_plan(ops)
     
+    @instrumented
     def remove_tracks_from_playlist(self, playlist_id, track_uris):
-        batch_size = 100
+        uris = set(track_uris)
+        return self.update_playlist_contents(playlist_id, lambda tracks: [u for u in tracks.uris if u not in uris])
+    
+    @instrumented
+    def remove_duplicates(self, playlist_id):
+        # Removes only the repeats find_duplicates reports, keeping each first occurrence
+        return self.update_playlist_contents(playlist_id, keep_first_occurrences, DuplicateConsumer.fields)
+    
+    def _copy_to_playlist(self, source, source_snapshot, name, description, uris):
+        # Append `uris` (the source's contents, in order) to a new playlist, journaling every
+        # batch. If an earlier run for the same source was interrupted, its target is resumed
+        # instead. Returns (job, snapshot_id of the last add, or None if nothing was added);
+        # job['committed'] is then the copy's length.
+        uris = (uri for uri in uris if not uri.startswith('spotify:local:'))
+        job = self.journal.find(source)
+        if job is None:
+            new_playlist = self._call(
+                'write', 1, self.sp.user_playlist_create, self.user_id, name, public=False, description=description
+            )
+            self._invalidate_listing()
+            job = self.journal.start(source, source_snapshot, new_playlist['id'], name)
+            committed = 0
+        else:
+            target_total = self._call(
+                'read', None, self.sp.playlist, job['target_id'], fields='tracks.total'
+            )['tracks']['total']
+            committed = self.journal.recover(job, target_total)
+            if committed is None or job['source_snapshot'] != source_snapshot:
+                # The source or the copy changed since the interruption; bring the copy in line
+                self.update_playlist_contents(job['target_id'], list(uris))
+                self.journal.finish(job['job_id'])
+                return job, None
+        
+        # Appends must land in order, so batches stay sequential
+        snapshot_id = None
+        for batch in iter_batches(islice(uris, committed, None), 100):
+            self.journal.begin_batch(job['job_id'], len(batch))
+            snapshot_id = self._call('write', len(batch), self.sp.playlist_add_items, job['target_id'], batch)['snapshot_id']
+            committed += len(batch)
+            self.journal.commit_batch(job['job_id'], committed)
         
-        for i in range(0, len(track_uris), batch_size):
-            batch = track_uris[i:i + batch_size]
-            self.sp.playlist_remove_all_occurrences_of_items(playlist_id, batch)
-            time.sleep(0.1)
+        self.journal.finish(job['job_id'])
+        self._invalidate_listing()
+        job['committed'] = committed
+        return job, snapshot_id
     
+    @instrumented
     def duplicate_playlist(self, playlist_id, new_name_suffix="_backup"):
-        playlist_info = self.sp.playlist(playlist_id)
+        # Resumable: after a failure, calling this again continues the same backup playlist
+        playlist_info, tracks = self._scan_playlist(playlist_id, ['uri'])
         new_name = playlist_info['name'] + new_name_suffix
+        description = f"Backup of {playlist_info['name']} created on {datetime.now().strftime('%Y-%m-%d')}"
         
-        # Create new playlist
-        new_playlist = self.sp.user_playlist_create(
-            self.user_id, 
-            new_name, 
-            public=False,
-            description=f"Backup of {playlist_info['name']} created on {datetime.now().strftime('%Y-%m-%d')}"
+        job, snapshot_id = self._copy_to_playlist(
+            f"playlist:{playlist_id}", playlist_info['snapshot_id'], new_name, description, tracks.uris
         )
         
-        # Get all tracks from original playlist
-        tracks = []
-        results = self.sp.playlist_tracks(playlist_id, limit=100)
+        # A copy holding exactly the source's tracks can share their cache
+        if snapshot_id and job['committed'] == len(tracks) == playlist_info['tracks']['total']:
+            self.cache.store(job['target_id'], snapshot_id, tracks, self.cache.get_fields(playlist_id))
+            stats = self.cache.load_stats(playlist_id, playlist_info['snapshot_id'])
+            if stats is not None:
+                self.cache.store_stats(job['target_id'], snapshot_id, stats)
         
-        while results:
-            for item in results['items']:
-                if item['track']:
-                    tracks.append(item['track']['uri'])
-            
-            if results['next']:
-                results = self.sp.next(results)
-            else:
-                break
+        return job['target_id'], job['target_name']
+    
+    @instrumented
+    def restore_playlist(self, filename, name=None):
+        # New playlist from an export file (json, jsonl or csv, optionally compressed);
+        # resumable like duplicate_playlist
+        playlist_name, description, uris = read_export_file(filename)
+        source, source_snapshot = export_file_source(filename)
+        description = description or f"Restored from {os.path.basename(filename)} on {datetime.now().strftime('%Y-%m-%d')}"
+        
+        job, _ = self._copy_to_playlist(source, source_snapshot, name or playlist_name, description, uris)
+        return job['target_id'], job['target_name']
+    
+    @instrumented
+    def backup_playlists(self, playlists=None, new_name_suffix="_backup", workers=4):
+        # Back up many playlists at once. One failure doesn't stop the rest; it is reported
+        # in that playlist's entry and a later call resumes it from the journal.
+        if playlists is None:
+            playlists = self.get_user_playlists()
+        
+        def backup_one(playlist):
+            try:
+                backup_id, backup_name = self.duplicate_playlist(playlist['id'], new_name_suffix)
+                return {'playlist_id': playlist['id'], 'backup_id': backup_id, 'backup_name': backup_name}
+            except Exception as e:
+                return {'playlist_id': playlist['id'], 'error': str(e)}
         
-        # Add tracks to new playlist in batches
-        batch_size = 100
-        for i in range(0, len(tracks), batch_size):
-            batch = tracks[i:i + batch_size]
-            self.sp.playlist_add_items(new_playlist['id'], batch)
-            time.sleep(0.1)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(self._wait_for(executor.map(backup_one, playlists)))
+    
+    @instrumented
+    def run_pipeline(self, playlist_id, consumers, keep=True, playlist_info=None):
+        # Stream the playlist once through every consumer, fetching the union of their fields
+        fields = set()
+        for consumer in consumers:
+            fields.update(consumer.fields)
+        
+        try:
+            self._scan_playlist(playlist_id, fields, consumers, keep, playlist_info)
+        except Exception:
+            for consumer in consumers:
+                consumer.abort()
+            raise
         
-        return new_playlist['id'], new_name
+        return {consumer.name: consumer.result() for consumer in consumers}
     
+    @instrumented
     def get_playlist_stats(self, playlist_id):
-        tracks = []
-        results = self.sp.playlist_tracks(playlist_id, limit=100)
+        # Stats are kept as running aggregates per snapshot, so an unchanged playlist (or one
+        # only edited through this manager) is answered without reading its tracks
+        playlist_info = self._call('read', None, self.sp.playlist, playlist_id, fields=PLAYLIST_INFO_FIELDS)
+        stats = self.cache.load_stats(playlist_id, playlist_info['snapshot_id'])
+        if stats is None:
+            consumer = StatsConsumer()
+            self.run_pipeline(playlist_id, [consumer], playlist_info=playlist_info)
+            stats = consumer.stats
+            self.cache.store_stats(playlist_id, consumer.snapshot_id, stats)
+        return stats.result()
+    
+    @instrumented
+    def find_duplicates(self, playlist_id):
+        return self.run_pipeline(playlist_id, [DuplicateConsumer()])['duplicates']
+    
+    @instrumented
+    def export_playlist(self, playlist_id, filename=None, format='json', compression=None, keep=True):
+        # keep=False streams a fresh fetch straight to disk without caching it
+        consumer = ExportConsumer(filename, format, compression)
+        return self.run_pipeline(playlist_id, [consumer], keep)['export']
+    
+    @instrumented
+    def export_all_playlists(self, archive_path="playlists_export.zip", format='jsonl', compression=None,
+                             playlists=None, workers=4):
+        # Playlists are exported concurrently to temporary files, each added to one zip as it finishes
+        if playlists is None:
+            playlists = self.get_user_playlists()
         
-        while results:
-            for item in results['items']:
-                if item['track']:
-                    tracks.append(item['track'])
+        extension = EXPORT_FORMATS[format] + EXPORT_COMPRESSIONS[compression]
+        archive_lock = threading.Lock()
+        
+        with zipfile.ZipFile(archive_path, 'w', zipfile.ZIP_DEFLATED if compression is None else zipfile.ZIP_STORED) as archive:
+            def export_one(playlist):
+                handle, temp_path = tempfile.mkstemp(suffix=extension)
+                os.close(handle)
+                try:
+                    self.export_playlist(playlist['id'], temp_path, format, compression, keep=False)
+                    arcname = f"{safe_filename(playlist['name'])}_{playlist['id']}{extension}"
+                    with archive_lock:
+                        archive.write(temp_path, arcname)
+                    return arcname
+                finally:
+                    os.remove(temp_path)
             
-            if results['next']:
-                results = self.sp.next(results)
-            else:
-                break
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                names = list(self._wait_for(executor.map(export_one, playlists)))
         
-        if not tracks:
-            return {}
+        return archive_path, names
+    
+    @instrumented
+    def find_library_duplicates(self, playlists=None, include_collaborative=False, workers=4):
+        # Duplicate clusters across every playlist (or the given ones), matched on URI, ISRC
+        # or normalized title and artist. Each entry carries its playlist and position.
+        if playlists is None:
+            playlists = self.get_user_playlists(include_collaborative)
         
-        # Calculate statistics
-        total_duration = sum(track['duration_ms'] for track in tracks)
-        artists = {}
-        albums = {}
-        years = {}
+        fields = ['uri', 'name', 'artists', 'isrc']
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            tables = list(self._wait_for(executor.map(lambda p: self._get_playlist_tracks(p['id'], fields), playlists)))
         
-        for track in tracks:
-            # Count artists
-            for artist in track['artists']:
-                artists[artist['name']] = artists.get(artist['name'], 0) + 1
+        names = {playlist['id']: playlist['name'] for playlist in playlists}
+        clusters = cluster_duplicates([(p['id'], tracks) for p, tracks in zip(playlists, tables)])
+        for cluster in clusters:
+            for entry in cluster:
+                entry['playlist_name'] = names[entry['playlist_id']]
+        
+        return clusters
+    
+    @instrumented
+    def diff_playlists(self, source_id, target_id):
+        # What separates target from source: URIs only in each and the count they share (see
+        # diff_uris), plus a summary of the positional edits sync_playlist would make
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            source, target = self._wait_for(executor.map(
+                lambda playlist_id: self._get_playlist_tracks(playlist_id, ['uri']), (source_id, target_id)
+            ))
+        
+        diff = diff_uris(source.uris, target.uris)
+        diff['in_order'] = source.uris == target.uris
+        diff['edits'] = summarize_plan(plan_playlist_changes(target.uris, synced_uris(source.uris)))
+        return diff
+    
+    def _edit_fields(self, playlist_id):
+        # Fields to read other playlists with when they supply tracks for this one, so they can
+        # donate rows to its cached copy (see rebuild_table)
+        return sorted(self.cache.get_fields(playlist_id) | {'uri'})
+    
+    @instrumented
+    def merge_playlists(self, target_id, source_ids, dedupe=True):
+        # Add every track of the sources that target lacks, after its own (see merged_uris),
+        # as batched adds; with dedupe, URIs repeated in target are removed as well
+        fields = self._edit_fields(target_id)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            sources = list(self._wait_for(executor.map(
+                lambda playlist_id: self._get_playlist_tracks(playlist_id, fields), source_ids
+            )))
+        
+        return self.update_playlist_contents(
+            target_id, lambda tracks: merged_uris(tracks.uris, [source.uris for source in sources], dedupe),
+            fields, donors=sources
+        )
+    
+    @instrumented
+    def sync_playlist(self, source_id, target_id):
+        # One-way sync: target ends up with source's tracks in source's order, through the
+        # fewest batched removes, moves and adds rather than a rebuild. Both playlists are read
+        # from the cache while their snapshots are unchanged.
+        fields = self._edit_fields(target_id)
+        source = self._get_playlist_tracks(source_id, fields)
+        return self.update_playlist_contents(target_id, synced_uris(source.uris), fields, donors=[source])
+    
+    def _resolve_job_playlists(self, job):
+        selection = job.get('playlists', 'all')
+        if selection == 'all':
+            return self.get_user_playlists(job.get('include_collaborative', False))
+        
+        playlists = []
+        by_name = None
+        for entry in selection:
+            if isinstance(entry, str):
+                playlists.append({'id': entry, 'name': None})
+                continue
+            if by_name is None:
+                by_name = {playlist['name']: playlist for playlist in self.get_user_playlists(True)}
+            if entry.get('name') not in by_name:
+                raise ValueError(f"No playlist named {entry.get('name')!r}")
+            playlists.append(by_name[entry['name']])
+        return playlists
+    
+    def _run_job_playlist(self, playlist_id, operations, dry_run, results):
+        # The first group fetches the union of every operation's fields; later groups find the
+        # table in the memo (kept current across our own edits), so each costs one snapshot check.
+        # Finished operations are appended to `results` as they complete.
+        fields = {'uri'}
+        kinds = set()
+        for operation in operations:
+            fields.update(JOB_OPERATIONS[operation['op']][1])
+            if operation['op'] == 'remove':
+                kinds |= compile_criteria(**operation['criteria']).enrichments()
+        fields |= enrichment_fields(kinds)
+        
+        groups = group_job_operations(operations)
+        if groups[0][0] == 'backup':
+            self._scan_playlist(playlist_id, fields)
+        
+        for kind, group in groups:
+            if kind == 'read':
+                consumers = []
+                for operation in group:
+                    if operation['op'] == 'stats':
+                        consumers.append(StatsConsumer())
+                        continue
+                    format = operation.get('format', 'json')
+                    compression = operation.get('compression')
+                    template = operation.get('filename') or os.path.join(
+                        operation.get('directory', '.'),
+                        '{name}_{id}' + EXPORT_FORMATS[format] + EXPORT_COMPRESSIONS[compression]
+                    )
+                    consumers.append(TemplateExportConsumer(template, playlist_id, format, compression))
+                
+                try:
+                    self._get_playlist_tracks(playlist_id, fields, consumers)
+                except Exception:
+                    for consumer in consumers:
+                        consumer.abort()
+                    raise
+                for operation, consumer in zip(group, consumers):
+                    results.append({'op': operation['op'], 'result': consumer.result()})
             
-            # Count albums
-            album_name = track['album']['name']
-            albums[album_name] = albums.get(album_name, 0) + 1
+            elif kind == 'write':
+                # One edit for the whole run of removals, reported on its last operation
+                matched = [0] * len(group)
+                
+                def desired(tracks):
+                    self._enrich(tracks, kinds)
+                    drop = set()
+                    for i, operation in enumerate(group):
+                        rows = job_removal_rows(operation, tracks)
+                        matched[i] = len(rows)
+                        drop.update(rows)
+                    return [uri for row, uri in enumerate(tracks.uris) if row not in drop]
+                
+                if dry_run:
+                    tracks = self._get_playlist_tracks(playlist_id, fields)
+                    edit = {'removed': len(tracks) - len(desired(tracks)), 'dry_run': True}
+                else:
+                    edit = self.update_playlist_contents(playlist_id, desired, fields)
+                for operation, count in zip(group, matched):
+                    results.append({'op': operation['op'], 'result': {'matched': count}})
+                results[-1]['result']['edit'] = edit
             
-            # Count years
+            elif dry_run:
+                results.append({'op': 'backup', 'result': {'dry_run': True}})
+            else:
+                backup_id, backup_name = self.duplicate_playlist(playlist_id, group[0].get('suffix', '_backup'))
+                results.append({'op': 'backup', 'result': {'backup_id': backup_id, 'backup_name': backup_name}})
+    
+    @instrumented
+    def run_job(self, job, workers=None, dry_run=None):
+        # Run a job (see load_job_file) over its playlists on a worker pool and return a
+        # JSON-serializable report. A failing playlist is reported in its entry, with the
+        # operations it finished, and doesn't stop the others.
+        validate_job(job)
+        workers = workers or job.get('workers', 4)
+        dry_run = job.get('dry_run', False) if dry_run is None else dry_run
+        started = datetime.now()
+        start = time.monotonic()
+        playlists = self._resolve_job_playlists(job)
+        
+        def run_one(playlist):
+            entry = {'playlist_id': playlist['id'], 'name': playlist['name'], 'status': 'ok', 'operations': []}
+            playlist_start = time.monotonic()
             try:
-                year = track['album']['release_date'][:4]
-                years[year] = years.get(year, 0) + 1
-            except:
-                pass
+                self._run_job_playlist(playlist['id'], job['operations'], dry_run, entry['operations'])
+            except Exception as e:
+                entry['status'] = 'error'
+                entry['error'] = str(e)
+            entry['seconds'] = time.monotonic() - playlist_start
+            return entry
+        
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            entries = list(self._wait_for(executor.map(run_one, playlists)))
         
         return {
-            'total_tracks': len(tracks),
-            'total_duration_hours': total_duration / (1000 * 60 * 60),
-            'top_artists': sorted(artists.items(), key=lambda x: x[1], reverse=True)[:10],
-            'top_albums': sorted(albums.items(), key=lambda x: x[1], reverse=True)[:10],
-            'year_distribution': sorted(years.items(), key=lambda x: x[0], reverse=True)[:10]
+            'started': started.isoformat(),
+            'seconds': time.monotonic() - start,
+            'dry_run': dry_run,
+            'summary': {
+                'playlists': len(entries),
+                'failed': sum(entry['status'] != 'ok' for entry in entries),
+                'removed': sum(
+                    op['result']['edit']['removed']
+                    for entry in entries for op in entry['operations'] if 'edit' in op['result']
+                )
+            },
+            'playlists': entries,
+            'throughput': self.get_throughput()
         }
+
+
+# Path segments naming one playlist or user, folded out of the endpoint names requests are
+# instrumented under
+ENDPOINT_ID_PATTERN = re.compile(r"(?<=^playlists/)[^/]+|(?<=^users/)[^/]+")
+
+
+class AsyncSpotifyPlaylistManager:
+    # Asyncio counterpart of SpotifyPlaylistManager on a pooled aiohttp session. It shares the
+    # OAuth token cache, track cache, rate limiting and pipeline consumers with the sync manager.
+    # Use it as an async context manager (or call close()) to release the connection pool.
+    def __init__(self, client_id, client_secret, redirect_uri, cache_path=".playlist_cache.sqlite",
+                 max_concurrency=8, connection_limit=20, max_retries=5, api_url=SPOTIFY_API_URL,
+                 journal_path=".playlist_backups.sqlite", auth_manager=None, rate_limit=20.0):
+        load_spotipy()
+        self.auth_manager = auth_manager or make_auth_manager(client_id, client_secret, redirect_uri)
+        self.api_url = api_url
+        self.rate_limiter = RateLimiter(rate_limit)
+        self.instruments = Instrumentation()
+        self.max_retries = max_retries
+        self.max_concurrency = max_concurrency
+        self.connection_limit = connection_limit
+        self.cache = TrackCache(cache_path)
+        self.journal = BackupJournal(journal_path)
+        self.tables = TableMemo()
+        self.session = None
+        self.user_id = None
+        self._semaphore = None
+        self._token = None
+        self._token_expires = 0.0
+        self._token_lock = None
     
-    def find_duplicates(self, playlist_id):
-        tracks = []
-        results = self.sp.playlist_tracks(playlist_id, limit=100)
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+    
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+    
+    def _get_session(self):
+        if self.session is None:
+            try:
+                import aiohttp
+            except ImportError as e:
+                raise ImportError("AsyncSpotifyPlaylistManager needs the 'aiohttp' package (pip install aiohttp)") from e
+            
+            self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.connection_limit))
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._token_lock = asyncio.Lock()
+        return self.session
+    
+    async def _get_token(self):
+        # The token is kept until a minute before it expires, then refreshed by one caller
+        # while the others wait for it. Refreshes go through spotipy's blocking cache, so they
+        # run off the loop.
+        if self._token is None or time.time() >= self._token_expires:
+            async with self._token_lock:
+                if self._token is None or time.time() >= self._token_expires:
+                    self._token, self._token_expires = await asyncio.to_thread(self._fetch_token)
+        return self._token
+    
+    def _fetch_token(self):
+        # Auth managers without spotipy's token cache (e.g. benchmark.py's) are asked again
+        # every TOKEN_FALLBACK_TTL seconds
+        token = self.auth_manager.get_access_token(as_dict=False)
+        cache_handler = getattr(self.auth_manager, 'cache_handler', None)
+        cached = cache_handler.get_cached_token() if cache_handler is not None else None
+        if cached and cached.get('access_token') == token and 'expires_at' in cached:
+            return token, cached['expires_at'] - 60
+        return token, time.time() + TOKEN_FALLBACK_TTL
+    
+    async def _call(self, kind, count, method, path, params=None, payload=None):
+        # Same retry and accounting rules as SpotifyPlaylistManager._call; connection errors
+        # and timeouts are retried like server errors
+        import aiohttp
+        session = self._get_session()
+        endpoint = f"{method} {ENDPOINT_ID_PATTERN.sub('{id}', path)}"
         
-        while results:
-            for item in results['items']:
-                if item['track']:
-                    tracks.append({
-                        'uri': item['track']['uri'],
-                        'name': item['track']['name'],
-                        'artists': [a['name'] for a in item['track']['artists']],
-                        'key': f"{item['track']['name']}_{item['track']['artists'][0]['name']}"
-                    })
-            
-            if results['next']:
-                results = self.sp.next(results)
+        for attempt in range(self.max_retries + 1):
+            token = await self._get_token()
+            
+            async with self._semaphore:
+                waited = await self.rate_limiter.acquire_async()
+                start = time.monotonic()
+                
+                try:
+                    async with session.request(
+                        method,
+                        self.api_url + path,
+                        params=params,
+                        json=payload,
+                        headers={'Authorization': f"Bearer {token}"}
+                    ) as response:
+                        status = response.status
+                        headers = response.headers
+                        data = await response.read()
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    self.instruments.record_request(endpoint, kind, 0, time.monotonic() - start, waited, 0, attempt)
+                    if attempt == self.max_retries:
+                        raise
+                    self.rate_limiter.on_error(attempt)
+                    continue
+                
+                elapsed = time.monotonic() - start
+            
+            try:
+                body = json.loads(data) if data else None
+            except ValueError:
+                # e.g. an HTML error page from a proxy in front of the API
+                body = None
+            
+            if status < 400:
+                if count is None:
+                    count = len(body.get('items') or []) if isinstance(body, dict) else 0
+                self.rate_limiter.on_success()
+                self.instruments.record_request(endpoint, kind, status, elapsed, waited, len(data), attempt, count)
+                return body
+            
+            self.instruments.record_request(endpoint, kind, status, elapsed, waited, len(data), attempt)
+            if status == 401 and self._token == token:
+                # Revoked or expired early; the next call fetches a fresh one
+                self._token = None
+            if not (status == 429 or status >= 500) or attempt == self.max_retries:
+                message = (body or {}).get('error', {}).get('message', '') if isinstance(body, dict) else ''
+                raise SpotifyException(status, -1, f"{path}:\n {message}", headers=headers)
+            
+            if status == 429:
+                self.rate_limiter.on_throttle(float(headers.get('Retry-After', 1)))
             else:
-                break
+                self.rate_limiter.on_error(attempt)
+    
+    def get_throughput(self):
+        return self.instruments.throughput()
+    
+    def get_instrumentation(self):
+        return self.instruments.snapshot()
+    
+    async def get_user_id(self):
+        # Resolved on first use instead of in the constructor, which can't await
+        if self.user_id is None:
+            self.user_id = (await self._call('read', None, 'GET', 'me'))['id']
+        return self.user_id
+    
+    async def _iter_pages(self, path, limit, params=None):
+        # Async generator over pages in order. After the first, a window of twice the
+        # concurrency is requested ahead and topped up as each page is handed on; the semaphore
+        # bounds how many are actually in flight.
+        params = dict(params or {})
+        first = await self._call('read', None, 'GET', path, {**params, 'limit': limit, 'offset': 0})
+        yield first
         
-        # Find duplicates
-        seen = {}
-        duplicates = []
+        offsets = iter(range(limit, first['total'], limit))
         
-        for track in tracks:
-            key = track['key'].lower()
-            if key in seen:
-                duplicates.append(track)
-            else:
-                seen[key] = track
+        def fetch(offset):
+            return asyncio.ensure_future(self._call('read', None, 'GET', path, {**params, 'limit': limit, 'offset': offset}))
+        
+        tasks = deque(fetch(offset) for offset in islice(offsets, 2 * self.max_concurrency))
+        try:
+            while tasks:
+                page = await tasks.popleft()
+                for offset in islice(offsets, 1):
+                    tasks.append(fetch(offset))
+                yield page
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    async def map_playlists(self, fn, playlist_ids, concurrency=4):
+        # Run an async per-playlist operation over many playlists, at most `concurrency` at a time
+        semaphore = asyncio.Semaphore(concurrency)
         
-        return duplicates
+        async def run(playlist_id):
+            async with semaphore:
+                return await fn(playlist_id)
+        
+        return await asyncio.gather(*(run(playlist_id) for playlist_id in playlist_ids))
+    
+    async def _get_playlist_tracks(self, playlist_id, fields, consumers=(), keep=True):
+        return (await self._scan_playlist(playlist_id, fields, consumers, keep))[1]
     
-    def export_playlist(self, playlist_id, filename=None):
-        playlist_info = self.sp.playlist(playlist_id)
+    async def _scan_playlist(self, playlist_id, fields, consumers=(), keep=True, playlist_info=None):
+        # Mirrors SpotifyPlaylistManager._scan_playlist
+        if playlist_info is None:
+            playlist_info = await self._call(
+                'read', None, 'GET', f"playlists/{playlist_id}", {'fields': PLAYLIST_INFO_FIELDS}
+            )
+        snapshot_id = playlist_info['snapshot_id']
+        for consumer in consumers:
+            consumer.start(playlist_info)
         
-        if not filename:
-            safe_name = "".join(c for c in playlist_info['name'] if c.isalnum() or c in (' ', '-', '_')).rstrip()
-            filename = f"{safe_name}_export.json"
+        tracks = self.tables.get(playlist_id, snapshot_id, fields)
+        if tracks is None:
+            cached_fields, cached_snapshot = await asyncio.to_thread(
+                lambda: (self.cache.get_fields(playlist_id), self.cache.get_snapshot(playlist_id))
+            )
+            if cached_snapshot == snapshot_id and set(fields) <= cached_fields:
+                tracks = await asyncio.to_thread(self.cache.load, playlist_id)
+                self.tables.put(playlist_id, snapshot_id, cached_fields, tracks)
         
-        tracks = []
-        results = self.sp.playlist_tracks(playlist_id, limit=100)
+        if tracks is not None:
+            for consumer in consumers:
+                consumer.consume(tracks, 0)
+            return playlist_info, tracks
         
-        while results:
+        fields = set(fields) | cached_fields | {'uri'}
+        tracks = TrackTable()
+        offset = position = 0
+        
+        async for results in self._iter_pages(
+            f"playlists/{playlist_id}/tracks", 100,
+            {'fields': playlist_tracks_filter(fields), 'additional_types': 'track,episode'}
+        ):
+            page = TrackTable(tracks.pools())
             for item in results['items']:
                 if item['track']:
-                    track = item['track']
-                    tracks.append({
-                        'name': track['name'],
-                        'artists': [a['name'] for a in track['artists']],
-                        'album': track['album']['name'],
-                        'release_date': track['album']['release_date'],
-                        'duration_ms': track['duration_ms'],
-                        'uri': track['uri'],
-                        'external_urls': track['external_urls']
-                    })
-            
-            if results['next']:
-                results = self.sp.next(results)
+                    page.append(normalize_track(item['track']))
+                else:
+                    tracks.gaps.append(position)
+                position += 1
+            
+            for consumer in consumers:
+                consumer.consume(page, offset)
+            offset += len(page)
+            if keep:
+                tracks.extend(page)
+        
+        if not keep:
+            return playlist_info, None
+        
+        await asyncio.to_thread(self.cache.store, playlist_id, snapshot_id, tracks, fields)
+        self.tables.put(playlist_id, snapshot_id, fields, tracks)
+        return playlist_info, tracks
+    
+    async def get_user_playlists(self, include_collaborative=False):
+        user_id = await self.get_user_id()
+        playlists = []
+        
+        async for results in self._iter_pages('me/playlists', 50):
+            for playlist in results['items']:
+                if playlist['owner']['id'] == user_id or include_collaborative:
+                    playlists.append(summarize_playlist(playlist))
+        
+        return playlists
+    
+    async def _enrich(self, tracks, kinds):
+        # Mirrors SpotifyPlaylistManager._enrich; the semaphore in _call bounds the batches in flight
+        for kind in kinds:
+            known = tracks.enrichment[kind]
+            ids = [item_id for item_id in enrichment_ids(tracks, kind) if item_id not in known]
+            found = await asyncio.to_thread(self.cache.load_enrichment, kind, ids)
+            missing = [item_id for item_id in ids if item_id not in found]
+            path, size, key = ENRICHMENT_ENDPOINTS[kind]
+            
+            async def fetch_batch(batch):
+                result = await self._call('read', len(batch), 'GET', path, {'ids': ','.join(batch)})
+                values = parse_enrichment(kind, batch, result[key])
+                await asyncio.to_thread(self.cache.store_enrichment, kind, values)
+                return values
+            
+            for values in await asyncio.gather(*(fetch_batch(batch) for batch in iter_batches(missing, size))):
+                found.update(values)
+            known.update(found)
+    
+    async def search_tracks_by_criteria(self, playlist_id, query=None, **criteria):
+        query = compile_criteria(query, **criteria)
+        kinds = query.enrichments()
+        fields = {'uri', 'name', 'artists', 'album', 'release_date', 'duration_ms', 'popularity'}
+        tracks = await self._get_playlist_tracks(playlist_id, fields | enrichment_fields(kinds))
+        await self._enrich(tracks, kinds)
+        
+        rows = query.select(tracks.get_index())
+        matches = [i for i in sorted(rows) if tracks.artist_offsets[i + 1] > tracks.artist_offsets[i]]
+        
+        return tracks.take(matches)
+    
+    async def _apply_plan(self, playlist_id, snapshot_id, ops):
+        path = f"playlists/{playlist_id}/tracks"
+        
+        for op in ops:
+            if op['op'] == 'remove':
+                result = await self._call(
+                    'write', sum(len(item['positions']) for item in op['items']), 'DELETE', path,
+                    payload={'tracks': op['items'], 'snapshot_id': snapshot_id}
+                )
+            elif op['op'] == 'reorder':
+                result = await self._call(
+                    'write', op['range_length'], 'PUT', path,
+                    payload={
+                        'range_start': op['range_start'],
+                        'insert_before': op['insert_before'],
+                        'range_length': op['range_length'],
+                        'snapshot_id': snapshot_id
+                    }
+                )
             else:
-                break
+                result = await self._call(
+                    'write', len(op['uris']), 'POST', path,
+                    payload={'uris': op['uris'], 'position': op['position']}
+                )
+            snapshot_id = result['snapshot_id']
         
-        export_data = {
-            'playlist_name': playlist_info['name'],
-            'description': playlist_info['description'],
-            'total_tracks': len(tracks),
-            'export_date': datetime.now().isoformat(),
-            'tracks': tracks
-        }
+        return snapshot_id
+    
+    async def update_playlist_contents(self, playlist_id, desired, fields=('uri',), max_conflicts=3, donors=()):
+        # Mirrors SpotifyPlaylistManager.update_playlist_contents
+        for attempt in range(max_conflicts + 1):
+            playlist_info, tracks = await self._scan_playlist(playlist_id, fields)
+            uris = desired(tracks) if callable(desired) else list(desired)
+            ops = plan_playlist_changes(tracks.uris, uris)
+            if not ops:
+                return summarize_plan(ops)
+            # Planned over the available tracks; unavailable items stay where they are
+            sent, gaps = spread_plan(ops, len(tracks), tracks.gaps)
+            
+            try:
+                snapshot_id = await self._apply_plan(playlist_id, playlist_info['snapshot_id'], sent)
+            except SpotifyException as e:
+                if not is_edit_conflict(e) or attempt == max_conflicts:
+                    raise
+                continue
+            
+            new_tracks = rebuild_table(tracks, uris, donors)
+            if new_tracks is None:
+                await asyncio.to_thread(self.cache.invalidate, playlist_id)
+            else:
+                new_tracks.gaps = gaps
+                cached_fields = await asyncio.to_thread(self.cache.get_fields, playlist_id)
+                await asyncio.to_thread(
+                    self.cache.apply_edit, playlist_id, playlist_info['snapshot_id'], snapshot_id, tracks, new_tracks, sent
+                )
+                self.tables.put(playlist_id, snapshot_id, cached_fields, new_tracks)
+                await asyncio.to_thread(
+                    self.cache.carry_stats, playlist_id, playlist_info['snapshot_id'], snapshot_id, tracks, ops, new_tracks
+                )
+            
+            return summarize_plan(ops)
+    
+    async def remove_tracks_from_playlist(self, playlist_id, track_uris):
+        uris = set(track_uris)
+        return await self.update_playlist_contents(
+            playlist_id, lambda tracks: [u for u in tracks.uris if u not in uris]
+        )
+    
+    async def remove_duplicates(self, playlist_id):
+        return await self.update_playlist_contents(playlist_id, keep_first_occurrences, DuplicateConsumer.fields)
+    
+    async def _copy_to_playlist(self, source, source_snapshot, name, description, uris):
+        # Mirrors SpotifyPlaylistManager._copy_to_playlist
+        uris = (uri for uri in uris if not uri.startswith('spotify:local:'))
+        job = await asyncio.to_thread(self.journal.find, source)
+        if job is None:
+            new_playlist = await self._call(
+                'write', 1, 'POST', f"users/{await self.get_user_id()}/playlists",
+                payload={'name': name, 'public': False, 'description': description}
+            )
+            job = await asyncio.to_thread(self.journal.start, source, source_snapshot, new_playlist['id'], name)
+            committed = 0
+        else:
+            target_info = await self._call(
+                'read', None, 'GET', f"playlists/{job['target_id']}", {'fields': 'tracks.total'}
+            )
+            committed = await asyncio.to_thread(self.journal.recover, job, target_info['tracks']['total'])
+            if committed is None or job['source_snapshot'] != source_snapshot:
+                await self.update_playlist_contents(job['target_id'], list(uris))
+                await asyncio.to_thread(self.journal.finish, job['job_id'])
+                return job, None
+        
+        snapshot_id = None
+        for batch in iter_batches(islice(uris, committed, None), 100):
+            await asyncio.to_thread(self.journal.begin_batch, job['job_id'], len(batch))
+            result = await self._call(
+                'write', len(batch), 'POST', f"playlists/{job['target_id']}/tracks", payload={'uris': batch}
+            )
+            snapshot_id = result['snapshot_id']
+            committed += len(batch)
+            await asyncio.to_thread(self.journal.commit_batch, job['job_id'], committed)
+        
+        await asyncio.to_thread(self.journal.finish, job['job_id'])
+        job['committed'] = committed
+        return job, snapshot_id
+    
+    async def duplicate_playlist(self, playlist_id, new_name_suffix="_backup"):
+        playlist_info, tracks = await self._scan_playlist(playlist_id, ['uri'])
+        new_name = playlist_info['name'] + new_name_suffix
+        description = f"Backup of {playlist_info['name']} created on {datetime.now().strftime('%Y-%m-%d')}"
+        
+        job, snapshot_id = await self._copy_to_playlist(
+            f"playlist:{playlist_id}", playlist_info['snapshot_id'], new_name, description, tracks.uris
+        )
+        
+        if snapshot_id and job['committed'] == len(tracks) == playlist_info['tracks']['total']:
+            fields = await asyncio.to_thread(self.cache.get_fields, playlist_id)
+            await asyncio.to_thread(self.cache.store, job['target_id'], snapshot_id, tracks, fields)
+            stats = await asyncio.to_thread(self.cache.load_stats, playlist_id, playlist_info['snapshot_id'])
+            if stats is not None:
+                await asyncio.to_thread(self.cache.store_stats, job['target_id'], snapshot_id, stats)
+        
+        return job['target_id'], job['target_name']
+    
+    async def restore_playlist(self, filename, name=None):
+        # Reading the file is blocking, but it is local and streamed batch by batch
+        playlist_name, description, uris = read_export_file(filename)
+        source, source_snapshot = export_file_source(filename)
+        description = description or f"Restored from {os.path.basename(filename)} on {datetime.now().strftime('%Y-%m-%d')}"
+        
+        job, _ = await self._copy_to_playlist(source, source_snapshot, name or playlist_name, description, uris)
+        return job['target_id'], job['target_name']
+    
+    async def backup_playlists(self, playlists=None, new_name_suffix="_backup", concurrency=4):
+        if playlists is None:
+            playlists = await self.get_user_playlists()
+        
+        async def backup_one(playlist_id):
+            try:
+                backup_id, backup_name = await self.duplicate_playlist(playlist_id, new_name_suffix)
+                return {'playlist_id': playlist_id, 'backup_id': backup_id, 'backup_name': backup_name}
+            except Exception as e:
+                return {'playlist_id': playlist_id, 'error': str(e)}
+        
+        return await self.map_playlists(backup_one, [playlist['id'] for playlist in playlists], concurrency)
+    
+    async def run_pipeline(self, playlist_id, consumers, keep=True, playlist_info=None):
+        fields = set()
+        for consumer in consumers:
+            fields.update(consumer.fields)
+        
+        try:
+            await self._scan_playlist(playlist_id, fields, consumers, keep, playlist_info)
+        except Exception:
+            for consumer in consumers:
+                consumer.abort()
+            raise
+        
+        return {consumer.name: consumer.result() for consumer in consumers}
+    
+    async def get_playlist_stats(self, playlist_id):
+        playlist_info = await self._call(
+            'read', None, 'GET', f"playlists/{playlist_id}", {'fields': PLAYLIST_INFO_FIELDS}
+        )
+        stats = await asyncio.to_thread(self.cache.load_stats, playlist_id, playlist_info['snapshot_id'])
+        if stats is None:
+            consumer = StatsConsumer()
+            await self.run_pipeline(playlist_id, [consumer], playlist_info=playlist_info)
+            stats = consumer.stats
+            await asyncio.to_thread(self.cache.store_stats, playlist_id, consumer.snapshot_id, stats)
+        return stats.result()
+    
+    async def find_duplicates(self, playlist_id):
+        return (await self.run_pipeline(playlist_id, [DuplicateConsumer()]))['duplicates']
+    
+    async def export_playlist(self, playlist_id, filename=None, format='json', compression=None, keep=True):
+        consumer = ExportConsumer(filename, format, compression)
+        return (await self.run_pipeline(playlist_id, [consumer], keep))['export']
+    
+    async def find_library_duplicates(self, playlists=None, include_collaborative=False, concurrency=4):
+        if playlists is None:
+            playlists = await self.get_user_playlists(include_collaborative)
+        
+        fields = ['uri', 'name', 'artists', 'isrc']
+        tables = await self.map_playlists(
+            lambda playlist_id: self._get_playlist_tracks(playlist_id, fields),
+            [playlist['id'] for playlist in playlists],
+            concurrency
+        )
+        
+        names = {playlist['id']: playlist['name'] for playlist in playlists}
+        clusters = cluster_duplicates([(p['id'], tracks) for p, tracks in zip(playlists, tables)])
+        for cluster in clusters:
+            for entry in cluster:
+                entry['playlist_name'] = names[entry['playlist_id']]
         
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(export_data, f, indent=2, ensure_ascii=False)
+        return clusters
+    
+    async def diff_playlists(self, source_id, target_id):
+        source, target = await asyncio.gather(
+            self._get_playlist_tracks(source_id, ['uri']), self._get_playlist_tracks(target_id, ['uri'])
+        )
         
-        return filename
+        diff = diff_uris(source.uris, target.uris)
+        diff['in_order'] = source.uris == target.uris
+        diff['edits'] = summarize_plan(plan_playlist_changes(target.uris, synced_uris(source.uris)))
+        return diff
+    
+    async def merge_playlists(self, target_id, source_ids, dedupe=True, concurrency=4):
+        fields = sorted(await asyncio.to_thread(self.cache.get_fields, target_id) | {'uri'})
+        sources = await self.map_playlists(
+            lambda playlist_id: self._get_playlist_tracks(playlist_id, fields), source_ids, concurrency
+        )
+        return await self.update_playlist_contents(
+            target_id, lambda tracks: merged_uris(tracks.uris, [source.uris for source in sources], dedupe),
+            fields, donors=sources
+        )
+    
+    async def sync_playlist(self, source_id, target_id):
+        fields = sorted(await asyncio.to_thread(self.cache.get_fields, target_id) | {'uri'})
+        source = await self._get_playlist_tracks(source_id, fields)
+        return await self.update_playlist_contents(target_id, synced_uris(source.uris), fields, donors=[source])
 
 
-def main():
+def main(argv=None):
     CLIENT_ID = "REPLACE WITH YOUR CLIENT ID"
     CLIENT_SECRET = "REPLACE WITH YOUR CLIENT SECRET"
     REDIRECT_URI = "REPLACE WITH YOUR REDIRECT URI"
     
+    parser = argparse.ArgumentParser(description="Interactive Spotify playlist manager")
+    parser.add_argument('--profile', action='store_true',
+                        help="print a per-method and per-endpoint time breakdown after each action")
+    parser.add_argument('--profile-json', metavar='FILE',
+                        help="with --profile, also write the full instrumentation snapshot to FILE")
+    parser.add_argument('--job', metavar='FILE', help="run a JSON/YAML job file non-interactively instead of the menu")
+    parser.add_argument('--report', metavar='FILE', help="with --job, write the result report here instead of stdout")
+    parser.add_argument('--workers', type=int, help="with --job, playlists processed at once (default: the job's, or 4)")
+    parser.add_argument('--dry-run', action='store_true', help="with --job, report what would change without editing")
+    args = parser.parse_args(argv)
+    
     manager = SpotifyPlaylistManager(CLIENT_ID, CLIENT_SECRET, REDIRECT_URI)
     
+    if args.job:
+        report = manager.run_job(load_job_file(args.job), args.workers, args.dry_run or None)
+        if args.report:
+            with open(args.report, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+        else:
+            print(json.dumps(report, indent=2))
+        if args.profile:
+            print(manager.instruments.format_report(), file=sys.stderr)
+        if report['summary']['failed']:
+            raise SystemExit(1)
+        return
+    
     while True:
+        # Recording restarts once an option is chosen, so this covers the action that just
+        # finished and not the background refresh below (unless the action waited on it)
+        if args.profile and (manager.instruments.endpoints or manager.instruments.methods):
+            print("\n=== Profile ===")
+            print(manager.instruments.format_report())
+            if args.profile_json:
+                with open(args.profile_json, 'w', encoding='utf-8') as f:
+                    f.write(manager.instruments.to_json())
+        
+        # Connects, resolves the user and revalidates a stale playlist listing while the user reads the menu
+        manager.refresh_user_playlists_in_background()
+        
         print("\n=== Spotify Playlist Manager ===")
         print("1. Remove tracks by artist")
         print("2. Remove tracks by album")
@@ -289,21 +3515,33 @@ def main():
         print("7. Show playlist statistics")
         print("8. Export playlist to JSON")
         print("9. Advanced search and remove")
+        print("10. Restore playlist from export file")
+        print("11. Sync or merge into another playlist")
         print("0. Exit")
         
         choice = input("\nSelect an option: ").strip()
+        manager.instruments.reset()
         
         if choice == "0":
             print("Goodbye!")
             break
         
-        # Show playlists
-        print("\nYour playlists:")
-        playlists = manager.get_user_playlists()
-        for i, playlist in enumerate(playlists, 1):
-            print(f"{i}. {playlist['name']} ({playlist['track_count']} tracks)")
+        if choice == "10":
+            filename = input("Export file to restore: ").strip()
+            try:
+                restored_id, restored_name = manager.restore_playlist(filename)
+                print(f"Restored playlist: {restored_name}")
+            except Exception as e:
+                print(f"An error occurred: {e}")
+            continue
         
         try:
+            # Show playlists
+            print("\nYour playlists:")
+            playlists = manager.get_user_playlists()
+            for i, playlist in enumerate(playlists, 1):
+                print(f"{i}. {playlist['name']} ({playlist['track_count']} tracks)")
+            
             playlist_num = int(input("\nSelect playlist number: ")) - 1
             if playlist_num < 0 or playlist_num >= len(playlists):
                 print("Invalid playlist number!")
@@ -403,9 +3641,8 @@ def main():
                         print(f"  ... and {len(duplicates) - 10} more")
                     
                     if input("Remove duplicates? (y/n): ").lower() == 'y':
-                        track_uris = [track['uri'] for track in duplicates]
-                        manager.remove_tracks_from_playlist(playlist_id, track_uris)
-                        print(f"Removed {len(duplicates)} duplicate tracks!")
+                        result = manager.remove_duplicates(playlist_id)
+                        print(f"Removed {result['removed']} duplicate tracks!")
                 else:
                     print("No duplicates found!")
             
@@ -455,6 +3692,19 @@ def main():
                         print("Invalid year range format!")
                         continue
                 
+                genre = input("Artist genre (or press Enter to skip): ").strip()
+                if genre:
+                    criteria['genre'] = genre
+                
+                tempo_input = input("Tempo range in BPM (e.g., '120-130' or press Enter to skip): ").strip()
+                if tempo_input and '-' in tempo_input:
+                    try:
+                        tempo_min, tempo_max = map(float, tempo_input.split('-'))
+                        criteria['tempo_range'] = (tempo_min, tempo_max)
+                    except ValueError:
+                        print("Invalid tempo range format!")
+                        continue
+                
                 if criteria:
                     tracks = manager.search_tracks_by_criteria(playlist_id, **criteria)
                     if tracks:
@@ -472,6 +3722,31 @@ def main():
                         print("No tracks found matching criteria.")
                 else:
                     print("No search criteria provided!")
+            
+            elif choice == "11":
+                target_num = int(input("Target playlist number: ")) - 1
+                if target_num < 0 or target_num >= len(playlists) or target_num == playlist_num:
+                    print("Invalid playlist number!")
+                    continue
+                
+                target_id = playlists[target_num]['id']
+                diff = manager.diff_playlists(playlist_id, target_id)
+                if diff['in_order']:
+                    print("Both playlists already hold the same tracks in the same order.")
+                    continue
+                
+                print(f"\n{len(diff['only_in_source'])} tracks only in {selected_playlist['name']}, "
+                      f"{len(diff['only_in_target'])} only in {playlists[target_num]['name']}, "
+                      f"{diff['common']} shared")
+                action = input("Sync target to match, merge missing tracks into it, or neither? (s/m/n): ").lower()
+                if action == 's':
+                    summary = manager.sync_playlist(playlist_id, target_id)
+                elif action == 'm':
+                    summary = manager.merge_playlists(target_id, [playlist_id])
+                else:
+                    continue
+                print(f"Added {summary['added']}, removed {summary['removed']}, moved {summary['moved']} "
+                      f"in {summary['calls']} requests.")
         
         except (ValueError, IndexError):
             print("Invalid input! Please try again.")
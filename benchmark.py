@@ -0,0 +1,762 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import platform
+import random
+import re
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from array import array
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import app
+
+# Offline benchmarks for the playlist managers. A stand-in for the Spotify Web API runs in a
+# child process (so its own allocations stay out of tracemalloc) and serves synthetic
+# playlists with real paging limits, fields filtering, snapshot ids, optional latency and
+# injected 429s. Each benchmark gets a fresh copy of the library and an empty local cache.
+#
+#   python benchmark.py --sizes 1000,10000 --output results.json
+#   python benchmark.py --sizes 100000 --latency 0.05 --throttle 0.02 --compare results.json
+
+
+# --- synthetic library ---
+
+def mix(n, salt):
+    # Cheap deterministic hash, so a track's metadata never has to be stored
+    n = (n * 2654435761 + salt * 40503) & 0xFFFFFFFF
+    n ^= n >> 15
+    return (n * 2246822519) & 0xFFFFFFFF
+
+
+def track_id(n):
+    return f"bench{n:017d}"
+
+
+def track_number(track_uri):
+    return int(track_uri.rsplit(':', 1)[1][len('bench'):])
+
+
+def make_track(n):
+    # Titles and ISRCs repeat across some tracks so duplicate detection has work to do
+    title = f"Song {mix(n, 1) % 5000}"
+    if mix(n, 2) % 20 == 0:
+        title += " - Remastered 2011"
+    artists = [mix(n, 3) % 2000] + ([mix(n, 4) % 2000] if mix(n, 5) % 4 == 0 else [])
+    album = mix(n, 6) % 8000
+    tid = track_id(n)
+    return {
+        'album': {
+            'id': f"album{album}",
+            'name': f"Album {album}",
+            'release_date': f"{1960 + mix(album, 7) % 65}-{1 + mix(album, 8) % 12:02d}-01",
+            'release_date_precision': 'day',
+            'album_type': 'album',
+            'total_tracks': 12
+        },
+        'artists': [{'id': f"artist{a}", 'name': f"Artist {a}", 'type': 'artist', 'uri': f"spotify:artist:artist{a}"}
+                    for a in artists],
+        'disc_number': 1,
+        'duration_ms': 60000 + mix(n, 9) % 340000,
+        'explicit': False,
+        'external_ids': {'isrc': f"BENCH{mix(n, 10) % 900000:07d}"},
+        'external_urls': {'spotify': f"https://open.spotify.com/track/{tid}"},
+        'id': tid,
+        'is_local': False,
+        'name': title,
+        'popularity': mix(n, 11) % 101,
+        'track_number': 1 + mix(n, 12) % 12,
+        'type': 'track',
+        'uri': f"spotify:track:{tid}"
+    }
+
+
+GENRES = ['rock', 'indie rock', 'pop', 'dance pop', 'hip hop', 'jazz', 'classical', 'house', 'techno', 'folk']
+
+
+def make_audio_features(n):
+    tid = track_id(n)
+    return {
+        'id': tid,
+        'uri': f"spotify:track:{tid}",
+        'type': 'audio_features',
+        'tempo': 60 + mix(n, 13) % 12000 / 100,
+        'energy': mix(n, 14) % 1000 / 1000,
+        'danceability': mix(n, 15) % 1000 / 1000,
+        'valence': mix(n, 16) % 1000 / 1000,
+        'acousticness': mix(n, 17) % 1000 / 1000,
+        'instrumentalness': mix(n, 18) % 1000 / 1000,
+        'loudness': -(mix(n, 19) % 3000) / 100,
+        'key': mix(n, 20) % 12,
+        'mode': mix(n, 21) % 2,
+        'duration_ms': 60000 + mix(n, 9) % 340000
+    }
+
+
+def make_artist(a):
+    genres = [GENRES[mix(a, 22) % len(GENRES)]] + ([GENRES[mix(a, 23) % len(GENRES)]] if mix(a, 24) % 2 else [])
+    return {'id': f"artist{a}", 'name': f"Artist {a}", 'genres': sorted(set(genres)), 'popularity': mix(a, 25) % 101,
+            'type': 'artist', 'uri': f"spotify:artist:artist{a}"}
+
+
+def make_library(size, playlists):
+    # One main playlist of `size` tracks (about 2% repeats and a few unavailable items, which
+    # are stored as negative numbers), one half its size overlapping it, and small playlists
+    # to fill out the user's library
+    rnd = random.Random(size)
+    main = array('q', range(size))
+    for i in range(0, size, 50):
+        main[i] = rnd.randrange(size)
+    for i in range(17, size, 400):
+        main[i] = -1 - i
+
+    library = {
+        'benchmain': main,
+        'benchhalf': array('q', (n if i % 3 else n + size for i, n in enumerate(main[:size // 2])))
+    }
+    for p in range(max(playlists - 2, 0)):
+        library[f"benchsmall{p}"] = array('q', (rnd.randrange(2 * size) for _ in range(200)))
+    return library
+
+
+# --- fields filter ---
+
+FIELD_NAME = re.compile(r"[^,().]+")
+
+
+def parse_fields(text):
+    # Spotify's fields syntax ("total,items(track(name,album.name))") as a nested dict
+    tree = {}
+
+    def parse(pos, node):
+        while pos < len(text):
+            match = FIELD_NAME.match(text, pos)
+            child = node.setdefault(match.group(), {})
+            pos = match.end()
+            while pos < len(text) and text[pos] == '.':
+                match = FIELD_NAME.match(text, pos + 1)
+                child = child.setdefault(match.group(), {})
+                pos = match.end()
+            if pos < len(text) and text[pos] == '(':
+                pos = parse(pos + 1, child)
+            if pos < len(text) and text[pos] == ')':
+                return pos + 1
+            pos += 1
+        return pos
+
+    parse(0, tree)
+    return tree
+
+
+def project(value, tree):
+    if not tree:
+        return value
+    if isinstance(value, list):
+        return [project(v, tree) for v in value]
+    if isinstance(value, dict):
+        return {key: project(value[key], child) for key, child in tree.items() if key in value}
+    return value
+
+
+# --- stand-in API server ---
+
+class FakeSpotifyState:
+    def __init__(self, size, playlists, latency, throttle, retry_after, seed=0):
+        self.size = size
+        self.playlist_count = playlists
+        self.latency = latency
+        self.throttle = throttle
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.playlists = make_library(self.size, self.playlist_count)
+            self.meta = {
+                pid: {'name': f"Bench {pid[len('bench'):].title()}", 'description': f"Synthetic {pid}", 'owner': 'bench-user',
+                      'version': 1}
+                for pid in self.playlists
+            }
+            self.next_id = 0
+            self.reset_counters()
+
+    def reset_counters(self):
+        self.counters = {'requests': 0, 'bytes_sent': 0, 'bytes_received': 0, 'throttled': 0, 'endpoints': {}}
+
+    def snapshot_id(self, pid):
+        return f"{pid}:{self.meta[pid]['version']}"
+
+    def bump(self, pid):
+        self.meta[pid]['version'] += 1
+        return {'snapshot_id': self.snapshot_id(pid)}
+
+
+class BadRequest(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class FakeSpotifyHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    state = None
+    base_url = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def do_PUT(self):
+        self.dispatch('PUT')
+
+    def do_DELETE(self):
+        self.dispatch('DELETE')
+
+    def dispatch(self, method):
+        state = self.state
+        url = urlsplit(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length)) if length else {}
+
+        if url.path.startswith('/_bench/'):
+            return self.send_json(200, self.control(method, url.path[len('/_bench/'):]))
+
+        path = url.path[len('/v1/'):].rstrip('/')
+        parts = path.split('/')
+        if parts[0] in ('playlists', 'users') and len(parts) > 1:
+            parts[1] = '{id}'
+        endpoint = f"{method} {'/'.join(parts)}"
+        with state.lock:
+            counters = state.counters
+            counters['requests'] += 1
+            counters['bytes_received'] += length
+            counters['endpoints'][endpoint] = counters['endpoints'].get(endpoint, 0) + 1
+            throttled = state.throttle and state.random.random() < state.throttle
+            if throttled:
+                counters['throttled'] += 1
+
+        if state.latency:
+            time.sleep(state.latency * (0.5 + state.random.random()))
+        if throttled:
+            return self.send_json(429, {'error': {'status': 429, 'message': 'API rate limit exceeded'}},
+                                  {'Retry-After': str(state.retry_after)})
+
+        try:
+            with state.lock:
+                result = self.route(method, path, params, body)
+        except BadRequest as e:
+            return self.send_json(e.status, {'error': {'status': e.status, 'message': str(e)}})
+        except Exception as e:
+            print(f"Benchmark API server error on {method} {self.path}: {e!r}", file=sys.stderr)
+            return self.send_json(500, {'error': {'status': 500, 'message': repr(e)}})
+
+        if 'fields' in params:
+            result = project(result, parse_fields(params['fields']))
+        self.send_json(201 if method == 'POST' else 200, result)
+
+    def control(self, method, action):
+        if action == 'stats':
+            with self.state.lock:
+                return json.loads(json.dumps(self.state.counters))
+        if action == 'reset':
+            self.state.reset()
+        elif action == 'reset_counters':
+            with self.state.lock:
+                self.state.reset_counters()
+        return {}
+
+    def route(self, method, path, params, body):
+        state = self.state
+        parts = path.split('/')
+
+        if path == 'me':
+            return {'id': 'bench-user', 'display_name': 'Benchmark User', 'type': 'user'}
+        if path == 'me/playlists' and method == 'GET':
+            return self.page(list(state.playlists), params, 50, self.playlist_summary, 'me/playlists')
+        if parts[0] in ('users', 'me') and parts[-1] == 'playlists' and method == 'POST':
+            state.next_id += 1
+            pid = f"benchnew{state.next_id}"
+            state.playlists[pid] = array('q')
+            state.meta[pid] = {'name': body.get('name', ''), 'description': body.get('description', ''),
+                               'owner': 'bench-user', 'version': 1}
+            return self.playlist_summary(pid)
+
+        if path in ('audio-features', 'artists') and method == 'GET':
+            # Multi-ID lookups; IDs the server doesn't know come back as null
+            ids = [i for i in params.get('ids', '').split(',') if i]
+            if not ids or len(ids) > (100 if path == 'audio-features' else 50):
+                raise BadRequest(400, 'Invalid ids')
+            if path == 'audio-features':
+                return {'audio_features': [make_audio_features(int(i[len('bench'):])) if i.startswith('bench') else None
+                                           for i in ids]}
+            return {'artists': [make_artist(int(i[len('artist'):])) if i.startswith('artist') else None for i in ids]}
+
+        if parts[0] != 'playlists' or len(parts) < 2 or parts[1] not in state.playlists:
+            raise BadRequest(404, 'Not found.')
+        pid = parts[1]
+        tracks = state.playlists[pid]
+
+        if len(parts) == 2 and method == 'GET':
+            # The first page of items is only rendered when the fields filter can keep it
+            summary = self.playlist_summary(pid)
+            if 'items' in params.get('fields', 'items'):
+                summary['tracks'] = self.page(tracks, {'limit': '100'}, 100, self.item, f"playlists/{pid}/tracks")
+            return summary
+        if len(parts) != 3 or parts[2] not in ('tracks', 'items'):
+            raise BadRequest(404, 'Not found.')
+
+        if method == 'GET':
+            return self.page(tracks, params, 100, self.item, path)
+        if method == 'POST':
+            # Either {"uris": [...], "position": n} or a bare URI list with position in the query
+            uris = body if isinstance(body, list) else body.get('uris') or []
+            position = params.get('position') if isinstance(body, list) else body.get('position')
+            position = None if position is None else int(position)
+            if len(uris) > 100:
+                raise BadRequest(400, 'Too many ids requested')
+            new = array('q', (track_number(uri) for uri in uris))
+            if position is None:
+                tracks.extend(new)
+            elif 0 <= position <= len(tracks):
+                tracks[position:position] = new
+            else:
+                raise BadRequest(400, 'Index out of bounds')
+            return state.bump(pid)
+
+        snapshot = body.get('snapshot_id')
+        if snapshot and snapshot != state.snapshot_id(pid):
+            raise BadRequest(409, 'Snapshot is out of date')
+
+        if method == 'PUT':
+            if 'uris' in body:
+                state.playlists[pid] = array('q', (track_number(uri) for uri in body['uris']))
+                return state.bump(pid)
+            start, length, before = body['range_start'], body.get('range_length', 1), body['insert_before']
+            block = tracks[start:start + length]
+            del tracks[start:start + length]
+            insert_at = before if before <= start else before - length
+            tracks[insert_at:insert_at] = block
+            return state.bump(pid)
+
+        # DELETE, by position when given, otherwise every occurrence of each URI
+        items = body.get('items') or body.get('tracks') or []
+        if len(items) > 100:
+            raise BadRequest(400, 'Too many ids requested')
+        positions = set()
+        everywhere = set()
+        for item in items:
+            number = track_number(item['uri'])
+            if 'positions' in item:
+                for position in item['positions']:
+                    if not 0 <= position < len(tracks) or tracks[position] != number:
+                        raise BadRequest(400, 'Could not remove tracks, please check parameters.')
+                    positions.add(position)
+            else:
+                everywhere.add(number)
+        state.playlists[pid] = array('q', (n for i, n in enumerate(tracks) if i not in positions and n not in everywhere))
+        return state.bump(pid)
+
+    def playlist_summary(self, pid):
+        state = self.state
+        meta = state.meta[pid]
+        return {
+            'id': pid,
+            'name': meta['name'],
+            'description': meta['description'],
+            'collaborative': False,
+            'public': True,
+            'owner': {'id': meta['owner'], 'display_name': None, 'type': 'user'},
+            'snapshot_id': state.snapshot_id(pid),
+            'tracks': {'href': f"{self.base_url}playlists/{pid}/tracks", 'total': len(state.playlists[pid])},
+            'type': 'playlist',
+            'uri': f"spotify:playlist:{pid}"
+        }
+
+    def item(self, n):
+        # Spotify lists tracks withdrawn from the catalogue with a null track
+        return {'added_at': '2020-01-01T00:00:00Z', 'added_by': {'id': 'bench-user'}, 'is_local': False,
+                'track': make_track(n) if n >= 0 else None}
+
+    def page(self, values, params, max_limit, render, path):
+        limit = int(params.get('limit', 20))
+        offset = int(params.get('offset', 0))
+        if not 1 <= limit <= max_limit:
+            raise BadRequest(400, 'Invalid limit')
+
+        href = f"{self.base_url}{path}?offset={{}}&limit={limit}"
+        return {
+            'href': href.format(offset),
+            'items': [render(v) for v in values[offset:offset + limit]],
+            'limit': limit,
+            'next': href.format(offset + limit) if offset + limit < len(values) else None,
+            'offset': offset,
+            'previous': href.format(max(offset - limit, 0)) if offset else None,
+            'total': len(values)
+        }
+
+    def send_json(self, status, payload, headers=None):
+        data = json.dumps(payload, separators=(',', ':')).encode()
+        headers = dict(headers or {})
+        if self.command == 'GET' and status == 200:
+            # Conditional GETs, as the Web API supports with ETag / If-None-Match
+            headers['ETag'] = f'"{hashlib.md5(data).hexdigest()}"'
+            if self.headers.get('If-None-Match') == headers['ETag']:
+                status, data = 304, b''
+
+        self.send_response(status)
+        if status != 304:
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+        if not self.path.startswith('/_bench/'):
+            with self.state.lock:
+                self.state.counters['bytes_sent'] += len(data)
+
+
+def serve(port, ready, size, playlists, latency, throttle, retry_after):
+    class Handler(FakeSpotifyHandler):
+        state = FakeSpotifyState(size, playlists, latency, throttle, retry_after)
+        base_url = f"http://127.0.0.1:{port}/v1/"
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    server.daemon_threads = True
+    ready.set()
+    server.serve_forever()
+
+
+class FakeSpotifyServer:
+    # Runs the stand-in API in a child process; use as a context manager
+    def __init__(self, size, playlists=10, latency=0.0, throttle=0.0, retry_after=1, port=0):
+        self.port = port or free_port()
+        self.api_url = f"http://127.0.0.1:{self.port}/v1/"
+        self.args = (size, playlists, latency, throttle, retry_after)
+        self.process = None
+        self.session = None
+
+    def __enter__(self):
+        ready = multiprocessing.get_context('spawn').Event()
+        self.process = multiprocessing.get_context('spawn').Process(
+            target=serve, args=(self.port, ready) + self.args, daemon=True
+        )
+        self.process.start()
+        if not ready.wait(60):
+            raise RuntimeError("Benchmark API server didn't start")
+        self.session = app.make_requests_session(2)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.session.close()
+        self.process.terminate()
+        self.process.join()
+
+    def control(self, action):
+        response = self.session.post(f"http://127.0.0.1:{self.port}/_bench/{action}")
+        response.raise_for_status()
+        return response.json()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class StaticToken:
+    # Stand-in for SpotifyOAuth: the benchmark server accepts any bearer token
+    def get_access_token(self, as_dict=True, check_cache=True):
+        return 'bench-token'
+
+
+# --- benchmarks ---
+# Each entry is (name, setup, run). setup(manager, work_dir) runs unmeasured on the fresh
+# manager and returns the argument run() gets; run(manager, arg) is what is measured.
+
+def warm(fields):
+    return lambda manager, work_dir: manager._get_playlist_tracks('benchmain', fields)
+
+
+def export_file(format, compression=None):
+    def setup(manager, work_dir):
+        extension = app.EXPORT_FORMATS[format] + app.EXPORT_COMPRESSIONS[compression]
+        return manager.export_playlist('benchmain', os.path.join(work_dir, 'restore' + extension), format, compression)
+    return setup
+
+
+def shuffled_contents(manager):
+    # A few moves, removes and adds, like a hand-edited playlist
+    uris = list(manager._get_playlist_tracks('benchmain', ['uri']).uris)
+    rnd = random.Random(7)
+    for _ in range(5):
+        uris.insert(rnd.randrange(len(uris)), uris.pop(rnd.randrange(len(uris))))
+    del uris[rnd.randrange(len(uris))]
+    uris.insert(rnd.randrange(len(uris)), f"spotify:track:{track_id(10 ** 9)}")
+    return uris
+
+
+def edited_copy(manager):
+    # A copy of benchmain, after which benchmain itself is hand-edited: syncing the copy only
+    # needs to replay those few edits
+    copy_id, _ = manager.duplicate_playlist('benchmain')
+    manager.update_playlist_contents('benchmain', shuffled_contents(manager))
+    return copy_id
+
+
+SYNC_BENCHMARKS = [
+    ('get_user_playlists', None, lambda m, _: m.get_user_playlists()),
+    ('get_user_playlists_revalidate', lambda m, _: m.get_user_playlists(),
+     lambda m, _: m.get_user_playlists(max_age=0)),
+    ('search_tracks_by_criteria', None,
+     lambda m, _: m.search_tracks_by_criteria('benchmain', artist_name='Artist 1', year_range=(1980, 2000))),
+    ('search_tracks_by_criteria_warm', warm(['uri', 'name', 'artists', 'album', 'release_date', 'duration_ms',
+                                             'popularity']),
+     lambda m, _: m.search_tracks_by_criteria('benchmain', artist_name='Artist 1', year_range=(1980, 2000))),
+    ('search_tracks_by_features', None,
+     lambda m, _: m.search_tracks_by_criteria('benchmain', tempo_range=(110, 130), genre='rock')),
+    ('search_tracks_by_features_warm', lambda m, _: m.search_tracks_by_criteria('benchhalf', genre='jazz', energy_range=(0, 1)),
+     lambda m, _: m.search_tracks_by_criteria('benchmain', tempo_range=(110, 130), genre='rock')),
+    ('get_playlist_stats', None, lambda m, _: m.get_playlist_stats('benchmain')),
+    ('get_playlist_stats_warm', lambda m, _: m.get_playlist_stats('benchmain'),
+     lambda m, _: m.get_playlist_stats('benchmain')),
+    ('find_duplicates', None, lambda m, _: m.find_duplicates('benchmain')),
+    ('run_pipeline_streaming', None, lambda m, work_dir: m.run_pipeline(
+        'benchmain',
+        [app.StatsConsumer(), app.DuplicateConsumer(), app.FilterConsumer(artist_name='Artist 1'),
+         app.ExportConsumer(os.path.join(work_dir, 'pipeline.jsonl'), 'jsonl')],
+        keep=False
+    )),
+    ('export_playlist_json', None, lambda m, work_dir: m.export_playlist('benchmain', os.path.join(work_dir, 'e.json'))),
+    ('export_playlist_jsonl_gzip', None, lambda m, work_dir: m.export_playlist(
+        'benchmain', os.path.join(work_dir, 'e.jsonl.gz'), 'jsonl', 'gzip', keep=False
+    )),
+    ('export_all_playlists', None,
+     lambda m, work_dir: m.export_all_playlists(os.path.join(work_dir, 'all.zip'))),
+    ('find_library_duplicates', None, lambda m, _: m.find_library_duplicates()),
+    ('remove_tracks_from_playlist', lambda m, _: [t['uri'] for t in m.search_tracks_by_criteria(
+        'benchmain', artist_name='Artist 1')],
+     lambda m, uris: m.remove_tracks_from_playlist('benchmain', uris)),
+    ('remove_duplicates', None, lambda m, _: m.remove_duplicates('benchmain')),
+    ('update_playlist_contents', lambda m, _: shuffled_contents(m),
+     lambda m, uris: m.update_playlist_contents('benchmain', uris)),
+    ('duplicate_playlist', None, lambda m, _: m.duplicate_playlist('benchmain')),
+    ('diff_playlists', None, lambda m, _: m.diff_playlists('benchmain', 'benchhalf')),
+    ('merge_playlists', None, lambda m, _: m.merge_playlists('benchhalf', ['benchsmall0', 'benchsmall1'])),
+    ('sync_playlist', lambda m, _: edited_copy(m), lambda m, copy_id: m.sync_playlist('benchmain', copy_id)),
+    ('restore_playlist_jsonl', export_file('jsonl'), lambda m, filename: m.restore_playlist(filename)),
+    ('restore_playlist_json_gzip', export_file('json', 'gzip'), lambda m, filename: m.restore_playlist(filename)),
+    ('backup_playlists', None, lambda m, _: m.backup_playlists()),
+    ('run_job', None, lambda m, work_dir: m.run_job({
+        'playlists': 'all',
+        'operations': [
+            {'op': 'stats'},
+            {'op': 'export', 'directory': work_dir, 'format': 'jsonl', 'compression': 'gzip'},
+            {'op': 'remove', 'criteria': {'artist_name': 'Artist 1', 'year_range': [1980, 2000]}},
+            {'op': 'dedupe'},
+            {'op': 'stats'}
+        ]
+    })),
+]
+
+ASYNC_BENCHMARKS = [
+    ('async_get_user_playlists', None, lambda m, _: m.get_user_playlists()),
+    ('async_search_tracks_by_features', None,
+     lambda m, _: m.search_tracks_by_criteria('benchmain', tempo_range=(110, 130), genre='rock')),
+    ('async_get_playlist_stats', None, lambda m, _: m.get_playlist_stats('benchmain')),
+    ('async_export_playlist_jsonl', None,
+     lambda m, work_dir: m.export_playlist('benchmain', os.path.join(work_dir, 'e.jsonl'), 'jsonl')),
+    ('async_find_library_duplicates', None, lambda m, _: m.find_library_duplicates()),
+    ('async_remove_duplicates', None, lambda m, _: m.remove_duplicates('benchmain')),
+    ('async_duplicate_playlist', None, lambda m, _: m.duplicate_playlist('benchmain')),
+    ('async_merge_playlists', None, lambda m, _: m.merge_playlists('benchhalf', ['benchsmall0', 'benchsmall1'])),
+]
+
+
+def make_manager(server, work_dir, is_async, rate):
+    options = dict(
+        cache_path=os.path.join(work_dir, 'cache.sqlite'),
+        journal_path=os.path.join(work_dir, 'journal.sqlite'),
+        api_url=server.api_url,
+        auth_manager=StaticToken()
+    )
+    if rate:
+        options['rate_limit'] = rate
+    if is_async:
+        manager = app.AsyncSpotifyPlaylistManager('bench', 'bench', 'http://127.0.0.1/', **options)
+    else:
+        manager = app.SpotifyPlaylistManager('bench', 'bench', 'http://127.0.0.1/', **options)
+        # The client and user are set up lazily; do it here so it isn't timed as part of a benchmark
+        manager.user_id
+    return manager
+
+
+def run_once(server, benchmark, is_async, trace_memory, rate):
+    # Fresh library, cache and journal, so every run starts from the same state
+    name, setup, run = benchmark
+    work_dir = tempfile.mkdtemp(prefix='playlist-bench-')
+    server.control('reset')
+    loop = asyncio.new_event_loop() if is_async else None
+
+    def call(fn, *args):
+        result = fn(*args)
+        return loop.run_until_complete(result) if is_async else result
+
+    try:
+        manager = make_manager(server, work_dir, is_async, rate)
+        arg = call(setup, manager, work_dir) if setup else work_dir
+        server.control('reset_counters')
+        manager.instruments.reset()
+
+        if trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        call(run, manager, arg)
+        wall = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+        if trace_memory:
+            tracemalloc.stop()
+
+        throughput = manager.get_throughput()
+        if is_async:
+            loop.run_until_complete(manager.close())
+        return wall, peak, server.control('stats'), throughput
+    finally:
+        if loop:
+            loop.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def run_benchmark(server, benchmark, size, is_async, repeat, rate=None):
+    # Timed runs go without tracemalloc, which slows Python code down; one more run measures memory
+    walls = []
+    for _ in range(repeat):
+        wall, _, counters, throughput = run_once(server, benchmark, is_async, False, rate)
+        walls.append(wall)
+    _, peak, _, _ = run_once(server, benchmark, is_async, True, rate)
+
+    return {
+        'name': benchmark[0],
+        'size': size,
+        'wall_seconds': min(walls),
+        'wall_seconds_median': statistics.median(walls),
+        'requests': counters['requests'],
+        'bytes_received': counters['bytes_sent'],
+        'bytes_sent': counters['bytes_received'],
+        'throttled': counters['throttled'],
+        'peak_memory_bytes': peak,
+        'endpoints': counters['endpoints'],
+        'throughput': throughput
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+COMPARED_METRICS = ('wall_seconds', 'requests', 'bytes_received', 'peak_memory_bytes')
+
+
+def compare(results, baseline, threshold):
+    # Print each metric against the baseline; returns the regressions beyond threshold
+    previous = {(r['name'], r['size']): r for r in baseline['results']}
+    regressions = []
+    print(f"\n{'benchmark':<34}{'size':>8}" + ''.join(f"{metric:>22}" for metric in COMPARED_METRICS))
+    for result in results:
+        old = previous.get((result['name'], result['size']))
+        if old is None:
+            continue
+        cells = []
+        for metric in COMPARED_METRICS:
+            if not old.get(metric) or result.get(metric) is None:
+                cells.append(f"{'-':>22}")
+                continue
+            change = result[metric] / old[metric] - 1
+            cells.append(f"{change:>+21.1%}{'!' if change > threshold else ' '}")
+            if change > threshold:
+                regressions.append((result['name'], result['size'], metric, change))
+        print(f"{result['name']:<34}{result['size']:>8}" + ''.join(cells))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the playlist managers against a local stand-in API")
+    parser.add_argument('--sizes', default='1000,10000', help="comma-separated main playlist sizes")
+    parser.add_argument('--playlists', type=int, default=10, help="playlists in the synthetic library")
+    parser.add_argument('--latency', type=float, default=0.0, help="mean seconds added to each API response")
+    parser.add_argument('--throttle', type=float, default=0.0, help="fraction of API calls answered with 429")
+    parser.add_argument('--retry-after', type=int, default=1, help="Retry-After seconds sent with each 429")
+    parser.add_argument('--rate', type=float, help="client rate limit in requests/second (default: the manager's)")
+    parser.add_argument('--repeat', type=int, default=3, help="timed runs per benchmark")
+    parser.add_argument('--only', help="regex selecting benchmarks by name")
+    parser.add_argument('--no-async', action='store_true', help="skip the AsyncSpotifyPlaylistManager benchmarks")
+    parser.add_argument('--output', default='benchmark_results.json', help="where to write the results")
+    parser.add_argument('--compare', help="earlier results file to compare against")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="relative increase reported as a regression (exit status 1)")
+    args = parser.parse_args()
+
+    benchmarks = [(b, False) for b in SYNC_BENCHMARKS]
+    if not args.no_async:
+        benchmarks += [(b, True) for b in ASYNC_BENCHMARKS]
+    if args.only:
+        benchmarks = [(b, is_async) for b, is_async in benchmarks if re.search(args.only, b[0])]
+
+    results = []
+    for size in [int(s) for s in args.sizes.split(',')]:
+        with FakeSpotifyServer(size, args.playlists, args.latency, args.throttle, args.retry_after) as server:
+            for benchmark, is_async in benchmarks:
+                result = run_benchmark(server, benchmark, size, is_async, args.repeat, args.rate)
+                results.append(result)
+                peak = result['peak_memory_bytes'] / 2 ** 20
+                print(f"{result['name']:<34}{size:>8}  {result['wall_seconds']:>8.3f}s  "
+                      f"{result['requests']:>6} req  {result['bytes_received'] / 2 ** 20:>8.2f} MiB  {peak:>8.1f} MiB peak")
+
+    report = {
+        'meta': {
+            'created': datetime.now().isoformat(),
+            'revision': git_revision(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'options': vars(args)
+        },
+        'results': results
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import pytest
+
+from app import BackupJournal
+
+
+@pytest.fixture
+def journal(tmp_path):
+    return BackupJournal(str(tmp_path / 'journal.sqlite'))
+
+
+def interrupted_job(journal, committed, pending):
+    # A copy that stopped with `pending` tracks sent but not yet confirmed
+    job = journal.start('playlist:source', 'snap1', 'target', 'Source_backup')
+    journal.begin_batch(job['job_id'], 100)
+    journal.commit_batch(job['job_id'], committed)
+    if pending:
+        journal.begin_batch(job['job_id'], pending)
+    return journal.find('playlist:source')
+
+
+def test_pending_batch_that_landed_is_committed(journal):
+    job = interrupted_job(journal, 100, 50)
+    assert (job['committed'], job['pending']) == (100, 50)
+
+    assert journal.recover(job, 150) == 150
+    job = journal.find('playlist:source')
+    assert (job['committed'], job['pending']) == (150, 0)
+
+
+def test_pending_batch_that_never_landed_is_resent(journal):
+    job = interrupted_job(journal, 100, 50)
+
+    assert journal.recover(job, 100) == 100
+    assert journal.find('playlist:source')['pending'] == 0
+
+
+def test_target_edited_meanwhile_is_reported(journal):
+    job = interrupted_job(journal, 100, 50)
+    assert journal.recover(job, 120) is None
+
+    job = interrupted_job(journal, 100, 0)
+    assert journal.recover(job, 101) is None
+
+
+def test_job_without_pending_batch_resumes_where_it_stopped(journal):
+    job = interrupted_job(journal, 200, 0)
+    assert journal.recover(job, 200) == 200
+
+
+def test_finished_jobs_are_not_resumed(journal):
+    job = interrupted_job(journal, 100, 0)
+    journal.finish(job['job_id'])
+
+    assert journal.find('playlist:source') is None
+    assert [j['status'] for j in journal.jobs()] == ['done']
+    assert journal.jobs('running') == []
+
+
+def test_latest_running_job_is_resumed(journal):
+    journal.start('playlist:source', 'snap1', 'old-target', 'Old')
+    journal.start('playlist:source', 'snap2', 'new-target', 'New')
+
+    assert journal.find('playlist:source')['target_id'] == 'new-target'
+    assert journal.find('playlist:other') is None
@@ -0,0 +1,70 @@
+import random
+from collections import Counter
+
+from app import diff_uris, merged_uris, synced_uris
+
+
+def is_subsequence(part, whole):
+    remaining = iter(whole)
+    return all(uri in remaining for uri in part)
+
+
+def test_diff_counts_repeats():
+    source = ['spotify:track:a', 'spotify:track:b', 'spotify:track:a', 'spotify:track:c', 'spotify:track:a']
+    target = ['spotify:track:c', 'spotify:track:a', 'spotify:track:d', 'spotify:track:d']
+
+    assert diff_uris(source, target) == {
+        'only_in_source': ['spotify:track:a', 'spotify:track:b', 'spotify:track:a'],
+        'only_in_target': ['spotify:track:d', 'spotify:track:d'],
+        'common': 2
+    }
+
+
+def test_diff_is_a_multiset_difference():
+    rnd = random.Random(19)
+    for _ in range(300):
+        source = [f"spotify:track:{rnd.randrange(10)}" for _ in range(rnd.randrange(0, 30))]
+        target = [f"spotify:track:{rnd.randrange(10)}" for _ in range(rnd.randrange(0, 30))]
+
+        diff = diff_uris(source, target)
+        assert Counter(diff['only_in_source']) == Counter(source) - Counter(target)
+        assert Counter(diff['only_in_target']) == Counter(target) - Counter(source)
+        assert diff['common'] + len(diff['only_in_source']) == len(source)
+        assert diff['common'] + len(diff['only_in_target']) == len(target)
+        assert is_subsequence(diff['only_in_source'], source)
+        assert is_subsequence(diff['only_in_target'], target)
+
+
+def test_identical_lists_have_no_differences():
+    uris = ['spotify:track:a', 'spotify:track:b', 'spotify:track:a']
+    assert diff_uris(uris, list(reversed(uris))) == {'only_in_source': [], 'only_in_target': [], 'common': 3}
+
+
+def test_merge_appends_new_uris_in_source_order():
+    target = ['spotify:track:a', 'spotify:track:b', 'spotify:track:a']
+    sources = [
+        ['spotify:track:c', 'spotify:track:b', 'spotify:local:x', 'spotify:track:c'],
+        ['spotify:track:d', 'spotify:track:a', 'spotify:track:c']
+    ]
+
+    assert merged_uris(target, sources) == ['spotify:track:a', 'spotify:track:b', 'spotify:track:c', 'spotify:track:d']
+    assert merged_uris(target, sources, dedupe=False) == target + ['spotify:track:c', 'spotify:track:d']
+    assert merged_uris(target, []) == ['spotify:track:a', 'spotify:track:b']
+
+
+def test_merge_holds_every_uri_once():
+    rnd = random.Random(4)
+    for _ in range(200):
+        target = [f"spotify:track:{rnd.randrange(15)}" for _ in range(rnd.randrange(0, 20))]
+        sources = [[f"spotify:track:{rnd.randrange(15)}" for _ in range(rnd.randrange(0, 20))]
+                   for _ in range(rnd.randrange(0, 4))]
+
+        merged = merged_uris(target, sources)
+        assert len(merged) == len(set(merged))
+        assert set(merged) == set(target).union(*sources)
+        assert merged[:len(set(target))] == list(dict.fromkeys(target))
+
+
+def test_sync_drops_local_files():
+    source = ['spotify:track:a', 'spotify:local:Artist:Album:Song:180', 'spotify:track:a']
+    assert synced_uris(source) == ['spotify:track:a', 'spotify:track:a']
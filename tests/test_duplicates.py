@@ -0,0 +1,79 @@
+import pytest
+
+from app import TrackTable, cluster_duplicates, normalize_title
+
+
+def track(uri, name, artists, isrc=None):
+    return {'uri': uri, 'name': name, 'artists': artists, 'isrc': isrc}
+
+
+@pytest.mark.parametrize('title, expected', [
+    ("Heroes", "heroes"),
+    ("Heroes (Remastered 2017)", "heroes"),
+    ("Heroes [2017 Remaster]", "heroes"),
+    ("Heroes - 2017 Remaster", "heroes"),
+    ("Heroes - Live", "heroes"),
+    ("Heroes (Live at Wembley)", "heroes"),
+    ("Heroes (feat. Someone)", "heroes"),
+    ("Heroes ft. Someone", "heroes"),
+    ("Héroes", "heroes"),
+    ("  HEROES!!  ", "heroes"),
+    ("Heroes - Single Version", "heroes single version"),
+    ("Live and Let Die", "live and let die"),
+    ("(Live)", "live"),
+])
+def test_normalize_title(title, expected):
+    assert normalize_title(title) == expected
+
+
+def positions(clusters):
+    return sorted(sorted((member['playlist_id'], member['position']) for member in cluster) for cluster in clusters)
+
+
+def test_clusters_join_by_uri_isrc_and_title_across_playlists():
+    first = TrackTable.from_tracks([
+        track('spotify:track:1', "Heroes", ["David Bowie"], 'GBAYE7700001'),
+        track('spotify:track:2', "Changes", ["David Bowie"]),
+        track('spotify:track:3', "Starman", ["David Bowie"], 'gbaye7200002'),
+    ])
+    second = TrackTable.from_tracks([
+        track('spotify:track:1', "Heroes", ["David Bowie"], 'GBAYE7700001'),
+        track('spotify:track:9', "Heroes - 2017 Remaster", ["David  Bowie"]),
+        track('spotify:track:8', "Starman (Remastered)", ["Someone Else"], 'GBAYE7200002'),
+        track('spotify:track:7', "Changes", ["Someone Else"]),
+    ])
+
+    clusters = cluster_duplicates([('a', first), ('b', second)])
+    assert positions(clusters) == [
+        [('a', 0), ('b', 0), ('b', 1)],
+        [('a', 2), ('b', 2)],
+    ]
+    assert len(clusters[0]) == 3
+    assert clusters[0][0]['uri'] == 'spotify:track:1'
+
+
+def test_repeats_within_one_playlist_cluster():
+    tracks = TrackTable.from_tracks([
+        track('spotify:track:1', "Song", ["A"]),
+        track('spotify:track:2', "Other", ["A"]),
+        track('spotify:track:1', "Song", ["A"]),
+    ])
+    assert positions(cluster_duplicates([('a', tracks)])) == [[('a', 0), ('a', 2)]]
+
+
+def test_shared_artist_on_a_collaboration_is_enough():
+    tracks = TrackTable.from_tracks([
+        track('spotify:track:1', "Under Pressure", ["Queen", "David Bowie"]),
+        track('spotify:track:2', "Under Pressure (Remastered 2011)", ["David Bowie"]),
+    ])
+    assert positions(cluster_duplicates([('a', tracks)])) == [[('a', 0), ('a', 1)]]
+
+
+def test_unrelated_tracks_are_not_clustered():
+    tracks = TrackTable.from_tracks([
+        track('spotify:track:1', "Song", ["A"]),
+        track('spotify:track:2', "Song", ["B"]),
+        track('spotify:track:3', None, []),
+        track('spotify:track:4', None, []),
+    ])
+    assert cluster_duplicates([('a', tracks)]) == []
@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+from app import (EXPORT_COMPRESSIONS, EXPORT_FORMATS, ExportConsumer, TrackTable, detect_export_format,
+                 open_export_file, read_export_file)
+
+PLAYLIST = {'name': "Road Trip", 'description': "Songs for the drive – part 2", 'snapshot_id': 'snap'}
+
+
+def track(n):
+    return {
+        'uri': f"spotify:track:{n}",
+        'name': f"Track {n}, \"live\"" if n % 3 == 0 else f"Track {n}",
+        'artists': [f"Artist {n % 4}", "Björk"] if n % 5 == 0 else [f"Artist {n % 4}"],
+        'album': f"Album {n % 2}",
+        'release_date': "1999-12-31" if n % 7 else None,
+        'duration_ms': 1000 * n,
+        'external_urls': {'spotify': f"https://open.spotify.com/track/{n}"}
+    }
+
+
+def export(filename, format, compression, pages):
+    consumer = ExportConsumer(filename, format, compression)
+    consumer.start(PLAYLIST)
+    offset = 0
+    for page in pages:
+        tracks = TrackTable.from_tracks(track(n) for n in page)
+        consumer.consume(tracks, offset)
+        offset += len(tracks)
+    return consumer.result()
+
+
+@pytest.mark.parametrize('pages', [[], [range(3)], [range(100), range(100, 150)]])
+def test_chunked_json_matches_a_whole_document_dump(tmp_path, pages):
+    filename = export(str(tmp_path / 'out.json'), 'json', None, pages)
+    with open(filename, encoding='utf-8') as f:
+        text = f.read()
+
+    data = json.loads(text)
+    assert text == json.dumps(data, indent=2, ensure_ascii=False)
+    assert list(data) == ['playlist_name', 'description', 'export_date', 'tracks', 'total_tracks']
+    assert data['total_tracks'] == len(data['tracks']) == sum(len(page) for page in pages)
+    if data['tracks']:
+        assert data['tracks'][0] == track(0)
+
+
+@pytest.mark.parametrize('format', list(EXPORT_FORMATS))
+@pytest.mark.parametrize('compression', [None, 'gzip'])
+def test_exports_read_back_in_order(tmp_path, format, compression):
+    filename = str(tmp_path / f"Road Trip_export{EXPORT_FORMATS[format]}{EXPORT_COMPRESSIONS[compression]}")
+    export(filename, format, compression, [range(100), range(100, 130)])
+
+    assert detect_export_format(filename) == (format, compression)
+    name, description, uris = read_export_file(filename)
+    assert list(uris) == [f"spotify:track:{n}" for n in range(130)]
+    if format == 'json':
+        assert (name, description) == (PLAYLIST['name'], PLAYLIST['description'])
+    else:
+        assert (name, description) == ("Road Trip", None)
+
+
+def test_csv_export_joins_artists(tmp_path):
+    filename = export(str(tmp_path / 'out.csv'), 'csv', None, [range(6)])
+    with open_export_file(filename, newline='', mode='r') as f:
+        lines = f.read().splitlines()
+
+    assert lines[0] == 'name,artists,album,release_date,duration_ms,uri,spotify_url'
+    assert lines[1] == '"Track 0, ""live""",Artist 0; Björk,Album 0,,0,spotify:track:0,https://open.spotify.com/track/0'
+    assert len(lines) == 7
+
+
+@pytest.mark.parametrize('filename', ['playlist.txt', 'playlist.gz', 'playlist'])
+def test_unknown_export_files_are_rejected(filename):
+    with pytest.raises(ValueError):
+        detect_export_format(filename)
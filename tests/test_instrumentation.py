@@ -0,0 +1,52 @@
+from app import ENDPOINT_ID_PATTERN, Instrumentation
+
+
+def test_requests_are_counted_per_endpoint_and_per_kind():
+    instruments = Instrumentation()
+    events = []
+    instruments.add_hook(events.append)
+
+    instruments.record_request('playlist_items', 'read', 200, 0.2, 0.0, 2048, 0, items=100)
+    instruments.record_request('playlist_items', 'read', 429, 0.01, 0.5, 64, 0)
+    instruments.record_request('playlist_items', 'read', 200, 0.3, 1.0, 1024, 1, items=50)
+    instruments.record_request('playlist_add_items', 'write', 0, 5.0, 0.0, 0, 0)
+
+    endpoints = instruments.snapshot()['endpoints']
+    assert endpoints['playlist_items']['calls'] == 3
+    assert endpoints['playlist_items']['errors'] == 1
+    assert endpoints['playlist_items']['retries'] == 1
+    assert endpoints['playlist_items']['throttled'] == 1
+    assert endpoints['playlist_items']['bytes_received'] == 3136
+    assert endpoints['playlist_add_items']['errors'] == 1
+
+    throughput = instruments.throughput()
+    assert throughput['read']['requests'] == 3
+    assert throughput['read']['items'] == 150
+    assert throughput['read']['throttled'] == 1
+    assert throughput['read']['items_per_second'] == 150 / (0.2 + 0.01 + 0.3)
+    assert throughput['write'] == {
+        'requests': 1, 'items': 0, 'seconds': 5.0, 'wait_seconds': 0.0, 'throttled': 0, 'errors': 1,
+        'items_per_second': 0.0
+    }
+
+    assert [event['status'] for event in events] == [200, 429, 200, 0]
+    instruments.reset()
+    assert instruments.throughput() == {}
+    assert instruments.snapshot() == {'endpoints': {}, 'methods': {}}
+
+
+def test_method_timings_split_api_and_local_time():
+    instruments = Instrumentation()
+    instruments.record_method('get_playlist_stats', 2.0, 1.5)
+    instruments.record_method('get_playlist_stats', 1.0, 1.25, error=True)
+
+    counter = instruments.snapshot()['methods']['get_playlist_stats']
+    assert counter == {'calls': 2, 'errors': 1, 'seconds': 3.0, 'api_seconds': 2.75, 'local_seconds': 0.5}
+    assert 'get_playlist_stats' in instruments.format_report()
+
+
+def test_endpoint_names_fold_out_ids():
+    assert ENDPOINT_ID_PATTERN.sub('{id}', 'playlists/37i9dQZF1DX/tracks') == 'playlists/{id}/tracks'
+    assert ENDPOINT_ID_PATTERN.sub('{id}', 'users/someone/playlists') == 'users/{id}/playlists'
+    assert ENDPOINT_ID_PATTERN.sub('{id}', 'me/playlists') == 'me/playlists'
+    assert ENDPOINT_ID_PATTERN.sub('{id}', 'audio-features') == 'audio-features'
@@ -0,0 +1,72 @@
+import json
+
+import pytest
+
+from app import group_job_operations, load_job_file, validate_job
+
+
+@pytest.mark.parametrize('job', [
+    {'operations': [{'op': 'stats'}]},
+    {'playlists': ['37i9dQZF1DXcBWIGoYBM5M', {'name': "Road Trip"}], 'operations': [{'op': 'dedupe'}]},
+    {'playlists': 'all', 'operations': [
+        {'op': 'backup'},
+        {'op': 'remove', 'criteria': {'artist_name': "Nickelback", 'year_range': [1990, 2005]}},
+        {'op': 'remove', 'criteria': {'tempo_range': [0, 80.5], 'genre': "polka"}},
+        {'op': 'export', 'format': 'jsonl', 'compression': 'gzip'}
+    ]},
+])
+def test_valid_jobs_pass(job):
+    validate_job(job)
+
+
+@pytest.mark.parametrize('job', [
+    [],
+    {},
+    {'operations': []},
+    {'operations': {'op': 'stats'}},
+    {'playlists': 'mine', 'operations': [{'op': 'stats'}]},
+    {'operations': ['stats']},
+    {'operations': [{'op': 'shuffle'}]},
+    {'operations': [{}]},
+    {'operations': [{'op': 'remove'}]},
+    {'operations': [{'op': 'remove', 'criteria': {}}]},
+    {'operations': [{'op': 'remove', 'criteria': ['artist_name']}]},
+    {'operations': [{'op': 'remove', 'criteria': {'label': "EMI"}}]},
+    {'operations': [{'op': 'remove', 'criteria': {'year_range': 1999}}]},
+    {'operations': [{'op': 'remove', 'criteria': {'year_range': [1990]}}]},
+    {'operations': [{'op': 'remove', 'criteria': {'year_range': ["1990", "2000"]}}]},
+    {'operations': [{'op': 'remove', 'criteria': {'popularity_range': [True, 50]}}]},
+    {'operations': [{'op': 'remove', 'criteria': {'artist_name': 42}}]},
+    {'operations': [{'op': 'export', 'format': 'xml'}]},
+    {'operations': [{'op': 'export', 'compression': 'bz2'}]},
+])
+def test_malformed_jobs_are_rejected(job):
+    with pytest.raises(ValueError):
+        validate_job(job)
+
+
+def test_load_job_file_validates(tmp_path):
+    path = tmp_path / 'job.json'
+    path.write_text(json.dumps({'operations': [{'op': 'dedupe'}]}), encoding='utf-8')
+    assert load_job_file(str(path)) == {'operations': [{'op': 'dedupe'}]}
+
+    path.write_text(json.dumps({'operations': [{'op': 'dedup'}]}), encoding='utf-8')
+    with pytest.raises(ValueError):
+        load_job_file(str(path))
+
+
+def test_consecutive_operations_of_a_kind_are_grouped():
+    operations = [
+        {'op': 'stats'}, {'op': 'export'},
+        {'op': 'remove', 'criteria': {'genre': "polka"}}, {'op': 'dedupe'},
+        {'op': 'backup'}, {'op': 'backup'},
+        {'op': 'stats'}
+    ]
+    groups = group_job_operations(operations)
+    assert [(kind, [operation['op'] for operation in group]) for kind, group in groups] == [
+        ('read', ['stats', 'export']),
+        ('write', ['remove', 'dedupe']),
+        ('backup', ['backup']),
+        ('backup', ['backup']),
+        ('read', ['stats'])
+    ]
@@ -0,0 +1,231 @@
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from app import is_edit_conflict, match_stable_pairs, plan_playlist_changes, replay_plan, spread_plan, summarize_plan
+
+
+def apply_ops(uris, ops, batch_size=100):
+    # Stand-in for Spotify's positional edit endpoints, checking each request the way the API does
+    uris = list(uris)
+    for op in ops:
+        if op['op'] == 'remove':
+            assert 0 < len(op['items']) <= batch_size
+            removed = set()
+            for item in op['items']:
+                for position in item['positions']:
+                    assert uris[position] == item['uri'], "position doesn't hold the URI it claims"
+                    removed.add(position)
+            uris = [uri for i, uri in enumerate(uris) if i not in removed]
+        elif op['op'] == 'reorder':
+            start, length, insert_before = op['range_start'], op['range_length'], op['insert_before']
+            assert length > 0 and 0 <= start and start + length <= len(uris)
+            assert 0 <= insert_before <= len(uris)
+            block = uris[start:start + length]
+            del uris[start:start + length]
+            position = insert_before - length if insert_before > start else insert_before
+            uris[position:position] = block
+        elif op['op'] == 'add':
+            assert 0 < len(op['uris']) <= batch_size
+            assert 0 <= op['position'] <= len(uris)
+            uris[op['position']:op['position']] = op['uris']
+        else:
+            raise AssertionError(f"unknown op {op['op']!r}")
+    return uris
+
+
+def lcs_length(a, b):
+    row = [0] * (len(b) + 1)
+    for x in a:
+        previous = 0
+        for j, y in enumerate(b):
+            previous, row[j + 1] = row[j + 1], previous + 1 if x == y else max(row[j + 1], row[j])
+    return row[-1]
+
+
+def random_edit(rnd, uris, alphabet):
+    # A hand-edited copy: some removes, inserts (new or repeated URIs) and moves
+    desired = list(uris)
+    for _ in range(rnd.randrange(0, 10)):
+        kind = rnd.randrange(3)
+        if kind == 0 and desired:
+            desired.pop(rnd.randrange(len(desired)))
+        elif kind == 1:
+            desired.insert(rnd.randrange(len(desired) + 1), f"spotify:track:{rnd.randrange(alphabet)}")
+        elif desired:
+            desired.insert(rnd.randrange(len(desired)), desired.pop(rnd.randrange(len(desired))))
+    return desired
+
+
+def test_identical_lists_need_no_edits():
+    uris = [f"spotify:track:{i}" for i in range(10)]
+    assert plan_playlist_changes(uris, list(uris)) == []
+
+
+@pytest.mark.parametrize('batch_size', [1, 2, 5, 100])
+def test_random_plans_reproduce_desired_contents(batch_size):
+    rnd = random.Random(batch_size)
+    for _ in range(500):
+        # A small alphabet makes repeated URIs common on both sides
+        alphabet = rnd.randrange(2, 40)
+        current = [f"spotify:track:{rnd.randrange(alphabet)}" for _ in range(rnd.randrange(0, 60))]
+        desired = random_edit(rnd, current, alphabet) if rnd.random() < 0.7 else \
+            [f"spotify:track:{rnd.randrange(alphabet)}" for _ in range(rnd.randrange(0, 60))]
+
+        ops = plan_playlist_changes(current, desired, batch_size)
+        assert apply_ops(current, ops, batch_size) == desired
+
+        slots = replay_plan(len(current), ops)
+        assert [desired[i] if slot is None else current[slot] for i, slot in enumerate(slots)] == desired
+
+
+@pytest.mark.parametrize('batch_size', [1, 3, 100])
+def test_spread_plans_leave_unavailable_items_in_place(batch_size):
+    rnd = random.Random(batch_size)
+    for _ in range(500):
+        # None stands for an unavailable item, which the plan is made without
+        alphabet = rnd.randrange(2, 30)
+        items = [None if rnd.random() < 0.15 else f"spotify:track:{rnd.randrange(alphabet)}"
+                 for _ in range(rnd.randrange(0, 50))]
+        current = [uri for uri in items if uri is not None]
+        gaps = [i for i, uri in enumerate(items) if uri is None]
+        desired = random_edit(rnd, current, alphabet)
+
+        ops = plan_playlist_changes(current, desired, batch_size)
+        sent, new_gaps = spread_plan(ops, len(current), gaps)
+        result = apply_ops(items, sent, batch_size)
+        assert [uri for uri in result if uri is not None] == desired
+        assert [i for i, uri in enumerate(result) if uri is None] == new_gaps
+        assert len(new_gaps) == len(gaps)
+
+        slots = replay_plan(len(items), sent)
+        assert [result[i] if slot is None else items[slot] for i, slot in enumerate(slots)] == result
+
+
+def test_spread_plan_without_gaps_is_unchanged():
+    ops = [{'op': 'add', 'position': 1, 'uris': ['spotify:track:a']}]
+    assert spread_plan(ops, 3, []) == (ops, [])
+
+
+def test_ops_run_removes_then_reorders_then_adds():
+    rnd = random.Random(3)
+    current = [f"spotify:track:{i}" for i in range(40)]
+    for _ in range(200):
+        ops = plan_playlist_changes(current, random_edit(rnd, current, 60))
+        kinds = [op['op'] for op in ops]
+        assert kinds == sorted(kinds, key=['remove', 'reorder', 'add'].index)
+
+
+def test_one_moved_track_is_a_single_reorder():
+    current = [f"spotify:track:{i}" for i in range(20)]
+    desired = list(current)
+    desired.insert(15, desired.pop(3))
+
+    ops = plan_playlist_changes(current, desired)
+    assert [op['op'] for op in ops] == ['reorder']
+    assert ops[0]['range_length'] == 1
+    assert apply_ops(current, ops) == desired
+
+
+def test_adjacent_moved_tracks_share_a_reorder():
+    current = [f"spotify:track:{i}" for i in range(20)]
+    desired = current[:2] + current[5:15] + current[2:5] + current[15:]
+
+    ops = plan_playlist_changes(current, desired)
+    assert ops == [{'op': 'reorder', 'range_start': 2, 'insert_before': 15, 'range_length': 3}]
+
+
+def test_repeated_uri_removes_only_the_extra_copy():
+    current = ['spotify:track:a', 'spotify:track:b', 'spotify:track:a', 'spotify:track:c']
+    desired = ['spotify:track:a', 'spotify:track:b', 'spotify:track:c']
+
+    assert plan_playlist_changes(current, desired) == [
+        {'op': 'remove', 'items': [{'uri': 'spotify:track:a', 'positions': [2]}]}
+    ]
+
+
+def test_repeated_uri_gaining_a_copy_is_added_once():
+    current = ['spotify:track:a', 'spotify:track:b']
+    desired = ['spotify:track:a', 'spotify:track:b', 'spotify:track:a']
+
+    assert plan_playlist_changes(current, desired) == [{'op': 'add', 'position': 2, 'uris': ['spotify:track:a']}]
+
+
+def test_removes_and_adds_are_split_into_batches():
+    current = [f"spotify:track:{i}" for i in range(300)]
+    desired = current[:50] + [f"spotify:track:new{i}" for i in range(250)]
+
+    ops = plan_playlist_changes(current, desired)
+    removes = [op for op in ops if op['op'] == 'remove']
+    adds = [op for op in ops if op['op'] == 'add']
+    assert [len(op['items']) for op in removes] == [100, 100, 50]
+    assert [len(op['uris']) for op in adds] == [100, 100, 50]
+    assert [op['position'] for op in adds] == [50, 150, 250]
+    assert apply_ops(current, ops) == desired
+
+
+def test_removes_run_from_the_highest_positions_down():
+    current = [f"spotify:track:{i}" for i in range(250)]
+    desired = current[::2]
+
+    ops = plan_playlist_changes(current, desired)
+    positions = [max(p for item in op['items'] for p in item['positions']) for op in ops]
+    assert all(op['op'] == 'remove' for op in ops)
+    assert positions == sorted(positions, reverse=True)
+    assert apply_ops(current, ops) == desired
+
+
+def test_heavy_shuffle_is_rewritten_rather_than_moved_item_by_item():
+    current = [f"spotify:track:{i}" for i in range(50)]
+    desired = current[::-1]
+
+    ops = plan_playlist_changes(current, desired)
+    assert len(ops) <= 3
+    assert 'reorder' not in {op['op'] for op in ops}
+    assert apply_ops(current, ops) == desired
+
+
+def test_summarize_plan_counts_tracks_and_calls():
+    ops = [
+        {'op': 'remove', 'items': [{'uri': 'spotify:track:a', 'positions': [0, 4]},
+                                   {'uri': 'spotify:track:b', 'positions': [2]}]},
+        {'op': 'reorder', 'range_start': 0, 'insert_before': 5, 'range_length': 2},
+        {'op': 'add', 'position': 1, 'uris': ['spotify:track:c']}
+    ]
+    assert summarize_plan(ops) == {'removed': 3, 'moved': 2, 'added': 1, 'calls': 3}
+    assert summarize_plan([]) == {'removed': 0, 'moved': 0, 'added': 0, 'calls': 0}
+
+
+@pytest.mark.parametrize('status, message, expected', [
+    (409, "Snapshot is out of date", True),
+    (412, "", True),
+    (400, "https://api.spotify.com/v1/playlists/p/tracks:\n Could not remove tracks, please check parameters.", True),
+    (400, "Invalid snapshot id", True),
+    (400, "Invalid base62 id", False),
+    (400, "Too many ids requested", False),
+    (404, "Not found.", False),
+])
+def test_only_snapshot_conflicts_are_retried(status, message, expected):
+    assert is_edit_conflict(SimpleNamespace(http_status=status, msg=message)) == expected
+
+
+def test_stable_pairs_are_a_longest_common_subsequence():
+    rnd = random.Random(11)
+    for _ in range(1000):
+        alphabet = rnd.randrange(1, 12)
+        current = [rnd.randrange(alphabet) for _ in range(rnd.randrange(0, 30))]
+        desired = [rnd.randrange(alphabet) for _ in range(rnd.randrange(0, 30))]
+
+        pairs = sorted(match_stable_pairs(current, desired).items())
+        assert all(current[position] == desired[target] for position, target in pairs)
+        assert all(a[1] < b[1] for a, b in zip(pairs, pairs[1:]))
+        assert len(pairs) == lcs_length(current, desired)
+
+
+def test_stable_pairs_keep_shared_prefix_and_suffix():
+    current = list('abcXYdef')
+    desired = list('abcZdef')
+
+    pairs = match_stable_pairs(current, desired)
+    assert pairs == {0: 0, 1: 1, 2: 2, 5: 4, 6: 5, 7: 6}
@@ -0,0 +1,96 @@
+import random
+
+import pytest
+
+from app import (AllOf, AnyOf, FeatureRange, GenreMatch, Not, RangeMatch, TextMatch, TrackIndex, TrackTable,
+                 compile_criteria)
+
+ARTISTS = ["The Beatles", "Beatles Tribute Band", "Nina Simone", "nina", "Sigur Rós", "A-ha"]
+ALBUMS = ["Abbey Road", "Abbey Road (Remastered)", "Pastel Blues", "Ágætis byrjun", "Hunting High and Low"]
+
+
+def random_table(rnd, size):
+    tracks = []
+    for n in range(size):
+        tracks.append({
+            'uri': f"spotify:track:{n}",
+            'name': rnd.choice(["Come Together", "Sinnerman", "Take On Me", "Svefn-g-englar", None]),
+            'artists': rnd.sample(ARTISTS, rnd.randrange(0, 3)),
+            'artist_uris': [f"spotify:artist:{a}" for a in range(3)],
+            'album': rnd.choice(ALBUMS),
+            'release_date': rnd.choice([f"{rnd.randrange(1960, 2020)}-01-01", None]),
+            'duration_ms': rnd.choice([rnd.randrange(60, 600) * 1000, None]),
+            'popularity': rnd.choice([rnd.randrange(0, 101), None])
+        })
+    table = TrackTable.from_tracks(tracks)
+    table.enrichment['audio_features'] = {str(n): {'tempo': rnd.randrange(60, 180)} for n in range(0, size, 2)}
+    table.enrichment['artist_genres'] = {'0': ['indie rock'], '1': ['jazz', 'soul'], '2': []}
+    return table
+
+
+def random_query(rnd, depth=0):
+    kind = rnd.randrange(8 if depth < 3 else 5)
+    if kind == 0:
+        field = rnd.choice(['artist', 'album', 'name'])
+        mode = rnd.choice(['contains', 'exact', 'token', 'regex'])
+        pattern = rnd.choice(["beatles", "Nina", "road", "abbey road", "^a", "take", "rós", "high"])
+        return TextMatch(field, pattern, mode)
+    if kind == 1:
+        field = rnd.choice(['year', 'duration', 'popularity'])
+        low = {'year': 1950, 'duration': 0, 'popularity': 0}[field] + rnd.randrange(0, 60)
+        return RangeMatch(field, low, low + rnd.randrange(0, 60), keep_missing=rnd.random() < 0.5)
+    if kind == 2:
+        low = rnd.randrange(60, 180)
+        return FeatureRange('tempo', low, low + rnd.randrange(0, 60))
+    if kind == 3:
+        return GenreMatch(rnd.choice(["rock", "jazz", "soul", "pop"]))
+    if kind == 4:
+        return AllOf()
+    if kind == 5:
+        return AllOf(*(random_query(rnd, depth + 1) for _ in range(rnd.randrange(1, 4))))
+    if kind == 6:
+        return AnyOf(*(random_query(rnd, depth + 1) for _ in range(rnd.randrange(1, 4))))
+    return Not(random_query(rnd, depth + 1))
+
+
+def scan(query, table):
+    matches = query.predicate(table)
+    return {i for i in range(len(table)) if matches(i)}
+
+
+def test_indexed_select_matches_the_row_predicate():
+    rnd = random.Random(6)
+    for _ in range(100):
+        table = random_table(rnd, rnd.randrange(0, 80))
+        index = TrackIndex(table)
+        for _ in range(20):
+            query = random_query(rnd)
+            assert query.select(index) == scan(query, table)
+
+
+def test_compiled_criteria_select_like_they_scan():
+    table = random_table(random.Random(1), 200)
+    query = compile_criteria(
+        artist_name="beatles", year_range=(1960, 1990), duration_range=(120, 400), popularity_range=(10, 90)
+    )
+    assert query.select(TrackIndex(table)) == scan(query, table)
+    assert compile_criteria(tempo_range=(60, 100), genre='jazz').enrichments() == {'audio_features', 'artist_genres'}
+
+
+def test_operators_build_the_query_tree():
+    table = random_table(random.Random(2), 50)
+    artist, album = TextMatch('artist', "nina"), TextMatch('album', "abbey")
+    assert scan(artist & album, table) == scan(artist, table) & scan(album, table)
+    assert scan(artist | album, table) == scan(artist, table) | scan(album, table)
+    assert scan(~artist, table) == set(range(len(table))) - scan(artist, table)
+
+
+@pytest.mark.parametrize('query', [
+    lambda: TextMatch('label', "x"),
+    lambda: TextMatch('artist', "x", 'fuzzy'),
+    lambda: RangeMatch('tempo', 0, 1),
+    lambda: FeatureRange('popularity', 0, 1),
+])
+def test_unknown_fields_and_modes_are_rejected(query):
+    with pytest.raises(ValueError):
+        query()
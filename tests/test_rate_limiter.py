@@ -0,0 +1,57 @@
+import time
+
+import pytest
+
+from app import RateLimiter
+
+
+def test_slow_start_grows_the_rate_multiplicatively_up_to_max_rate():
+    limiter = RateLimiter(rate=10.0, max_rate=20.0, growth=1.5)
+    limiter.on_success()
+    assert limiter.rate == pytest.approx(15.0)
+    limiter.on_success()
+    assert limiter.rate == 20.0
+    assert limiter.slow_start
+
+
+def test_first_throttle_ends_slow_start():
+    limiter = RateLimiter(rate=40.0, max_rate=100.0, increase=2.0)
+    limiter.on_throttle(0)
+    assert not limiter.slow_start
+    assert limiter.rate == 20.0
+    assert limiter.tokens == 0
+
+    # Additive increase from here on: increase / rate per success, roughly +increase per second of calls
+    limiter.on_success()
+    assert limiter.rate == pytest.approx(20.1)
+
+
+def test_throttle_blocks_for_retry_after():
+    limiter = RateLimiter(rate=1000.0)
+    limiter.on_throttle(0.2)
+    assert limiter.acquire() >= 0.19
+    assert limiter.acquire() < 0.05
+
+
+def test_errors_back_off_exponentially_without_ending_slow_start():
+    limiter = RateLimiter(rate=1000.0, error_backoff=0.01)
+    before = time.monotonic()
+    limiter.on_error(3)
+    assert limiter.blocked_until >= before + 0.08
+    assert limiter.rate == 750.0
+    assert limiter.slow_start
+    assert limiter.acquire() >= 0.07
+
+
+def test_rate_never_drops_below_min_rate():
+    limiter = RateLimiter(rate=1.0, min_rate=0.5, error_backoff=0)
+    for _ in range(5):
+        limiter.on_throttle(0)
+        limiter.on_error()
+    assert limiter.rate == 0.5
+
+
+def test_burst_is_spent_before_waiting():
+    limiter = RateLimiter(rate=10.0, burst=3)
+    assert [limiter.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert limiter.acquire() == pytest.approx(0.1, abs=0.05)
@@ -0,0 +1,71 @@
+import random
+
+from app import PlaylistStats, TrackTable, apply_plan_to_stats, plan_playlist_changes, rebuild_table
+
+
+def track(n):
+    return {
+        'uri': f"spotify:track:{n}",
+        'name': f"Track {n}",
+        'artists': [f"Artist {n % 7}"] + ([f"Artist {n % 3}"] if n % 4 == 0 else []),
+        'album': f"Album {n % 5}",
+        'release_date': f"{1990 + n % 9}-01-01" if n % 11 else None,
+        'duration_ms': 1000 * n if n % 13 else None
+    }
+
+
+def stats_of(tracks):
+    stats = PlaylistStats()
+    stats.add(tracks)
+    return stats
+
+
+def counters(stats):
+    return stats.total_tracks, stats.total_duration, stats.artists, stats.albums, stats.years
+
+
+def test_carried_stats_match_a_recount():
+    rnd = random.Random(5)
+    for _ in range(300):
+        current = [rnd.randrange(30) for _ in range(rnd.randrange(0, 40))]
+        # Drops, extra copies and a shuffle, all of tracks the table already holds
+        desired = [n for n in current if rnd.random() < 0.8]
+        desired += [rnd.choice(current) for _ in range(rnd.randrange(0, 3))] if current else []
+        rnd.shuffle(desired)
+
+        tracks = TrackTable.from_tracks(track(n) for n in current)
+        uris = [f"spotify:track:{n}" for n in desired]
+        ops = plan_playlist_changes(tracks.uris, uris)
+
+        stats = stats_of(tracks)
+        assert apply_plan_to_stats(stats, tracks, ops)
+        assert counters(stats) == counters(stats_of(rebuild_table(tracks, uris)))
+
+
+def test_added_tracks_are_counted_from_the_new_contents():
+    tracks = TrackTable.from_tracks(track(n) for n in range(10))
+    donor = TrackTable.from_tracks(track(n) for n in range(100, 104))
+    uris = tracks.uris[2:] + donor.uris
+    ops = plan_playlist_changes(tracks.uris, uris)
+
+    stats = stats_of(tracks)
+    assert not apply_plan_to_stats(stats_of(tracks), tracks, ops)
+
+    new_tracks = rebuild_table(tracks, uris, [donor])
+    assert new_tracks.uris == uris
+    assert apply_plan_to_stats(stats, tracks, ops, new_tracks)
+    assert counters(stats) == counters(stats_of(new_tracks))
+
+
+def test_reorders_leave_stats_unchanged():
+    tracks = TrackTable.from_tracks(track(n) for n in range(20))
+    ops = plan_playlist_changes(tracks.uris, tracks.uris[::-1])
+
+    stats = stats_of(tracks)
+    assert apply_plan_to_stats(stats, tracks, ops)
+    assert counters(stats) == counters(stats_of(tracks))
+
+
+def test_stats_survive_a_json_round_trip():
+    stats = stats_of(TrackTable.from_tracks(track(n) for n in range(50)))
+    assert counters(PlaylistStats.from_json(stats.to_json())) == counters(stats)
@@ -0,0 +1,90 @@
+import random
+
+import pytest
+
+from app import TrackCache, TrackTable, plan_playlist_changes, spread_plan
+
+
+def track(uri):
+    return {
+        'uri': uri,
+        'name': f"Name of {uri}",
+        'artists': [f"Artist of {uri}"],
+        'artist_uris': [f"spotify:artist:{uri[-1]}"],
+        'album': "Album",
+        'release_date': "2001-02-03",
+        'duration_ms': 1000,
+        'popularity': 50,
+        'external_urls': {'spotify': f"https://open.spotify.com/track/{uri[-1]}"},
+        'isrc': None
+    }
+
+
+def rows(tracks):
+    return [dict(row) for row in tracks]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return TrackCache(str(tmp_path / 'cache.sqlite'))
+
+
+def test_store_and_load_round_trip(cache):
+    tracks = TrackTable.from_tracks(track(f"spotify:track:{i}") for i in range(5))
+    cache.store('p', 'snap', tracks, ['uri', 'name'])
+
+    assert rows(cache.load('p')) == rows(tracks)
+    assert cache.get_snapshot('p') == 'snap'
+    assert cache.get_fields('p') == {'uri', 'name'}
+
+
+def test_apply_edit_matches_the_new_contents(cache):
+    rnd = random.Random(2)
+    for _ in range(300):
+        current = [f"spotify:track:{rnd.randrange(25)}" for _ in range(rnd.randrange(0, 40))]
+        desired = [uri for uri in current if rnd.random() < 0.85]
+        desired += [f"spotify:track:{rnd.randrange(35)}" for _ in range(rnd.randrange(0, 4))]
+        if rnd.random() < 0.3:
+            rnd.shuffle(desired)
+
+        tracks = TrackTable.from_tracks(track(uri) for uri in current)
+        new_tracks = TrackTable.from_tracks(track(uri) for uri in desired)
+        ops = plan_playlist_changes(current, desired, rnd.choice([1, 3, 100]))
+
+        cache.store('p', 'old', tracks, ['uri', 'name'])
+        cache.apply_edit('p', 'old', 'new', tracks, new_tracks, ops)
+        assert rows(cache.load('p')) == rows(new_tracks)
+        assert cache.get_snapshot('p') == 'new'
+        assert cache.get_fields('p') == {'uri', 'name'}
+
+
+def test_unavailable_items_keep_their_positions(cache):
+    rnd = random.Random(4)
+    for _ in range(200):
+        items = [None if rnd.random() < 0.2 else f"spotify:track:{rnd.randrange(25)}" for _ in range(rnd.randrange(0, 30))]
+        current = [uri for uri in items if uri is not None]
+        desired = [uri for uri in current if rnd.random() < 0.85] + ['spotify:track:x'] * rnd.randrange(0, 3)
+        if rnd.random() < 0.3:
+            rnd.shuffle(desired)
+
+        tracks = TrackTable.from_tracks(track(uri) for uri in current)
+        tracks.gaps = [i for i, uri in enumerate(items) if uri is None]
+        new_tracks = TrackTable.from_tracks(track(uri) for uri in desired)
+        sent, new_tracks.gaps = spread_plan(plan_playlist_changes(current, desired), len(current), tracks.gaps)
+
+        cache.store('p', 'old', tracks, ['uri', 'name'])
+        assert cache.load('p').gaps == tracks.gaps
+        cache.apply_edit('p', 'old', 'new', tracks, new_tracks, sent)
+        loaded = cache.load('p')
+        assert rows(loaded) == rows(new_tracks)
+        assert loaded.gaps == new_tracks.gaps
+
+
+def test_apply_edit_replaces_rows_cached_for_another_snapshot(cache):
+    tracks = TrackTable.from_tracks(track(f"spotify:track:{i}") for i in range(5))
+    new_tracks = TrackTable.from_tracks(track(f"spotify:track:{i}") for i in range(1, 5))
+    cache.store('p', 'elsewhere', TrackTable.from_tracks([track('spotify:track:9')]), ['uri'])
+
+    cache.apply_edit('p', 'old', 'new', tracks, new_tracks, plan_playlist_changes(tracks.uris, new_tracks.uris))
+    assert rows(cache.load('p')) == rows(new_tracks)
+    assert cache.get_snapshot('p') == 'new'